@@ -1,95 +1,135 @@
-from collections import defaultdict
+from concurrent.futures import Future
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
 from PIL import Image, ImageTk
-import tifffile as tiff
 import tkinter as tk
 import tkinter.font as tkFont
 import threading
+import time
 import queue
 
 from instr.Mark102 import Mark102
 from instr.CS505MU import CS505MU
 from instr.SHOT702 import SHOT702
+from instr.frame import Frame
+from processing.accumulator import FrameAccumulator
+from processing.angle_store import AngleStore
+from processing.frame_broker import BLOCK, LATEST, FrameBroker
+from storage.calibration import CalibrationStore
+from storage.tiff_writer import TiffWriter
 
 # Mock object for development
 # from instr_mock.mock_camera import MockCamera as CS505MU
 # from instr_mock.mock_stage import MockStage as Mark102
 # from instr_mock.mock_qwp import MockQWP as SHOT702
 
+# The intensity plot only needs the mean of the frame. 4x4 summed 12-bit pixels
+# still fit in 16 bits.
+CALC_BINNING = 4
+# Frames at the start of a recording which may be exposed with old settings
+RECORD_DISCARD = 2
+
 # TODO: 現在のステージ位置を取得して表示する。angle_now = 0 で初期化しなくていいように
 # TODO: カメラのライブビューも組み込む
 
 
-class CameraThread(threading.Thread):
-    def __init__(self, camera):
-        super(CameraThread, self).__init__()
+class SubscriberThread(threading.Thread):
+    """Consumer of the frames published by the frame broker"""
 
-        self.camera = camera
-        self.image_queue = queue.Queue(maxsize=2)
+    def __init__(self, broker: FrameBroker, name: str, policy: str):
+        super(SubscriberThread, self).__init__()
+
+        self.broker = broker
+        self.subscription = broker.subscribe(name, maxsize=2, policy=policy)
         self.angle_now = 0
 
         # Stop the thread while stages is moving
         self.is_moving = False
         self.event = threading.Event()
+        # Frames exposed before this time or counted up to stale_frames may
+        # be taken while the stage moved. The timestamps are the arrival
+        # times, so frames which waited in a buffer are found by the count.
+        self.settled_at = 0.0
+        self.stale_frames = 0
         self._stop_event = threading.Event()
 
     def stop(self):
         self._stop_event.set()
+        self.event.set()
+
+    def settle(self):
+        """The stages stopped, skip the frames which may be exposed before"""
+        self.settled_at = time.time()
+        self.stale_frames = self.broker.stale_frames()
+        self.is_moving = False
+        self.event.set()
+
+    def _next_frame(self) -> Frame:
+        """The next frame exposed after the stages settled, or None"""
+        if self.is_moving:
+            self.event.wait()
+            self.event.clear()
+            return None
+
+        try:
+            frame = self.subscription.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+        if frame.frame_count <= self.stale_frames:
+            return None
+        exposure_start = frame.timestamp - frame.exposure_time * 1e-3
+        return frame if exposure_start >= self.settled_at else None
+
+    def consume(self, frame: Frame):
+        raise NotImplementedError
 
     def run(self):
         while not self._stop_event.is_set():
-            if self.is_moving:
-                self.event.wait()
-                self.event.clear()
             try:
-                image = np.array(self.camera.capture()).astype("int16")
-                self.image_queue.put_nowait(image)
+                frame = self._next_frame()
+                if frame is not None:
+                    self.consume(frame)
             except queue.Full:
                 pass
             except Exception as error:
                 print(f"Encountered error: {error}")
                 break
 
-        print("Image acquisition has stopped")
+        self.subscription.close()
+        print("Thread stopped")
 
 
-class ImageCalcThread(threading.Thread):
-    def __init__(self, camera):
-        super(ImageCalcThread, self).__init__()
+class CameraThread(SubscriberThread):
+    """Live image"""
 
-        self.camera = camera
-        self.angle_now = 0
-        self.angle_queue = queue.Queue(maxsize=4)
-        self.intensity_queue = queue.Queue(maxsize=4)
+    def __init__(self, broker: FrameBroker):
+        super(CameraThread, self).__init__(broker, "live image", LATEST)
 
-        # Stop the thread while stages is moving
-        self.is_moving = False
-        self.event = threading.Event()
+        self.image_queue = queue.Queue(maxsize=2)
 
-        self._stop_event = threading.Event()
+    def consume(self, frame: Frame):
+        self.image_queue.put_nowait(frame.image)
 
-    def stop(self):
-        self._stop_event.set()
 
-    def run(self):
-        while not self._stop_event.is_set():
-            if self.is_moving:
-                self.event.wait()
-                self.event.clear()
-            try:
-                if self.angle_now is not None:
-                    intensity = np.mean(camera.capture())
-                    self.angle_queue.put_nowait(self.angle_now)
-                    self.intensity_queue.put_nowait(intensity)
-            except queue.Full:
-                pass
-            except Exception as error:
-                print(f"Encountered error: {error}")
-                break
+class ImageCalcThread(SubscriberThread):
+    """Average intensity plotted against the stage angle"""
 
-        print("Thread stopped")
+    def __init__(self, broker: FrameBroker):
+        super(ImageCalcThread, self).__init__(broker, "intensity", LATEST)
+
+        self.angle_queue = queue.Queue(maxsize=4)
+        self.intensity_queue = queue.Queue(maxsize=4)
+
+    def consume(self, frame: Frame):
+        if self.angle_now is None:
+            return
+
+        # Binned pixels are summed
+        intensity = np.mean(frame.image) / frame.binning ** 2
+        self.angle_queue.put_nowait(self.angle_now)
+        self.intensity_queue.put_nowait(intensity)
 
 
 class CameraFrame(tk.Frame):
@@ -123,74 +163,100 @@ class GraphFrame(tk.Frame):
         self.thread = thread
         self.fig = plt.figure(figsize=(5, 5), dpi=100)
         self.ax = self.fig.add_subplot(111)
+        self.ax.tick_params(axis="x", labelrotation=45)
 
-        self.log = defaultdict(int)
-        self.angles = []
-        self.intensities = []
+        self.store = AngleStore()
         self.angle_now = 0
+        self._drawn_angle = None
+
+        # The artists are created once and only their data is updated.
+        # Animated artists are drawn by blitting over the cached background.
+        (self.line,) = self.ax.plot([], [], "ro-", animated=True)
+        self.marker = self.ax.axvline(
+            self.angle_now, c="g", ls="dashed", lw=1, animated=True
+        )
+        self._background = None
 
         self.graph = FigureCanvasTkAgg(self.fig, master=self)
+        self.graph.mpl_connect("draw_event", self._on_draw)
+        self.fig.tight_layout()
         self.graph.draw()
         self.graph.get_tk_widget().pack()
 
         self._get_data()
 
-    def _get_data(self):
-        try:
-            angle = self.thread.angle_queue.get_nowait()
-            intensity = self.thread.intensity_queue.get_nowait()
-            self._data_compaction(angle, intensity)
-            self._sort_data()
-
-            self.ax.cla()
-            self.ax.plot(self.angles, self.intensities, "ro-")
-            self.ax.axvline(self.angle_now, c="g", ls="dashed", lw=1)
-            self.ax.tick_params(axis="x", labelrotation=45)
-            self.fig.tight_layout()
-        except queue.Empty:
-            pass
+    def _on_draw(self, event):
+        # A full redraw (resize, new axis limits) invalidates the background
+        self._background = self.graph.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
 
-        self.graph.draw()
-        self.after(exposure_time, self._get_data)
+    def _draw_artists(self):
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.marker)
 
-    def _data_compaction(self, angle, intensity):
-        if angle not in self.angles:
-            self.angles.append(angle)
-            self.intensities.append(intensity)
+    def _pull_data(self) -> bool:
+        """Add every queued point to the store. Returns True if any arrived."""
+        updated = False
+        while True:
+            try:
+                angle = self.thread.angle_queue.get_nowait()
+                intensity = self.thread.intensity_queue.get_nowait()
+            except queue.Empty:
+                return updated
+
+            self.store.add(angle, intensity)
+            updated = True
+
+    def _redraw(self):
+        self.line.set_data(self.store.angles, self.store.means)
+        self.marker.set_xdata([self.angle_now, self.angle_now])
+        self._drawn_angle = self.angle_now
+
+        limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        self.ax.relim()
+        self.ax.autoscale_view()
+        rescaled = limits != (self.ax.get_xlim(), self.ax.get_ylim())
+
+        if self._background is None or rescaled:
+            # The ticks change, so the whole figure is drawn (and _on_draw
+            # caches the new background)
+            self.graph.draw_idle()
         else:
-            num_angle = self.log[angle]
-            idx = self.angles.index(angle)
+            self.graph.restore_region(self._background)
+            self._draw_artists()
+            self.graph.blit(self.fig.bbox)
 
-            self.intensities[idx] = (self.intensities[idx] * num_angle + intensity) / (
-                num_angle + 1
-            )
-
-        self.log[angle] += 1
+    def _get_data(self):
+        updated = self._pull_data()
+        if updated or self.angle_now != self._drawn_angle:
+            self._redraw()
 
-    def _sort_data(self):
-        idx = np.argsort(np.array(self.angles))
-        self.angles = np.array(self.angles)[idx].tolist()
-        self.intensities = np.array(self.intensities)[idx].tolist()
+        self.after(exposure_time, self._get_data)
 
     def reset_graph(self):
-        self.angles = []
-        self.intensities = []
+        self.store.clear()
+        self._redraw()
 
 
 class Popup:
-    def __init__(self):
+    def __init__(self, text: str = "Output file is saved"):
         win = tk.Toplevel()
         self.font = tkFont.Font(family="Arial", size=32)
 
-        info = tk.Label(win, text="Output file is saved", font=self.font)
+        info = tk.Label(win, text=text, font=self.font)
         info.grid(row=0, column=0, sticky=tk.NSEW, padx=100, pady=50)
         btn = tk.Button(win, text="OK", command=win.destroy, font=self.font)
         btn.grid(row=1, column=0, sticky=tk.NSEW, padx=200, pady=50)
 
 
 class App:
-    def __init__(self, camera, stage, qwp):
-        self.thread = ImageCalcThread(camera)
+    def __init__(self, camera, stage, qwp, calibration: CalibrationStore = None):
+        # The broker is the only user of the camera. The threads and the
+        # recorder subscribe to its frames.
+        self.broker = FrameBroker(camera, binning=CALC_BINNING)
+        self.thread = ImageCalcThread(self.broker)
+        self.accumulator = FrameAccumulator()
+        self.calibration = calibration
 
         self.root = tk.Tk()
         self.fig = plt.figure(figsize=(5, 5), dpi=100)
@@ -200,6 +266,9 @@ class App:
         self.stage = stage
         self.qwp = qwp
 
+        # Captured images are written in the background
+        self.writer = TiffWriter()
+
         self.font = tkFont.Font(family="Arial", size=24)
         self._configure()
 
@@ -229,6 +298,7 @@ class App:
 
         pol_setter = tk.Entry(frame, width=20, font=self.font)
         ana_setter = tk.Entry(frame, width=20, font=self.font)
+        self.ana_setter = ana_setter
         qwp_setter = tk.Entry(frame, width=20, font=self.font)
         exposure_setter = tk.Entry(frame, width=5, font=self.font)
 
@@ -297,8 +367,21 @@ class App:
             self.thread.angle_now = angle
             self.graph_area.angle_now = angle
 
-        self.thread.is_moving = False
-        self.thread.event.set()
+        self.thread.settle()
+
+        if axis == 1:
+            self.suggest_analyzer_angle(angle)
+
+    def suggest_analyzer_angle(self, polarizer_angle):
+        """Fill the analyzer entry with the crossed nicols angle from the calibration"""
+        if self.calibration is None:
+            return
+
+        # Entries of the optimizer have only the crossed nicols angle
+        params = self.calibration.interpolate(polarizer_angle, fitted=False)
+        if params is not None:
+            self.ana_setter.delete(0, tk.END)
+            self.ana_setter.insert(0, f"{params[1]:.2f}")
 
     def move_qwp(self, angle):
         self.qwp.move(angle)
@@ -314,15 +397,43 @@ class App:
         if not path.endswith(".tif") or not path.endswith(".tiff"):
             path += ".tif"
 
-        image = self.camera.multi_scan(num)
-        tiff.imsave(path, image)
-
-        Popup()
+        # The saved image needs the full frame of the camera
+        timeout = self.camera.exposure_time * 1e-3 + 10
+        with self.broker.readout(), self.broker.subscribe(
+            "recorder", maxsize=4, policy=BLOCK
+        ) as recorder:
+            self.accumulator.reset()
+            for frame in recorder.take(num, RECORD_DISCARD, timeout):
+                self.accumulator.add(frame.image)
+        image = self.accumulator.mean(dtype="int16")
+        self._confirm_save(self.writer, self.writer.write(path, image), path)
+
+    def _confirm_save(self, writer: TiffWriter, saved: Future, path: str):
+        """Tell the user once the file is on disk, without blocking the GUI"""
+        if not saved.done():
+            self.root.after(100, self._confirm_save, writer, saved, path)
+            return
+
+        error = saved.exception()
+        if error is None:
+            Popup()
+            return
+
+        print(f"Failed to save {path}: {error}")
+        # The failed writer keeps its error, so close it and start a new one
+        if self.writer is writer:
+            self.writer = TiffWriter()
+            try:
+                writer.close()
+            except RuntimeError:
+                pass
+        Popup(f"Failed to save {path}")
 
     def change_exposure_time(self, t):
-        camera.change_exposure_time(t)
+        self.camera.change_exposure_time(t)
 
     def run(self):
+        self.broker.start()
         self.thread.start()
 
         self.root.update()
@@ -331,12 +442,16 @@ class App:
 
         self.thread.stop()
         self.thread.join()
+        self.broker.stop()
+        self.writer.close()
 
 
 if __name__ == "__main__":
     exposure_time = 300
     with CS505MU(
         exposure_time=exposure_time
-    ) as camera, Mark102() as stage, SHOT702() as qwp:
-        app = App(camera=camera, stage=stage, qwp=qwp)
+    ) as camera, Mark102() as stage, SHOT702() as qwp, CalibrationStore(
+        "./outputs/calibration.db"
+    ) as calibration:
+        app = App(camera=camera, stage=stage, qwp=qwp, calibration=calibration)
         app.run()
@@ -0,0 +1,382 @@
+"""
+Benchmarks of the acquisition and analysis hot paths on the simulated bench.
+
+Every run is appended to a JSON lines history file. A result which is worse
+than the median of the previous runs on the same machine and settings by
+more than the tolerance is reported as a regression, and the script exits
+with status 1.
+
+    python benchmark.py --time-scale 1 --history ./outputs/benchmark.jsonl
+"""
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+
+from adjust_stages import GraphFrame
+from instr_mock.bench import OpticalBench
+from instr_mock.mock_camera import MockCamera
+from instr_mock.mock_stage import MockStage
+from polar_dep import Config, Sequence
+from processing.angle_store import AngleStore
+from processing.live_view import LiveViewProcessor
+from storage.tiff_writer import TiffWriter
+
+# Marks the end of a timed iterator
+_END = object()
+
+# Measurement settings of the crossed nicols scan benchmark
+SEQUENCE_CONFIG = {
+    "output_folder": None,
+    "log_folder": None,
+    "cn_info": None,
+    "polarizer": {"angle_start": 10, "angle_end": 10, "step": 10},
+    "analyzer": {"angle": 3.15},
+    "camera": {"scan_time": 300, "intensity": 3000, "roi": [500, 1000, 1000, 1500]},
+    "capture": {"scan_num": 4, "domain_capture_num": 16},
+}
+
+
+class Stopwatch:
+    """Seconds spent in named sections, accumulated over calls"""
+
+    def __init__(self):
+        self.seconds: dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def section(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def wrap(self, name: str, func):
+        def timed(*args, **kwargs):
+            with self.section(name):
+                return func(*args, **kwargs)
+
+        return timed
+
+    def wrap_iterator(self, name: str, func):
+        """Time every next() of the iterators returned by func"""
+
+        def timed(*args, **kwargs):
+            items = iter(func(*args, **kwargs))
+            while True:
+                with self.section(name):
+                    item = next(items, _END)
+                if item is _END:
+                    return
+                yield item
+
+        return timed
+
+
+def bench_multi_scan(bench: OpticalBench, n: int = 32, exposure_time=10) -> dict:
+    """
+    Frames per second of Sequence.multi_scan with the full sensor, and the
+    time per frame spent outside the camera (averaging). The time the
+    simulator takes to make the frames is not counted.
+    """
+    camera = MockCamera(exposure_time=exposure_time, bench=bench)
+    sequence = Sequence(Config(SEQUENCE_CONFIG), MockStage(bench=bench), camera)
+
+    watch = Stopwatch()
+    camera.stream = watch.wrap_iterator("capture", camera.stream)
+    with watch.section("total"):
+        sequence.multi_scan(n)
+
+    total = watch.seconds["total"] - camera.simulation_delay
+    compute = watch.seconds["total"] - watch.seconds["capture"]
+
+    return {"frames_per_s": n / total, "ms_per_frame_compute": compute / n * 1e3}
+
+
+def bench_crossed_nicols_scan(bench: OpticalBench, log_folder: str) -> dict:
+    """
+    Wall time of one grid crossed nicols scan split into waiting for the
+    analyzer (move), reading frames (capture), averaging them (compute) and
+    the rest, mostly the parabola fit and the scan log (fit). The time the
+    simulator takes to make the frames is not counted.
+    """
+    config = Config(dict(SEQUENCE_CONFIG, log_folder=log_folder))
+    stage = MockStage(bench=bench)
+    camera = MockCamera(bench=bench)
+    sequence = Sequence(config, stage, camera)
+    stage.move_many({1: config.angle_start, 2: sequence.scan_angles()[0]})
+
+    watch = Stopwatch()
+    stage.wait_while_busy = watch.wrap("move", stage.wait_while_busy)
+    camera.stream = watch.wrap_iterator("capture", camera.stream)
+    sequence._accumulate = watch.wrap("accumulate", sequence._accumulate)
+    sequence._roi_intensity = watch.wrap("roi", sequence._roi_intensity)
+
+    with watch.section("total"):
+        sequence.crossed_nicols_scan()
+
+    s = watch.seconds
+    compute = s["accumulate"] - s["capture"] + s["roi"]
+    capture = s["capture"] - camera.simulation_delay
+    total = s["total"] - camera.simulation_delay
+
+    return {
+        "move": s["move"],
+        "capture": capture,
+        "compute": compute,
+        "fit": total - s["move"] - capture - compute,
+        "seconds_per_step": total,
+    }
+
+
+def bench_tiff_write(folder: str, n: int = 8, compression: str = None) -> dict:
+    """Throughput of TiffWriter with full sensor int16 images"""
+    images = [
+        np.random.randint(0, 4096, (2048, 2448)).astype("int16") for _ in range(n)
+    ]
+
+    start = time.perf_counter()
+    with TiffWriter(compression=compression) as writer:
+        for i, image in enumerate(images):
+            writer.write(f"{folder}/bench_{i}.tif", image)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "images_per_s": n / elapsed,
+        "mb_per_s": sum(image.nbytes for image in images) / elapsed / 1e6,
+    }
+
+
+def bench_live_view(bench: OpticalBench, n: int = 50) -> dict:
+    """Preprocessing time of a full frame in the live view"""
+    frames = [bench.expose(100) for _ in range(4)]
+    processor = LiveViewProcessor(bit_depth=bench.bit_depth)
+
+    def ms_per_frame():
+        start = time.perf_counter()
+        for i in range(n):
+            processor.process(frames[i % len(frames)])
+        return (time.perf_counter() - start) / n * 1e3
+
+    plain = ms_per_frame()
+    processor.memorize(len(frames))
+    for frame in frames:
+        processor.process(frame)
+
+    return {"ms_per_frame": plain, "ms_per_difference_frame": ms_per_frame()}
+
+
+class HeadlessGraph:
+    """The drawing path of GraphFrame on an Agg canvas, without Tk"""
+
+    _on_draw = GraphFrame._on_draw
+    _draw_artists = GraphFrame._draw_artists
+    _redraw = GraphFrame._redraw
+    reset_graph = GraphFrame.reset_graph
+
+    def __init__(self):
+        self.fig = Figure(figsize=(5, 5), dpi=100)
+        self.ax = self.fig.add_subplot(111)
+        self.store = AngleStore()
+        self.angle_now = 0
+        self._drawn_angle = None
+
+        (self.line,) = self.ax.plot([], [], "ro-", animated=True)
+        self.marker = self.ax.axvline(
+            self.angle_now, c="g", ls="dashed", lw=1, animated=True
+        )
+        self._background = None
+
+        self.graph = FigureCanvasAgg(self.fig)
+        self.graph.mpl_connect("draw_event", self._on_draw)
+        self.graph.draw()
+
+
+def bench_graph(n: int = 200) -> dict:
+    """Time of a GraphFrame update with a new point, mostly blitted"""
+    graph = HeadlessGraph()
+    # Fix the limits so that the updates are blitted as in a long scan
+    for angle, intensity in ((0, 0), (20, 4096)):
+        graph.store.add(angle, intensity)
+    graph._redraw()
+    graph.graph.draw()
+
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for i in range(n):
+        graph.store.add(rng.uniform(0, 20), rng.uniform(0, 4096))
+        graph.angle_now = i % 20
+        graph._redraw()
+    elapsed = time.perf_counter() - start
+
+    return {"ms_per_update": elapsed / n * 1e3}
+
+
+def run(bench: OpticalBench, only: list[str] = None) -> dict:
+    """Results of every benchmark, {name: {metric: value}}"""
+    with tempfile.TemporaryDirectory() as folder:
+        benchmarks = {
+            "multi_scan": lambda: bench_multi_scan(bench),
+            "crossed_nicols_scan": lambda: bench_crossed_nicols_scan(bench, folder),
+            "tiff_write": lambda: bench_tiff_write(folder),
+            "live_view": lambda: bench_live_view(bench),
+            "graph": lambda: bench_graph(),
+        }
+
+        results = {}
+        for name, benchmark in benchmarks.items():
+            if only and name not in only:
+                continue
+            print(f"Running {name}")
+            results[name] = benchmark()
+
+        return results
+
+
+def lower_is_better(metric: str) -> bool:
+    """Rates (*_per_s) should grow, times (seconds, ms) should shrink"""
+    return not metric.endswith("_per_s")
+
+
+def noise_floor(metric: str) -> float:
+    """Changes of a time smaller than this are not regressions (timer noise)"""
+    if not lower_is_better(metric):
+        return 0.0
+
+    return 0.5 if metric.startswith("ms_") else 0.005
+
+
+def read_history(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path: str, record: dict) -> None:
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def regressions(
+    record: dict, history: list[dict], tolerance: float = 0.2, window: int = 5
+) -> list[str]:
+    """
+    Metrics of record worse than the median of the last `window` comparable
+    runs by more than tolerance (0.2: 20 %)
+    """
+    previous = [
+        r
+        for r in history
+        if r["machine"] == record["machine"] and r["settings"] == record["settings"]
+    ][-window:]
+
+    found = []
+    for name, metrics in record["results"].items():
+        for metric, value in metrics.items():
+            values = [
+                r["results"][name][metric]
+                for r in previous
+                if metric in r["results"].get(name, {})
+            ]
+            if not values:
+                continue
+
+            baseline = float(np.median(values))
+            if lower_is_better(metric):
+                worse = value > baseline * (1 + tolerance) + noise_floor(metric)
+            else:
+                worse = value < baseline * (1 - tolerance)
+            if worse:
+                found.append(f"{name}.{metric}: {value:.4g} (median {baseline:.4g})")
+
+    return found
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_record(results: dict, settings: dict) -> dict:
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "commit": _git_commit(),
+        "settings": settings,
+        "results": results,
+    }
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--history", default="./outputs/benchmark.jsonl")
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="scale of the simulated latencies, 0 to measure only the software",
+    )
+    parser.add_argument("--readout-time", type=float, default=20, help="ms")
+    parser.add_argument("--move-overhead", type=float, default=0.1, help="s")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--only", nargs="*", help="names of the benchmarks to run")
+    parser.add_argument("--no-save", action="store_true")
+
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None) -> int:
+    args = parse_args(argv)
+    settings = {
+        "time_scale": args.time_scale,
+        "readout_time": args.readout_time,
+        "move_overhead": args.move_overhead,
+    }
+    bench = OpticalBench(
+        temperature=10,
+        seed=0,
+        time_scale=args.time_scale,
+        readout_time=args.readout_time,
+        move_overhead=args.move_overhead,
+    )
+
+    record = make_record(run(bench, args.only), settings)
+    for name, metrics in record["results"].items():
+        print(name, ", ".join(f"{k}: {v:.4g}" for k, v in metrics.items()))
+
+    found = regressions(record, read_history(args.history), args.tolerance)
+    if not args.no_save:
+        append_history(args.history, record)
+
+    for regression in found:
+        print("Regression:", regression)
+
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,89 +1,130 @@
 import queue
 import threading
+import time
 
-import numpy as np
 from PIL import Image, ImageTk
 import tkinter as tk
 
 from instr.CS505MU import CS505MU
 from instr.Mark102 import Mark102
+from processing.live_view import DisplayFrame, LiveViewProcessor
+
+# The full frame is not needed to fill the 600x500 canvas. 2448x2048 pixels are
+# summed into 612x512 on the camera, which also cuts the transfer by 16 times.
+LIVE_VIEW_BINNING = 4
 
 
 class LiveViewCanvas(tk.Canvas):
-    def __init__(self, parent, image_queue, text):
+    """
+    Show the display-ready frames of ImageAcquisitionThread. All the image
+    processing is done on the acquisition thread, the Tk thread only pastes
+    the frame into the photo image.
+    """
+
+    def __init__(self, parent, image_queue, text, status=None, thread=None):
         self.image_queue = image_queue
-        self.now_img = None
-        self.image = None
-        self.crossed_nicols = None
         self.text = text
+        self.status = status  # display FPS and dropped frames
+        self.thread = thread
+        self._image: ImageTk.PhotoImage = None
+        self._shown: tuple = None  # size and mode of the photo image
+
+        self.frames_shown = 0
+        self._fps_start = time.perf_counter()
+        self._fps_frames = 0
+        self.fps = 0.0
+
         tk.Canvas.__init__(self, parent)
         self.pack()
         self._get_image()
 
-    def _get_image(self):
-        try:
-            self.image = self.image_queue.get_nowait()
-            self.resized_image = self.image.resize((600, 500), resample=Image.NEAREST)
-            self.now_img = self.resized_image
+    def _show(self, frame: DisplayFrame):
+        image = Image.fromarray(frame.image)
+        # The difference image is colored
+        shown = None if self._image is None else self._shown
+        if shown != (image.size, image.mode):
+            self._shown = (image.size, image.mode)
+            self._image = ImageTk.PhotoImage(master=self, image=image)
+            self.config(width=image.width, height=image.height)
+            self.delete("all")
+            self.create_image(0, 0, image=self._image, anchor="nw")
+        else:
+            self._image.paste(image)
 
-            if self.crossed_nicols is not None:
-                self.resized_image = Image.fromarray(
-                    np.array(self.resized_image) - np.array(self.crossed_nicols)
-                )
+        self.text.set(f"{frame.mean:.3f}")
 
-            self.text.set(f"{np.mean(np.array(self.image)):.3f}")
+    def _update_status(self):
+        now = time.perf_counter()
+        if now - self._fps_start >= 1:
+            self.fps = self._fps_frames / (now - self._fps_start)
+            self._fps_start, self._fps_frames = now, 0
 
-            self._image = ImageTk.PhotoImage(master=self, image=self.resized_image)
-            self.config(width=600, height=500)
-            self.create_image(0, 0, image=self._image, anchor="nw")
+            if self.status is not None:
+                dropped = 0 if self.thread is None else self.thread.dropped
+                self.status.set(f"{self.fps:.1f} fps, {dropped} dropped")
+
+    def _get_image(self):
+        try:
+            self._show(self.image_queue.get_nowait())
+            self.frames_shown += 1
+            self._fps_frames += 1
         except queue.Empty:
             pass
 
+        self._update_status()
         self.after(10, self._get_image)
 
-    def set_crossed_nicols(self):
-        self.crossed_nicols = self.now_img
-
-    def reset_image(self):
-        self.crossed_nicols = None
-
 
 class ImageAcquisitionThread(threading.Thread):
-    def __init__(self, camera):
+    def __init__(self, camera, binning: int = LIVE_VIEW_BINNING):
         super(ImageAcquisitionThread, self).__init__()
         self._camera = camera
         self._previous_timestamp = 0
 
         self._bit_depth = camera.bit_depth
-        self._camera.image_poll_timeout_ms = 0
+        self._binning = binning
+        self.processor = LiveViewProcessor(self._bit_depth, binning)
         self._image_queue = queue.Queue(maxsize=2)
         self._stop_event = threading.Event()
 
+        self.acquired = 0
+        # Frames replaced by a newer one before the display took them
+        self.dropped = 0
+
     def get_output_queue(self):
         return self._image_queue
 
+    def _put_latest(self, frame: DisplayFrame):
+        # Keep the newest frames so that the view is never behind the camera
+        while True:
+            try:
+                self._image_queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self._image_queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
     def stop(self):
         self._stop_event.set()
 
-    def _get_image(self) -> Image:
-        image = np.array(self._camera.capture())
-        image = image >> (self._bit_depth - 8)
-        image = Image.fromarray(image)
-
-        return image
-
     def run(self):
-        while not self._stop_event.is_set():
-            try:
-                pil_image = np.array(self._camera.capture()) >> 4
-                pil_image = Image.fromarray(pil_image)
-                self._image_queue.put_nowait(pil_image)
-            except queue.Full:
-                # No point in keeping this image around when the queue is full, let's skip to the next one
-                pass
-            except Exception as error:
-                print(f"Encountered error: {error}, image acquisition will stop.")
-                break
+        # Free-running acquisition at the sensor frame rate
+        try:
+            with self._camera.readout(binning=self._binning):
+                frames = self._camera.stream()
+                try:
+                    for image in frames:
+                        if self._stop_event.is_set():
+                            break
+                        self.acquired += 1
+                        self._put_latest(self.processor.process(image))
+                finally:
+                    frames.close()
+        except Exception as error:
+            print(f"Encountered error: {error}, image acquisition will stop.")
         print("Image acquisition has stopped")
 
 
@@ -96,12 +137,12 @@ class App:
         self.root = tk.Tk()
         self.averaged_intensity = tk.StringVar()
         self.averaged_intensity.set("0.000")
+        self.display_status = tk.StringVar()
+        self.display_status.set("0.0 fps, 0 dropped")
         self.image_acquisition_thread = ImageAcquisitionThread(self.camera)
 
         self.configure_widgets()
 
-        self.camera.frames_per_trigger_zero_for_unlimited = 0
-
     def configure_widgets(self):
         intensity_frame = self.intensity_frame()
         intensity_frame.grid(row=0, column=0, sticky=tk.W + tk.E)
@@ -111,6 +152,8 @@ class App:
             parent=camera_frame,
             image_queue=self.image_acquisition_thread.get_output_queue(),
             text=self.averaged_intensity,
+            status=self.display_status,
+            thread=self.image_acquisition_thread,
         )
         camera_frame.grid(row=1, column=0, columnspan=3)
 
@@ -133,6 +176,8 @@ class App:
         text.grid(row=0, column=0)
         label = tk.Label(frame, textvariable=self.averaged_intensity)
         label.grid(row=0, column=1)
+        status = tk.Label(frame, textvariable=self.display_status)
+        status.grid(row=0, column=2, padx=10)
 
         return frame
 
@@ -178,10 +223,10 @@ class App:
         return frame
 
     def set_crossed_nicols(self):
-        self.canvas.set_crossed_nicols()
+        self.image_acquisition_thread.processor.memorize()
 
     def reset_image(self):
-        self.canvas.reset_image()
+        self.image_acquisition_thread.processor.reset()
 
     def set_exposure_time(self):
         self.camera.change_exposure_time(int(self.exposure_time_setter.get()))
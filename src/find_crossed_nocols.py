@@ -4,24 +4,39 @@ import time
 from instr.Mark102 import Mark102
 from instr.SHOT702 import SHOT702
 from instr.CS505MU import CS505MU
+from storage.calibration import CalibrationStore
+
+
+def suggested_optimum(pol_angle, calibration: CalibrationStore = None) -> tuple[float]:
+    """
+    Suggested (analyzer, QWP) angles from the calibration entries with a QWP
+    angle. Falls back to the default angles.
+    """
+    if calibration is not None:
+        entries = [e for e in calibration.entries(fitted=False) if e["qwp"] is not None]
+        if entries:
+            nearest = min(entries, key=lambda e: abs(e["polarizer"] - pol_angle))
+            params = calibration.interpolate(
+                pol_angle, qwp=nearest["qwp"], fitted=False
+            )
+            return params[1], nearest["qwp"]
 
-
-def suggested_optimum(pol_angle) -> tuple[int]:
-    # Read yaml
     return 167, 310
 
 
 def optimize(
     suggestion_angle: int, stage, camera, threshold: float = 0.5
 ) -> tuple[int, bool]:
-    min_intensity = np.mean(np.array(camera.capture()))
+    with camera.capture() as frame:
+        min_intensity = np.mean(frame.image)
     tmp_angle = suggestion_angle
     updated = False
 
     tmp_angle += 1
     stage.move(tmp_angle, axis=2)
     time.sleep(0.5)
-    p_intensity = np.mean(np.array(camera.capture()))
+    with camera.capture() as frame:
+        p_intensity = np.mean(frame.image)
 
     if min_intensity < p_intensity - threshold:
         direction = -1
@@ -36,7 +51,8 @@ def optimize(
         tmp_angle += direction
         stage.move(tmp_angle, axis=2)
         time.sleep(0.5)
-        intensity_tmp = np.mean(np.array(camera.capture()))
+        with camera.capture() as frame:
+            intensity_tmp = np.mean(frame.image)
 
         if intensity_tmp > min_intensity - threshold:
             direction = 0
@@ -48,11 +64,15 @@ def optimize(
 
 
 def find_optimum_angle(
-    pol_angle: int, stage: Mark102, qwp: SHOT702, camera: CS505MU
+    pol_angle: int,
+    stage: Mark102,
+    qwp: SHOT702,
+    camera: CS505MU,
+    calibration: CalibrationStore = None,
 ) -> tuple[float]:
     stage.move(pol_angle, axis=1)
     time.sleep(0.5)
-    ana_tmp, qwp_tmp = suggested_optimum(pol_angle)
+    ana_tmp, qwp_tmp = suggested_optimum(pol_angle, calibration)
 
     updated = True
     while updated:
@@ -62,10 +82,17 @@ def find_optimum_angle(
         # Quarter wave plate の最適化
         qwp_tmp, updated = optimize(qwp_tmp, qwp, camera)
 
+    if calibration is not None:
+        calibration.add(pol_angle, [None, ana_tmp, None], qwp=qwp_tmp)
+
     return ana_tmp, qwp_tmp
 
 
 if __name__ == "__main__":
-    with Mark102() as stage, SHOT702() as qwp, CS505MU(exposure_time=300) as camera:
+    with Mark102() as stage, SHOT702() as qwp, CS505MU(
+        exposure_time=300
+    ) as camera, CalibrationStore("./outputs/calibration.db") as calibration:
         # Polarizer angle = 6 deg. の時を考える
-        ana_angle, qwp_angle = find_optimum_angle(6, stage, qwp, camera)
+        ana_angle, qwp_angle = find_optimum_angle(
+            6, stage, qwp, camera, calibration=calibration
+        )
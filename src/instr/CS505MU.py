@@ -1,11 +1,18 @@
-from PIL import Image
+from contextlib import contextmanager
 import os
 import time
 import numpy as np
 from tqdm import tqdm
+from typing import Iterator
 
 from thorlabs_tsi_sdk.tl_camera import TLCameraSDK
 
+from instr.frame import Frame, FramePool
+from processing.accumulator import FrameAccumulator
+
+# Extra time to wait for a frame on top of the exposure time (readout, transfer)
+POLL_MARGIN_MS = 1000
+
 
 class CS505MU:
     def __init__(
@@ -14,6 +21,8 @@ class CS505MU:
         bits: str = "64_lib",  # dll folder name
         camera_number: int = 0,
         exposure_time: int = 100,  # milliseconds
+        frames_to_buffer: int = 16,  # size of the SDK frame buffer while armed
+        frame_pool_size: int = 4,  # frames returned by capture alive at once
     ):
         """
         CCD camera of Thorlabs
@@ -42,15 +51,25 @@ class CS505MU:
         else:
             raise ValueError("No camera is found!")
 
-        # if zero, camera will self-trigger infinitely, allowing a continuous vide feed
-        self.camera.frames_per_trigger_zero_for_unlimited = 1
-        self.camera.arm(2)
+        self.frames_to_buffer = frames_to_buffer
+        self._frames_per_trigger: int = None
+        self._arm(1)
+
         self.exposure_time = exposure_time
         self.camera.exposure_time_us = int(exposure_time * 1e3)
+        self._set_poll_timeout()
 
         # self.sleeping_time = sleeping_time
         self.bit_depth = self.camera.bit_depth
 
+        # Current readout area [top, bottom, left, right] and binning
+        self._full_roi = self.camera.roi
+        self.roi: list[int] = self._sdk_to_roi(self._full_roi)
+        self.binning: int = 1
+
+        self.accumulator = FrameAccumulator()
+        self.frame_pool = FramePool(frame_pool_size)
+
     def __enter__(self):
         return self
 
@@ -72,32 +91,134 @@ class CS505MU:
         except AttributeError:
             pass
 
-    def capture(self, dispose=False) -> Image:
-        counter = 0
-        while True:
-            time.sleep(self.exposure_time / 1000)
+    def _arm(self, frames_per_trigger: int):
+        """
+        (Re-)arm the camera. frames_per_trigger = 0 makes the camera
+        self-trigger infinitely, allowing a continuous video feed.
+        """
+        if frames_per_trigger == self._frames_per_trigger:
+            return
+
+        if self.camera.is_armed:
+            self.camera.disarm()
+        self.camera.frames_per_trigger_zero_for_unlimited = frames_per_trigger
+        self.camera.arm(self.frames_to_buffer)
+        self._frames_per_trigger = frames_per_trigger
+
+    @staticmethod
+    def _sdk_to_roi(sdk_roi) -> list[int]:
+        # The SDK uses inclusive (x, y) corners
+        return [
+            sdk_roi.upper_left_y_pixels,
+            sdk_roi.lower_right_y_pixels + 1,
+            sdk_roi.upper_left_x_pixels,
+            sdk_roi.lower_right_x_pixels + 1,
+        ]
+
+    def _set_readout(self, roi: list[int], binning: int):
+        if roi is None:
+            sdk_roi = self._full_roi
+        else:
+            sdk_roi = self._full_roi._replace(
+                upper_left_x_pixels=roi[2],
+                upper_left_y_pixels=roi[0],
+                lower_right_x_pixels=roi[3] - 1,
+                lower_right_y_pixels=roi[1] - 1,
+            )
+
+        # ROI and binning can only be changed while the camera is disarmed
+        if self.camera.is_armed:
+            self.camera.disarm()
+        self._frames_per_trigger = None
+        self.camera.binx = binning
+        self.camera.biny = binning
+        self.camera.roi = sdk_roi
+        self._arm(1)
+
+        # The camera may enlarge the ROI to fit its alignment constraints
+        self.roi = self._sdk_to_roi(self.camera.roi)
+        self.binning = binning
+
+    @contextmanager
+    def readout(self, roi: list[int] = None, binning: int = 1):
+        """
+        Read out only roi = [top, bottom, left, right] of the sensor (the
+        order of the roi in the configuration file) with binning x binning
+        pixels summed on the camera. roi = None reads out the full sensor.
+        The previous readout is restored when the block exits.
+
+        The area actually read out is self.roi, which may be larger than the
+        requested one.
+        """
+        previous = (self.roi, self.binning)
+        self._set_readout(roi, binning)
+        try:
+            yield self
+        finally:
+            self._set_readout(*previous)
+
+    def _set_poll_timeout(self):
+        # get_pending_frame_or_null blocks until a frame arrives or the timeout
+        self.camera.image_poll_timeout_ms = int(self.exposure_time) + POLL_MARGIN_MS
+
+    def _wait_for_frame(self):
+        frame = self.get_pending_frame_or_null()
+        if frame is None:
+            raise TimeoutError(
+                f"No frame arrived within {self.camera.image_poll_timeout_ms} ms"
+            )
+
+        return frame
+
+    def capture(self, dispose=False) -> Frame:
+        """
+        Capture a frame. The image is copied once from the SDK buffer into
+        a pooled buffer, so release the frame (or let it be garbage
+        collected) when it is no longer needed.
+        """
+        # Discard two frames which may be exposed with the previous settings
+        self._arm(1)
+        for _ in range(3 if dispose else 1):
             self.camera.issue_software_trigger()
-            frame = self.get_pending_frame_or_null()
-            if frame is not None:
-                if dispose:
-                    if counter > 1:
-                        break
-                    counter += 1
-                else:
-                    break
+            frame = self._wait_for_frame()
 
-        image = Image.fromarray(frame.image_buffer)
+        return self.frame_pool.frame(
+            frame.image_buffer,
+            frame_count=frame.frame_count,
+            exposure_time=self.exposure_time,
+            binning=self.binning,
+        )
+
+    def stream(self, n: int = None, discard: int = 0) -> Iterator[np.ndarray]:
+        """
+        Yield frames as the SDK delivers them, at the sensor frame rate.
 
-        return image
+        If n is None the camera runs freely until the generator is closed,
+        otherwise a single trigger starts a burst of n frames. The first
+        `discard` frames are dropped. A yielded array is only valid until the
+        next frame is requested, so copy it if it has to be kept.
+        """
+        total = None if n is None else n + discard
+        self._arm(0 if total is None else total)
+
+        try:
+            self.camera.issue_software_trigger()
+            count = 0
+            while total is None or count < total:
+                frame = self._wait_for_frame()
+                count += 1
+                if count > discard:
+                    yield frame.image_buffer
+        finally:
+            self._arm(1)
 
     def multi_scan(self, n: int) -> np.ndarray:
-        image_avg = np.array(self.capture(dispose=True)).astype("float64")
+        self.accumulator.reset()
 
-        for i in tqdm(range(1, n)):
-            image = np.array(self.capture(dispose=False))
-            image_avg = (image_avg * i + image) / (i + 1)
+        for image in tqdm(self.stream(n, discard=2), total=n):
+            self.accumulator.add(image)
 
-        return image_avg.astype("int16")
+        return self.accumulator.mean(dtype="int16")
 
     def get_pending_frame_or_null(self):
         return self.camera.get_pending_frame_or_null()
@@ -108,6 +229,7 @@ class CS505MU:
         """
         self.camera.exposure_time_us = int(exposure_time * 1e3)
         self.exposure_time = int(exposure_time)
+        self._set_poll_timeout()
 
 
 if __name__ == "__main__":
@@ -115,6 +237,6 @@ if __name__ == "__main__":
     with CS505MU(exposure_time=1) as camera:
         start = time.time()
         for i in range(100):
-            image = camera.capture(dispose=False)
-            frames.append(image)
+            with camera.capture(dispose=False) as frame:
+                frames.append(frame.image.copy())
         print((time.time() - start) / 100)
@@ -1,5 +1,11 @@
 from serial import Serial
-import time
+
+from instr.serial_transport import SerialTransport
+
+
+def _echo_matches(command: str, response: str) -> bool:
+    # ITC503 echoes the command letter, or answers "?" to an invalid command
+    return response[:1] in (command[:1], "?")
 
 
 class ITC503:
@@ -7,8 +13,13 @@ class ITC503:
     Oxford instruments temperature controller
     """
 
-    def __init__(self, port: int = "COM3"):
-        self.instrument = Serial(port, 9600)
+    def __init__(self, port: int = "COM3", timeout: float = 1.0):
+        self.transport = SerialTransport(
+            Serial(port, 9600),
+            terminator=b"\r",
+            timeout=timeout,
+            match=_echo_matches,
+        )
 
     def __enter__(self):
         self._set_remote()
@@ -16,63 +27,54 @@ class ITC503:
 
     def __exit__(self, exc_type, exc_value, trace):
         self._set_local()
-        self.instrument.close()
+        self.transport.close()
+
+    def _command(self, command: str) -> str:
+        response = self.transport.query(command)
+        if response.startswith("?"):
+            raise RuntimeError(f"Invalid command: {command}")
+
+        return response
 
     def _set_local(self, locked: bool = True):
         if locked:
             # Default state
-            self.instrument.write(b"C0\r\n")
+            self._command("C0")
         else:
-            self.instrument.write(b"C2\r\n")
-
-        time.sleep(0.5)
-        self.instrument.read_all()
+            self._command("C2")
 
     def _set_remote(self, locked: bool = True):
         if locked:
             # Front panel disabled
-            self.instrument.write(b"C1\r\n")
+            self._command("C1")
         else:
             # Front panel active
-            self.instrument.write(b"C3\r\n")
-
-        time.sleep(0.5)
-        self.instrument.read_all()
+            self._command("C3")
 
     def set_heater_channel(self, ch: int):
-        self.instrument.write(f"H{ch}\r\n".encode())
-        time.sleep(0.5)
-        self.instrument.read_all()
+        self._command(f"H{ch}")
 
     def set_heater_gasflow_mode(
         self, heater_mode: str = "manual", gas_mode: str = "manual"
     ):
         if heater_mode == "manual" and gas_mode == "manual":
-            self.instrument.write(b"A0\r\n")
+            self._command("A0")
         elif heater_mode == "auto" and gas_mode == "manual":
-            self.instrument.write(b"A1\r\n")
+            self._command("A1")
         elif heater_mode == "manual" and gas_mode == "auto":
-            self.instrument.write(b"A2\r\n")
+            self._command("A2")
         elif heater_mode == "auto" and gas_mode == "auto":
-            self.instrument.write(b"A3\r\n")
+            self._command("A3")
         else:
             print("Invalid argument. Mode should be 'manual' or 'auto'")
 
-        time.sleep(0.5)
-        self.instrument.read_all()
-
     def set_temperature(self, target_temp: float):
-        self.instrument.write(f"T{target_temp}\r\n".encode())
-
-        time.sleep(0.5)
-        self.instrument.read_all()
+        self._command(f"T{target_temp}")
 
     def read_temperature(self, ch: int):
-        self.instrument.write(f"R{ch}\r\n".encode())
-        time.sleep(0.5)
-        temp = self.instrument.read_all().decode()
+        temp = self._command(f"R{ch}")
 
-        return temp[1:].replace("\r", "")
+        return temp[1:]
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import pyvisa
-import time
 
-from instr.interfaces.stage import stages
+from instr.interfaces.stage import MoveHandle, stages
+from instr.motion_model import MotionModel, MotionTracker, wait_until_idle
+from instr.sigma_koki import absolute_move_command
 
 
 class Mark102(stages):
@@ -9,8 +10,14 @@ class Mark102(stages):
     Sigma koki 2-stage controller
     """
 
-    def __init__(self, gpib: int = 8, init_position: bool = False):
+    def __init__(
+        self,
+        gpib: int = 8,
+        init_position: bool = False,
+        speed: float = 5.0,  # deg/s, initial guess for the motion time model
+    ):
         self.gpib = gpib
+        self.motion = MotionTracker(MotionModel(speed=speed))
 
         resource_manager = pyvisa.ResourceManager()
         try:
@@ -31,18 +38,35 @@ class Mark102(stages):
         print("Initialize")
         self.wait_while_busy()
         self.instrument.query("H:W")  # Initialize positions
+        self.motion.reset({1: 0, 2: 0})
+
+    def is_busy(self) -> bool:
+        busy = self.instrument.query("!:") == "B\r\n"
+        if not busy:
+            self.motion.finish()
+
+        return busy
 
     def wait_while_busy(self):
-        # If the state is "B"(Busy), wait for 1 second
-        while self.instrument.query("!:") == "B\r\n":
-            time.sleep(1)
+        # Free if the stage is already known to be stopped
+        if self.motion.moving:
+            wait_until_idle(self.is_busy, self.motion.predicted_end())
 
     def move(self, angle: int, axis: int):
-        query = f"A:{int(axis)}+P{int(angle * 1000 * 4 / 10)}"
+        self.move_async(angle, axis).wait()
 
-        self.instrument.query(query)
-        self.instrument.query("G:")  # Move
-        self.wait_while_busy()
+    def move_async(self, angle: int, axis: int) -> MoveHandle:
+        return self.move_many_async({axis: angle})
+
+    def move_many_async(self, targets: dict[int, float]) -> MoveHandle:
+        # Both axes start with a single G: and the handle waits for both
+        targets = self.motion.changed(targets)
+        if targets:
+            self.instrument.query(absolute_move_command(targets))
+            self.instrument.query("G:")  # Move
+            self.motion.start(targets)
+
+        return MoveHandle(self)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,17 @@
 from serial import Serial
-import time
 
-from interfaces.stage import stages
+from instr.interfaces.stage import MoveHandle, stages
+from instr.motion_model import MotionModel, MotionTracker, wait_until_idle
+from instr.serial_transport import SerialTransport
+from instr.sigma_koki import absolute_move_command
+
+
+def _response_matches(command: str, response: str) -> bool:
+    # "!:" answers the status (R: ready, B: busy), other commands OK or NG
+    if command == "!:":
+        return response in ("R", "B", "NG")
+
+    return response in ("OK", "NG")
 
 
 class SHOT702(stages):
@@ -11,8 +21,13 @@ class SHOT702(stages):
     This stage controller has RS232C interface to connect to the computer
     """
 
-    def __init__(self, port="COM3", init_position=False):
-        self.instrument = Serial(port, 38400)
+    def __init__(
+        self, port="COM3", init_position=False, speed: float = 5.0, timeout=1.0
+    ):
+        self.transport = SerialTransport(
+            Serial(port, 38400), timeout=timeout, match=_response_matches
+        )
+        self.motion = MotionTracker(MotionModel(speed=speed))
         if init_position:
             self.initialize()
 
@@ -20,45 +35,48 @@ class SHOT702(stages):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.instrument.close()
+        self.transport.close()
 
     def initialize(self):
         self.wait_while_busy()
-        self.instrument.write(b"H:W\r\n")
-        time.sleep(0.1)
-        self.instrument.read_all()
+        self.write_query("H:W")
+        self.motion.reset({1: 0, 2: 0})
 
-    def wait_while_busy(self):
-        while True:
-            self.instrument.write(b"!:\r\n")
-            time.sleep(0.1)
-            status = self.instrument.read_all()
+    def is_busy(self) -> bool:
+        status = self.transport.query("!:")
 
-            if status != b"B\r\n" and status != b"NG\r\n":
-                break
+        busy = status == "B" or status == "NG"
+        if not busy:
+            self.motion.finish()
 
-    def _wait_response(self):
-        while True:
-            status = self.instrument.read_all()
+        return busy
 
-            if status == b"OK\r\n":
-                break
-            elif status == b"NG\r\n":
+    def wait_while_busy(self):
+        # Free if the stage is already known to be stopped
+        if self.motion.moving:
+            wait_until_idle(self.is_busy, self.motion.predicted_end())
+
+    def write_query(self, *queries: str):
+        # Several commands are sent at once and answered in order
+        for response in self.transport.query_many(list(queries)):
+            if response == "NG":
                 raise RuntimeError("Invalid command!")
-            else:
-                time.sleep(0.2)
-
-    def write_query(self, query):
-        self.instrument.write(query)
-        self._wait_response()
 
     def move(self, angle, axis=1):
-        query = f"A:1+P{int(angle * 1000 * 4 / 10)}\r\n".encode()
+        self.move_async(angle, axis).wait()
 
-        self.wait_while_busy()
+    def move_async(self, angle, axis=1) -> MoveHandle:
+        return self.move_many_async({axis: angle})
+
+    def move_many_async(self, targets: dict[int, float]) -> MoveHandle:
+        targets = self.motion.changed(targets)
+        if targets:
+            self.wait_while_busy()
+
+            self.write_query(absolute_move_command(targets), "G:")
+            self.motion.start(targets)
 
-        self.write_query(query)
-        self.write_query(b"G:\r\n")
+        return MoveHandle(self)
 
 
 if __name__ == "__main__":
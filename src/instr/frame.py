@@ -0,0 +1,130 @@
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+
+class Frame:
+    """
+    A camera frame. image is a view of a buffer owned by a FramePool, which
+    is valid until the frame is released or garbage collected. Copy the image
+    if it has to outlive the frame.
+    """
+
+    __slots__ = (
+        "image",
+        "frame_count",
+        "timestamp",
+        "exposure_time",
+        "binning",
+        "_pool",
+    )
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        frame_count: int = 0,
+        timestamp: float = None,  # time.time() when the frame arrived
+        exposure_time: float = None,  # milliseconds
+        binning: int = 1,  # binning x binning pixels are summed
+        pool: "FramePool" = None,
+    ):
+        self.image = image
+        self.frame_count = frame_count
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.exposure_time = exposure_time
+        self.binning = binning
+        self._pool = pool
+
+    def __array__(self, dtype=None):
+        return self.image if dtype is None else self.image.astype(dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+    @property
+    def shape(self) -> tuple[int]:
+        return self.image.shape
+
+    def to_pil(self) -> Image:
+        """PIL image for the GUIs. This copies the image."""
+        return Image.fromarray(self.image)
+
+    def release(self) -> None:
+        """Return the buffer to the pool. The image must not be used afterwards."""
+        if self._pool is not None:
+            self._pool.release(self.image)
+            self._pool = None
+
+
+class FramePool:
+    """
+    Fixed number of preallocated frame buffers.
+
+    Buffers are allocated on demand up to size and recycled when their frames
+    are released. They are reallocated when the frame shape or dtype changes,
+    e.g. after the readout area of the camera is changed.
+    """
+
+    def __init__(self, size: int = 4):
+        self.size = size
+        self._shape: tuple[int] = None
+        self._dtype: np.dtype = None
+        self._free: list[np.ndarray] = []
+        self._allocated = 0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> int:
+        """Number of buffers which can be acquired without waiting for a release"""
+        with self._lock:
+            return len(self._free) + self.size - self._allocated
+
+    def acquire(self, shape: tuple[int], dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        with self._lock:
+            if shape != self._shape or dtype != self._dtype:
+                self._shape, self._dtype = shape, dtype
+                self._free.clear()
+                self._allocated = 0
+
+            if self._free:
+                return self._free.pop()
+            if self._allocated < self.size:
+                self._allocated += 1
+                return np.empty(shape, dtype=dtype)
+
+        raise RuntimeError(
+            f"All {self.size} frame buffers are in use. Release frames after use."
+        )
+
+    def release(self, buffer: np.ndarray) -> None:
+        with self._lock:
+            # Buffers of a previous shape are dropped
+            if (
+                buffer.shape == self._shape
+                and buffer.dtype == self._dtype
+                and len(self._free) < self._allocated
+            ):
+                self._free.append(buffer)
+
+    def frame(
+        self,
+        image: np.ndarray,
+        frame_count: int = 0,
+        timestamp: float = None,
+        exposure_time: float = None,
+        binning: int = 1,
+    ) -> Frame:
+        """Copy image into a pooled buffer"""
+        buffer = self.acquire(image.shape, image.dtype)
+        np.copyto(buffer, image)
+
+        return Frame(buffer, frame_count, timestamp, exposure_time, binning, pool=self)
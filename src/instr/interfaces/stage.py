@@ -1,6 +1,29 @@
 from abc import ABCMeta, abstractmethod
 
 
+class MoveHandle:
+    """
+    Handle of a move started by stages.move_async. done() polls the
+    controller once without blocking and wait() blocks until the stage stops.
+    Once the move is known to be finished, both return immediately.
+    """
+    def __init__(self, stage):
+        self._stage = stage
+        self._done = False
+
+
+    def done(self) -> bool:
+        if not self._done:
+            self._done = not self._stage.is_busy()
+        return self._done
+
+
+    def wait(self):
+        if not self._done:
+            self._stage.wait_while_busy()
+            self._done = True
+
+
 class stages(metaclass=ABCMeta):
     """
     The interface for stage controllers. This class should implement
@@ -26,6 +49,31 @@ class stages(metaclass=ABCMeta):
         raise NotImplementedError
 
 
+    @abstractmethod
+    def is_busy(self) -> bool:
+        raise NotImplementedError
+
+
     @abstractmethod
     def move(self, angle, axis):
         raise NotImplementedError
+
+
+    @abstractmethod
+    def move_async(self, angle, axis) -> MoveHandle:
+        """
+        Start moving the stage and return without waiting for it to stop
+        """
+        raise NotImplementedError
+
+
+    @abstractmethod
+    def move_many_async(self, targets: dict) -> MoveHandle:
+        """
+        Start moving several axes together. targets: {axis: angle}
+        """
+        raise NotImplementedError
+
+
+    def move_many(self, targets: dict):
+        self.move_many_async(targets).wait()
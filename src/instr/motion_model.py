@@ -0,0 +1,138 @@
+import time
+
+
+class MotionModel:
+    """
+    Per-axis model of the time a move takes,
+
+        t = overhead + distance / speed
+
+    The prior comes from the speed setting of the controller. It is replaced
+    by a least squares fit once moves of different distances are observed.
+    """
+
+    def __init__(self, speed: float = 5.0, overhead: float = 0.1):
+        # speed: deg/s, overhead: s
+        self.speed = speed
+        self.overhead = overhead
+        self._stats: dict[int, list[float]] = {}  # axis -> [n, Sx, Sy, Sxx, Sxy]
+
+    def update(self, axis: int, distance: float, elapsed: float):
+        x = abs(distance)
+        stats = self._stats.setdefault(axis, [0.0] * 5)
+        stats[0] += 1
+        stats[1] += x
+        stats[2] += elapsed
+        stats[3] += x * x
+        stats[4] += x * elapsed
+
+    def params(self, axis: int) -> tuple[float]:
+        """Return (overhead, seconds per degree) of the axis"""
+        slope = 1 / self.speed
+        if axis not in self._stats:
+            return self.overhead, slope
+
+        n, sx, sy, sxx, sxy = self._stats[axis]
+        det = n * sxx - sx * sx
+        if det > 1e-6 * max(n * sxx, 1):
+            slope = max((n * sxy - sx * sy) / det, 0)
+        # Otherwise all moves had the same distance. Keep the prior speed and
+        # fit the overhead only.
+        intercept = (sy - slope * sx) / n
+
+        return max(intercept, 0), slope
+
+    def predict(self, axis: int, distance: float) -> float:
+        overhead, slope = self.params(axis)
+
+        return overhead + slope * abs(distance)
+
+
+class MotionTracker:
+    """
+    Keep track of the commanded positions and the running move of a stage
+    controller, and feed the observed move times to a MotionModel.
+    """
+
+    def __init__(self, model: MotionModel = None):
+        self.model = model if model is not None else MotionModel()
+        self.positions: dict[int, float] = {}
+
+        # The state of the stage is unknown until the first status query
+        self.moving = True
+        self._distances: dict[int, float] = {}
+        self._start: float = None
+
+    def changed(self, targets: dict[int, float]) -> dict[int, float]:
+        """Drop the axes which are already commanded to their target"""
+        return {
+            axis: angle
+            for axis, angle in targets.items()
+            if self.positions.get(axis) != angle
+        }
+
+    def start(self, targets: dict[int, float]):
+        """Record a move to {axis: angle}"""
+        self._distances = {
+            axis: abs(angle - self.positions[axis])
+            for axis, angle in targets.items()
+            if axis in self.positions
+        }
+        self.positions.update(targets)
+        self._start = time.perf_counter()
+        self.moving = True
+
+    def reset(self, positions: dict[int, float]):
+        """The stage moves to positions with unknown timing, e.g. homing"""
+        self.positions = dict(positions)
+        self._distances = {}
+        self._start = None
+        self.moving = True
+
+    def predicted_end(self) -> float:
+        """perf_counter time when the running move should finish"""
+        if self._start is None:
+            return time.perf_counter()
+
+        predictions = [
+            self.model.predict(axis, distance)
+            for axis, distance in self._distances.items()
+        ]
+        return self._start + max(predictions, default=0)
+
+    def finish(self):
+        """Called when the controller reports that the stage is not busy"""
+        if self._start is not None and self._distances:
+            elapsed = time.perf_counter() - self._start
+            # The slowest axis determines when the move finishes
+            axis = max(
+                self._distances,
+                key=lambda a: self.model.predict(a, self._distances[a]),
+            )
+            self.model.update(axis, self._distances[axis], elapsed)
+
+        self._distances = {}
+        self._start = None
+        self.moving = False
+
+
+def wait_until_idle(
+    is_busy,
+    predicted_end: float,
+    min_interval: float = 0.02,
+    max_interval: float = 1.0,
+    backoff: float = 1.5,
+    lead: float = 0.9,
+):
+    """
+    Sleep until shortly before the predicted end of a move and then poll
+    is_busy() with exponentially growing intervals.
+    """
+    remaining = predicted_end - time.perf_counter()
+    if remaining > 0:
+        time.sleep(remaining * lead)
+
+    interval = min_interval
+    while is_busy():
+        time.sleep(interval)
+        interval = min(interval * backoff, max_interval)
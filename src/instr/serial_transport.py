@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class SerialTransport:
+    """
+    Line oriented request/response transport for RS232C instruments.
+
+    A response is read up to the terminator, so a query returns as soon as
+    the instrument answers instead of after a fixed sleep. match(command,
+    response) tells which line answers which command. Lines which do not
+    match, e.g. the late answer to a timed out command, are skipped.
+    """
+
+    def __init__(
+        self,
+        serial,  # an opened serial.Serial
+        terminator: bytes = b"\r\n",  # end of a response
+        write_terminator: bytes = b"\r\n",  # end of a command
+        timeout: float = 1.0,  # default response timeout in seconds
+        match=None,  # match(command, response) -> bool
+    ):
+        self.serial = serial
+        self.terminator = terminator
+        self.write_terminator = write_terminator
+        self.timeout = timeout
+        self.match = match
+
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.serial.close()
+
+    def readline(self, timeout: float = None) -> str:
+        """Read one response line without the terminator"""
+        timeout = self.timeout if timeout is None else timeout
+        if self.serial.timeout != timeout:
+            self.serial.timeout = timeout
+
+        data = self.serial.read_until(self.terminator)
+        if not data.endswith(self.terminator):
+            raise TimeoutError(f"Incomplete response {data!r}")
+
+        return data[: -len(self.terminator)].decode()
+
+    def _read_response(self, command: str, timeout: float) -> str:
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"No response to {command!r}")
+
+            response = self.readline(remaining)
+            if self.match is None or self.match(command, response):
+                return response
+
+    def query(self, command: str, timeout: float = None) -> str:
+        return self.query_many([command], timeout)[0]
+
+    def query_many(self, commands: list[str], timeout: float = None) -> list[str]:
+        """
+        Send all commands at once and read their responses in order
+        (pipelining). timeout applies to each response.
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._lock:
+            # Drop stale bytes from an earlier timed out query
+            self.serial.reset_input_buffer()
+            for command in commands:
+                self.serial.write(command.encode() + self.write_terminator)
+
+            return [self._read_response(command, timeout) for command in commands]
@@ -0,0 +1,29 @@
+"""
+Command helpers shared by the Sigma Koki stage controllers (Mark-102, SHOT-702)
+"""
+
+
+def to_pulses(angle: float) -> int:
+    return int(angle * 1000 * 4 / 10)
+
+
+def _position(angle: float) -> str:
+    pulses = to_pulses(angle)
+    sign = "+" if pulses >= 0 else "-"
+
+    return f"{sign}P{abs(pulses)}"
+
+
+def absolute_move_command(targets: dict[int, float]) -> str:
+    """
+    A: command setting the absolute targets {axis: angle}. Two axes are set
+    with a single A:W command so that one G: starts them together.
+    """
+    if len(targets) == 1:
+        ((axis, angle),) = targets.items()
+        return f"A:{int(axis)}{_position(angle)}"
+
+    if set(targets) != {1, 2}:
+        raise ValueError(f"Invalid axes: {list(targets)}. Axis should be 1 or 2")
+
+    return f"A:W{_position(targets[1])}{_position(targets[2])}"
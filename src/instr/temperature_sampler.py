@@ -0,0 +1,215 @@
+import threading
+import time
+
+import numpy as np
+
+
+class TemperatureLog:
+    """
+    Thread-safe ring buffer of timestamped temperature readings
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._times = np.zeros(capacity)
+        self._values = np.zeros(capacity)
+        self._count = 0  # number of readings ever appended
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, timestamp: float, value: float):
+        with self._lock:
+            idx = self._count % self.capacity
+            self._times[idx] = timestamp
+            self._values[idx] = value
+            self._count += 1
+
+    def _index(self, i: int) -> int:
+        # Physical index of the i-th oldest reading in the buffer
+        return (self._count - len(self) + i) % self.capacity
+
+    def latest(self) -> tuple[float]:
+        """(timestamp, temperature) of the newest reading"""
+        with self._lock:
+            if self._count == 0:
+                raise ValueError("No temperature has been read yet")
+            idx = (self._count - 1) % self.capacity
+
+            return float(self._times[idx]), float(self._values[idx])
+
+    def at(self, timestamp: float) -> float:
+        """
+        Temperature at timestamp, linearly interpolated between the two
+        neighbouring readings. Outside the buffer the edge value is used.
+        """
+        with self._lock:
+            n = len(self)
+            if n == 0:
+                raise ValueError("No temperature has been read yet")
+
+            # Binary search for the first reading later than timestamp
+            lo, hi = 0, n
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._times[self._index(mid)] <= timestamp:
+                    lo = mid + 1
+                else:
+                    hi = mid
+
+            if lo == 0:
+                return float(self._values[self._index(0)])
+            if lo == n:
+                return float(self._values[self._index(n - 1)])
+
+            t0, t1 = self._times[self._index(lo - 1)], self._times[self._index(lo)]
+            v0, v1 = self._values[self._index(lo - 1)], self._values[self._index(lo)]
+
+            return float(v0 + (v1 - v0) * (timestamp - t0) / (t1 - t0))
+
+    def snapshot(self) -> tuple[np.ndarray]:
+        """Copies of (timestamps, temperatures) from the oldest reading"""
+        with self._lock:
+            idx = [self._index(i) for i in range(len(self))]
+
+            return self._times[idx], self._values[idx]
+
+
+class SettlingCriteria:
+    """
+    The temperature is settled when, over the last `window` seconds, every
+    reading is within `tolerance` K of the setpoint and the fitted slope is
+    below `max_rate` K/min.
+    """
+
+    def __init__(
+        self, tolerance: float = 0.1, max_rate: float = 0.05, window: float = 60
+    ):
+        self.tolerance = tolerance
+        self.max_rate = max_rate
+        self.window = window
+
+    def rate(self, times: np.ndarray, temperatures: np.ndarray) -> float:
+        """Least squares dT/dt in K/min"""
+        t = times - times.mean()
+        return float(np.dot(t, temperatures - temperatures.mean()) / np.dot(t, t)) * 60
+
+    def settled(
+        self,
+        times: np.ndarray,
+        temperatures: np.ndarray,
+        setpoint: float,
+        now: float = None,
+    ) -> bool:
+        now = time.time() if now is None else now
+        # The readings have to cover the whole window
+        if len(times) < 3 or times[0] > now - self.window:
+            return False
+
+        recent = times >= now - self.window
+        times, temperatures = times[recent], temperatures[recent]
+        if len(times) < 3:
+            return False
+
+        deviation = np.max(np.abs(temperatures - setpoint))
+        rate = self.rate(times, temperatures)
+
+        return deviation <= self.tolerance and abs(rate) <= self.max_rate
+
+
+class TemperatureSampler:
+    """
+    Read a temperature controller on a background thread.
+
+    read() is called every `interval` seconds and the result is stored in a
+    TemperatureLog with the midpoint of the query as its timestamp
+    (time.time()). latest() and at() never touch the instrument, so they can
+    be called from the acquisition path.
+    """
+
+    def __init__(self, read, interval: float = 0.5, capacity: int = 4096):
+        self.read = read
+        self.interval = interval
+        self.log = TemperatureLog(capacity)
+        self.errors = 0
+        self.last_error: Exception = None
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        before = time.time()
+        value = float(self.read())
+        after = time.time()
+        self.log.append((before + after) / 2, value)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as error:
+                # Keep sampling. A single failed query should not stop the log
+                self.errors += 1
+                self.last_error = error
+            self._stop_event.wait(self.interval)
+
+    def wait_for_reading(self, timeout: float = 10):
+        deadline = time.time() + timeout
+        while len(self.log) == 0:
+            if time.time() > deadline:
+                raise TimeoutError("No temperature reading") from self.last_error
+            time.sleep(0.01)
+
+    def latest(self) -> float:
+        return self.log.latest()[1]
+
+    def wait_until_settled(
+        self,
+        setpoint: float,
+        criteria: SettlingCriteria = None,
+        timeout: float = None,
+    ) -> float:
+        """
+        Block until the sampled temperature is settled at setpoint and return
+        the time it took. The log is checked at every new reading.
+        """
+        criteria = SettlingCriteria() if criteria is None else criteria
+        start = time.time()
+        while not criteria.settled(*self.log.snapshot(), setpoint):
+            if timeout is not None and time.time() - start > timeout:
+                raise TimeoutError(f"Temperature did not settle at {setpoint} K")
+            time.sleep(self.interval)
+
+        return time.time() - start
+
+    def at(self, timestamp: float) -> float:
+        return self.log.at(timestamp)
+
+
+def itc503_reader(controller, ch: int = 1):
+    """Reader of TemperatureSampler for ITC503"""
+    return lambda: float(controller.read_temperature(ch))
+
+
+def lakeshore_reader(instrument, channel: str = "A"):
+    """Reader of TemperatureSampler for a Lakeshore controller opened by pyvisa"""
+    return lambda: float(instrument.query(f"KRDG?{channel}").strip())
@@ -0,0 +1,313 @@
+"""
+Simulated optical bench shared by the mock instruments.
+
+The light goes through the polarizer (Mark102 axis 1), is reflected by the
+sample, which rotates the polarization by +/- the Kerr angle depending on
+the magnetic domain, passes the quarter wave plate (SHOT702 axis 1) and the
+analyzer (Mark102 axis 2) and reaches the camera. The mocks of the same
+bench see each other's stage angles and temperature, so a crossed nicols
+scan or an auto-exposure finds the same minimum as on the real setup.
+"""
+import threading
+import time
+
+import numpy as np
+
+SENSOR_SHAPE = (2048, 2448)
+# Margin of the precomputed noise field, every frame uses a random window
+NOISE_MARGIN = 64
+
+
+class SimulatedAxis:
+    """
+    Stage axis which starts after a fixed overhead and travels at a constant
+    speed. Frames exposed during the move see the intermediate angles.
+    """
+
+    def __init__(self, speed: float = 5.0, overhead: float = 0.1):
+        self.speed = speed  # deg/s
+        self.overhead = overhead  # s
+        self._start = 0.0
+        self._target = 0.0
+        self._departure = 0.0
+        self._arrival = 0.0
+
+    def move(self, target: float, now: float, time_scale: float = 1.0):
+        self._start = self.position(now)
+        self._target = target
+        self._departure = now + self.overhead * time_scale
+        travel = abs(target - self._start) / self.speed * time_scale
+        self._arrival = self._departure + travel
+
+    def position(self, now: float) -> float:
+        if now >= self._arrival:
+            return self._target
+        if now <= self._departure:
+            return self._start
+
+        fraction = (now - self._departure) / (self._arrival - self._departure)
+
+        return self._start + (self._target - self._start) * fraction
+
+    def end(self) -> float:
+        return self._arrival
+
+    def busy(self, now: float) -> bool:
+        return now < self._arrival
+
+
+def domain_pattern(
+    shape: tuple[int] = SENSOR_SHAPE, period: float = 120, waves: int = 6, seed=0
+) -> np.ndarray:
+    """
+    Labyrinth-like domain pattern of +1/-1 made of plane waves with the same
+    wavelength `period` pixels in random directions
+    """
+    rng = np.random.default_rng(seed)
+    y = np.arange(shape[0], dtype="float32")[:, None]
+    x = np.arange(shape[1], dtype="float32")[None, :]
+
+    field = np.zeros(shape, dtype="float32")
+    k = 2 * np.pi / period
+    for direction, phase in zip(rng.uniform(0, np.pi, waves), rng.uniform(0, 7, waves)):
+        field += np.cos(k * (np.cos(direction) * x + np.sin(direction) * y) + phase)
+
+    return np.where(field >= 0, 1, -1).astype("int8")
+
+
+def illumination(shape: tuple[int] = SENSOR_SHAPE, falloff: float = 0.3) -> np.ndarray:
+    """Gaussian vignetting, 1 at the center and 1 - falloff at the corners"""
+    y = np.linspace(-1, 1, shape[0], dtype="float32")[:, None]
+    x = np.linspace(-1, 1, shape[1], dtype="float32")[None, :]
+
+    return np.exp(np.log(1 - falloff) * (x ** 2 + y ** 2) / 2).astype("float32")
+
+
+def _quarter_wave_plate(angle: float) -> np.ndarray:
+    """Jones matrix of a quarter wave plate with the fast axis at angle"""
+    c, s = np.cos(angle), np.sin(angle)
+    rotation = np.array([[c, -s], [s, c]])
+
+    return rotation @ np.diag([1, 1j]) @ rotation.T
+
+
+class OpticalBench:
+    """
+    State of the simulated setup: stage axes, sample temperature and the
+    camera sensor model.
+
+    Intensity of a pixel in counts/ms is
+
+        flux * illumination * (|analyzer . QWP . (1, +/-kerr)|^2 + extinction)
+
+    in the frame of the incident polarization, where the complex Kerr angle
+    kerr_angle + i kerr_ellipticity is scaled by sqrt(1 - T / tc) below tc.
+    The QWP turns the ellipticity into a rotation when its fast axis is
+    parallel to the polarization (0 deg). The analyzer is crossed at
+    analyzer_offset - polarizer deg of the stages as in polar_dep.
+
+    Latencies (moves, exposure, readout) and the thermal time constant are
+    multiplied by time_scale, so 0 runs the simulation without sleeping and
+    the temperature jumps to the setpoint.
+
+    The noise of a frame is a random window of a gaussian field made once,
+    and the mean and sigma images are kept while the stages, the exposure
+    and the temperature do not change, so a full frame is made faster than
+    the modelled readout.
+    """
+
+    def __init__(
+        self,
+        flux: float = 1000,  # counts/ms at full transmission
+        extinction: float = 1e-4,
+        kerr_angle: float = 0.5,  # deg at 0 K
+        kerr_ellipticity: float = 0.2,  # deg at 0 K
+        tc: float = 29,  # K
+        analyzer_offset: float = 173,  # deg
+        dark_level: float = 10,  # counts
+        read_noise: float = 5,  # counts rms
+        gain: float = 1,  # counts per photoelectron
+        bit_depth: int = 12,
+        readout_time: float = 20,  # ms for the full sensor
+        move_overhead: float = 0.1,  # s before a stage starts moving
+        time_scale: float = 1.0,
+        temperature: float = 300,  # K
+        thermal_time_constant: float = 60,  # s
+        seed=None,
+    ):
+        self.flux = flux
+        self.extinction = extinction
+        self.kerr_angle = kerr_angle
+        self.kerr_ellipticity = kerr_ellipticity
+        self.tc = tc
+        self.analyzer_offset = analyzer_offset
+        self.dark_level = dark_level
+        self.read_noise = read_noise
+        self.gain = gain
+        self.bit_depth = bit_depth
+        self.readout_time = readout_time
+        self.move_overhead = move_overhead
+        self.time_scale = time_scale
+        self.thermal_time_constant = thermal_time_constant
+
+        self.axes: dict[str, SimulatedAxis] = {}
+        self.domains = domain_pattern()
+        self.illumination = illumination()
+        self._up_illumination = np.where(self.domains > 0, self.illumination, 0)
+        self.rng = np.random.default_rng(seed)
+        self._noise: np.ndarray = None
+        self._noise_max = 0.0
+        # Parameters, mean + 0.5, sigma and whether the frame must be clipped
+        self._expected: tuple = (None, None, None, True)
+
+        self._temperature = temperature
+        self._setpoint = temperature
+        self._temperature_at = time.time()
+        self._lock = threading.Lock()
+
+    def axis(self, name: str) -> SimulatedAxis:
+        """Axis of the bench, created on first use"""
+        with self._lock:
+            if name not in self.axes:
+                self.axes[name] = SimulatedAxis(overhead=self.move_overhead)
+
+            return self.axes[name]
+
+    def angle(self, name: str, now: float = None) -> float:
+        now = time.time() if now is None else now
+        return self.axis(name).position(now)
+
+    def sleep(self, seconds: float):
+        if seconds * self.time_scale > 0:
+            time.sleep(seconds * self.time_scale)
+
+    # Temperature
+    def set_temperature(self, setpoint: float):
+        with self._lock:
+            self._update_temperature()
+            self._setpoint = setpoint
+
+    def _update_temperature(self):
+        # First order lag towards the setpoint
+        now = time.time()
+        time_constant = self.thermal_time_constant * self.time_scale
+        if time_constant > 0:
+            decay = np.exp(-(now - self._temperature_at) / time_constant)
+        else:
+            decay = 0.0
+        self._temperature = (
+            self._setpoint + (self._temperature - self._setpoint) * decay
+        )
+        self._temperature_at = now
+
+    @property
+    def temperature(self) -> float:
+        with self._lock:
+            self._update_temperature()
+            return self._temperature
+
+    def magnetization(self) -> float:
+        """Mean field magnetization of the domains, 1 at 0 K and 0 above tc"""
+        reduced = 1 - self.temperature / self.tc
+        return float(np.sqrt(reduced)) if reduced > 0 else 0.0
+
+    # Optics
+    def transmission(self, now: float = None) -> tuple[float]:
+        """Transmission of the up (+1) and down (-1) domains"""
+        now = time.time() if now is None else now
+        # Angles from the polarization of the incident light. The polarizer
+        # is mounted the other way round from the analyzer.
+        polarizer = self.angle("polarizer", now)
+        analyzer = self.angle("analyzer", now) + polarizer - self.analyzer_offset
+        analyzer = np.radians(analyzer + 90)
+        plate = _quarter_wave_plate(np.radians(self.angle("qwp", now)))
+
+        # Small complex Kerr angle: rotation + i ellipticity
+        kerr = (self.kerr_angle + 1j * self.kerr_ellipticity) * np.pi / 180
+        kerr *= self.magnetization()
+        projection = np.array([np.cos(analyzer), np.sin(analyzer)])
+
+        return tuple(
+            float(abs(projection @ plate @ np.array([1, sign * kerr])) ** 2)
+            + self.extinction
+            for sign in (1, -1)
+        )
+
+    def expose(
+        self, exposure_time: float, roi: list[int] = None, now: float = None
+    ) -> np.ndarray:
+        """
+        Noisy sensor image of roi = [top, bottom, left, right] exposed for
+        exposure_time ms at the stage angles of time now
+        """
+        roi = tuple(roi or [0, SENSOR_SHAPE[0], 0, SENSOR_SHAPE[1]])
+        if self._noise is None:
+            shape = (SENSOR_SHAPE[0] + NOISE_MARGIN, SENSOR_SHAPE[1] + NOISE_MARGIN)
+            self._noise = self.rng.standard_normal(shape, dtype="float32")
+            self._noise_max = float(np.abs(self._noise).max())
+
+        mean, sigma, clip = self._expected_image(exposure_time, roi, now)
+        dy, dx = self.rng.integers(0, NOISE_MARGIN + 1, 2)
+        h, w = mean.shape
+        noise = self._noise[dy : dy + h, dx : dx + w]
+
+        # In blocks of rows which stay in the CPU cache
+        image = np.empty((h, w), dtype="uint16")
+        block = np.empty((min(h, 32), w), dtype="float32")
+        for top in range(0, h, len(block)):
+            rows = slice(top, top + len(block))
+            buffer = block[: min(len(block), h - top)]
+            np.multiply(noise[rows], sigma[rows], out=buffer)
+            buffer += mean[rows]
+            if clip:
+                np.clip(buffer, 0, 2 ** self.bit_depth - 1, out=buffer)
+            # mean has + 0.5, so the truncation rounds
+            np.copyto(image[rows], buffer, casting="unsafe")
+
+        return image
+
+    def _expected_image(self, exposure_time: float, roi: tuple, now: float):
+        """Mean + 0.5 and sigma of the frame, and whether it must be clipped"""
+        up, down = self.transmission(now)
+        key = (up, down, exposure_time, roi, self.flux, self.gain, self.dark_level)
+        key += (self.read_noise, self.bit_depth)
+        if self._expected[0] == key:
+            return self._expected[1:]
+
+        # illumination * (down + (up - down) * [domain is up])
+        top, bottom, left, right = roi
+        scale = self.flux * exposure_time / self.gain
+        electrons = self.illumination[top:bottom, left:right] * np.float32(down * scale)
+        electrons += self._up_illumination[top:bottom, left:right] * np.float32(
+            (up - down) * scale
+        )
+
+        # Shot noise and read noise approximated by a single gaussian
+        sigma = np.sqrt(electrons * self.gain ** 2 + self.read_noise ** 2)
+        mean = electrons * self.gain + np.float32(self.dark_level + 0.5)
+
+        # No clipping when even the largest noise stays in the range
+        spread = sigma * np.float32(self._noise_max)
+        clip = bool(
+            (mean - spread).min() < 0 or (mean + spread).max() > 2 ** self.bit_depth - 1
+        )
+
+        self._expected = (key, mean, sigma, clip)
+        return mean, sigma, clip
+
+    def readout_latency(self, roi: list[int] = None) -> float:
+        """Readout time in ms, proportional to the number of rows"""
+        rows = SENSOR_SHAPE[0] if roi is None else roi[1] - roi[0]
+        return self.readout_time * rows / SENSOR_SHAPE[0]
+
+
+_default_bench: OpticalBench = None
+
+
+def default_bench() -> OpticalBench:
+    """Bench shared by the mocks created without an explicit bench"""
+    global _default_bench
+    if _default_bench is None:
+        _default_bench = OpticalBench()
+
+    return _default_bench
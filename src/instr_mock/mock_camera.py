@@ -1,11 +1,46 @@
-from PIL import Image
+from contextlib import contextmanager
 import numpy as np
 import time
+from typing import Iterator
+
+from instr.frame import Frame
+from instr_mock.bench import SENSOR_SHAPE, OpticalBench, default_bench
+from processing.accumulator import FrameAccumulator
+from processing.crossed_nicols import bin_image
+
+
+def _sleep_until(moment: float):
+    remaining = moment - time.time()
+    if remaining > 0:
+        time.sleep(remaining)
 
 
 class MockCamera:
-    def __init__(self, exposure_time: int):
+    """
+    CS505MU on the simulated optical bench. Frames follow the stage angles
+    and the temperature of the bench at the middle of the exposure.
+    """
+
+    def __init__(
+        self,
+        dll_path: str = "../../dlls",
+        bits: str = "64_lib",
+        camera_number: int = 0,
+        exposure_time: int = 100,  # milliseconds
+        frames_to_buffer: int = 16,
+        frame_pool_size: int = 4,
+        bench: OpticalBench = None,
+    ):
+        self.bench = default_bench() if bench is None else bench
         self.exposure_time = exposure_time
+        self.bit_depth = self.bench.bit_depth
+        self.roi: list[int] = [0, SENSOR_SHAPE[0], 0, SENSOR_SHAPE[1]]
+        self.binning: int = 1
+        self.frame_count = 0
+        # Seconds by which making the frames delayed them beyond the modelled
+        # exposure and readout, which benchmarks subtract
+        self.simulation_delay = 0.0
+        self.accumulator = FrameAccumulator()
 
     def __enter__(self):
         return self
@@ -13,13 +48,87 @@ class MockCamera:
     def __exit__(self, *exc_info):
         return None
 
-    def capture(self) -> Image:
-        time.sleep(self.exposure_time * 1e-3)
-        img = np.random.rand(2048, 2448) * 4096
+    @contextmanager
+    def readout(self, roi: list[int] = None, binning: int = 1):
+        """Software crop and binning in place of the camera readout"""
+        previous = (self.roi, self.binning)
+        self.roi = [0, SENSOR_SHAPE[0], 0, SENSOR_SHAPE[1]] if roi is None else roi
+        self.binning = binning
+        try:
+            yield self
+        finally:
+            self.roi, self.binning = previous
+
+    def _read_sensor(self, now: float = None) -> np.ndarray:
+        image = self.bench.expose(self.exposure_time, self.roi, now=now)
+        self.frame_count += 1
+
+        return bin_image(image, self.binning)
+
+    def _synthesize(self, middle: float, arrival: float, requested: float):
+        """
+        Frame exposed around middle, made while it is read out and returned
+        at arrival, or as soon as it is made. Also returns the delay beyond
+        the real camera, which has the frame at arrival or when requested.
+        """
+        image = self._read_sensor(middle)
+        delay = max(time.time() - max(arrival, requested), 0)
+        self.simulation_delay += delay
+        _sleep_until(arrival)
+
+        return image, delay
 
-        return Image.fromarray(img)
+    def _expose(self) -> np.ndarray:
+        # Exposure and readout of a single triggered frame
+        scale = self.bench.time_scale
+        exposure = self.exposure_time * 1e-3 * scale
+        start = time.time()
+        arrival = start + exposure + self.bench.readout_latency(self.roi) * 1e-3 * scale
+        _sleep_until(start + exposure / 2)
+
+        return self._synthesize(start + exposure / 2, arrival, start)[0]
+
+    def capture(self, dispose=False) -> Frame:
+        for _ in range(3 if dispose else 1):
+            image = self._expose()
+
+        return Frame(
+            image,
+            self.frame_count,
+            exposure_time=self.exposure_time,
+            binning=self.binning,
+        )
+
+    def stream(self, n: int = None, discard: int = 0) -> Iterator[np.ndarray]:
+        """
+        Frames at the sensor frame rate. The next exposure overlaps the
+        readout, so a frame arrives every max(exposure, readout) ms.
+        """
+        scale = self.bench.time_scale
+        exposure = self.exposure_time * 1e-3 * scale
+        readout = self.bench.readout_latency(self.roi) * 1e-3 * scale
+
+        count = 0
+        total = None if n is None else n + discard
+        arrival = time.time() + exposure + readout
+        while total is None or count < total:
+            requested = time.time()
+            middle = arrival - readout - exposure / 2
+            _sleep_until(middle)
+
+            count += 1
+            image, delay = self._synthesize(middle, arrival, requested)
+            if count > discard:
+                yield image
+            # The later frames are delayed as much as this one
+            arrival += delay + max(exposure, readout)
 
     def multi_scan(self, n: int) -> np.ndarray:
-        time.sleep(self.exposure_time * 1e-3 * n)
+        self.accumulator.reset()
+        for image in self.stream(n, discard=2):
+            self.accumulator.add(image)
+
+        return self.accumulator.mean(dtype="int16")
 
-        return (np.random.rand(2048, 2448) * 4096).astype("int16")
+    def change_exposure_time(self, exposure_time):
+        self.exposure_time = int(exposure_time)
@@ -0,0 +1,33 @@
+from instr_mock.bench import OpticalBench, default_bench
+
+
+class MockITC503:
+    """
+    ITC503 on the simulated optical bench. The sample temperature follows
+    the setpoint with the thermal time constant of the bench.
+    """
+
+    def __init__(
+        self, port: int = "COM3", timeout: float = 1.0, bench: OpticalBench = None
+    ):
+        self.bench = default_bench() if bench is None else bench
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace):
+        return None
+
+    def set_heater_channel(self, ch: int):
+        return None
+
+    def set_heater_gasflow_mode(
+        self, heater_mode: str = "manual", gas_mode: str = "manual"
+    ):
+        return None
+
+    def set_temperature(self, target_temp: float):
+        self.bench.set_temperature(float(target_temp))
+
+    def read_temperature(self, ch: int):
+        return f"{self.bench.temperature:.3f}"
@@ -1,15 +1,28 @@
-class MockQWP:
-    def __init__(self, init_position=False):
-        pass
+from instr.interfaces.stage import MoveHandle
+from instr_mock.bench import OpticalBench
+from instr_mock.mock_stage import MockStage
 
-    def __enter__(self):
-        return self
 
-    def __exit__(self, *exc_info):
-        return None
+class MockQWP(MockStage):
+    """
+    SHOT702 on the simulated optical bench. Axis 1 rotates the quarter wave
+    plate, axis 2 is not connected to the optics.
+    """
 
-    def wait_while_busy(self):
-        return None
+    AXES = {1: "qwp", 2: "shot702_2"}
+
+    def __init__(
+        self,
+        port="COM3",
+        init_position=False,
+        speed: float = 5.0,
+        timeout=1.0,
+        bench: OpticalBench = None,
+    ):
+        super().__init__(init_position=init_position, speed=speed, bench=bench)
 
     def move(self, angle: int, axis: int = 1):
-        return None
+        self.move_async(angle, axis).wait()
+
+    def move_async(self, angle: int, axis: int = 1) -> MoveHandle:
+        return self.move_many_async({axis: angle})
@@ -1,6 +1,31 @@
-class MockStage:
-    def __init__(self, init_position=False):
-        pass
+import time
+
+from instr.interfaces.stage import MoveHandle, stages
+from instr_mock.bench import OpticalBench, SimulatedAxis, default_bench
+
+
+class MockStage(stages):
+    """
+    Mark102 on the simulated optical bench. Axis 1 rotates the polarizer and
+    axis 2 the analyzer.
+    """
+
+    # Bench axis moved by each axis of the controller
+    AXES = {1: "polarizer", 2: "analyzer"}
+
+    def __init__(
+        self,
+        gpib: int = 8,
+        init_position: bool = False,
+        speed: float = 5.0,  # deg/s
+        bench: OpticalBench = None,
+    ):
+        self.bench = default_bench() if bench is None else bench
+        for name in self.AXES.values():
+            self.bench.axis(name).speed = speed
+
+        if init_position:
+            self.initialize()
 
     def __enter__(self):
         return self
@@ -8,8 +33,33 @@ class MockStage:
     def __exit__(self, *exc_info):
         return None
 
+    def _axis(self, axis: int) -> SimulatedAxis:
+        return self.bench.axis(self.AXES[axis])
+
+    def initialize(self):
+        self.move_many({axis: 0 for axis in self.AXES})
+
+    def is_busy(self) -> bool:
+        now = time.time()
+        return any(self._axis(axis).busy(now) for axis in self.AXES)
+
     def wait_while_busy(self):
-        return None
+        remaining = max(self._axis(axis).end() for axis in self.AXES) - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
 
     def move(self, angle: int, axis: int):
-        return None
+        self.move_async(angle, axis).wait()
+
+    def move_async(self, angle: int, axis: int) -> MoveHandle:
+        return self.move_many_async({axis: angle})
+
+    def move_many_async(self, targets: dict) -> MoveHandle:
+        # The controller accepts a new move once the previous one has finished
+        self.wait_while_busy()
+
+        now = time.time()
+        for axis, angle in targets.items():
+            self._axis(axis).move(angle, now, self.bench.time_scale)
+
+        return MoveHandle(self)
@@ -1,24 +1,255 @@
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from PIL import Image
+"""
+Make a GIF (or MP4) from the images in ./images ordered by the number in the
+file names (temperature or magnetic field).
+
+Frames are downsampled and normalized in a process pool and written to the
+file (GIF) or to ffmpeg (MP4) one by one, so the memory does not grow with
+the number of frames.
+"""
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
+import io
+import os
+import re
+import struct
+import subprocess
+
+import numpy as np
+from PIL import Image
+import tifffile as tiff
+
+EXTENSIONS = (".png", ".tif", ".tiff")
+# Percentiles of the intensity mapped to black and white
+LOW_PERCENTILE = 0.5
+HIGH_PERCENTILE = 99.5
+
+
+def temperature(path: str) -> float:
+    """Number in the file name, e.g. 29 for 29k.png or 29.5.tif"""
+    name = os.path.basename(path)
+    match = re.match(r"-?\d+(\.\d+)?", name)
+    if match is None:
+        raise ValueError(f"{name} does not start with a number")
+
+    return float(match.group())
+
+
+def list_images(folder: str, descending: bool = True) -> list[str]:
+    paths = [
+        p for p in glob(os.path.join(folder, "*")) if p.lower().endswith(EXTENSIONS)
+    ]
+    paths.sort(key=temperature, reverse=descending)
+
+    return paths
+
+
+def read_image(path: str) -> np.ndarray:
+    if path.lower().endswith((".tif", ".tiff")):
+        image = tiff.imread(path)
+    else:
+        image = np.asarray(Image.open(path).convert("F"))
+
+    return image.astype("float32")
+
+
+def downsample(image: np.ndarray, max_size: int) -> np.ndarray:
+    """Average factor x factor blocks so that the longer side fits in max_size"""
+    factor = -(-max(image.shape[:2]) // max_size)
+    if factor <= 1:
+        return image
+
+    h, w = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[: h * factor, : w * factor].reshape(h, factor, w, factor)
+
+    return blocks.mean(axis=(1, 3))
+
+
+def intensity_range(path: str, max_size: int) -> tuple[float]:
+    image = downsample(read_image(path), max_size)
+
+    return tuple(np.percentile(image, [LOW_PERCENTILE, HIGH_PERCENTILE]))
+
+
+def render_frame(path: str, max_size: int, low: float, high: float) -> np.ndarray:
+    """Downsampled 8-bit frame. low and high are mapped to 0 and 255."""
+    image = downsample(read_image(path), max_size)
+    image = (image - low) * (255 / max(high - low, 1e-12))
+
+    return np.clip(image, 0, 255).astype("uint8")
+
+
+def bounded_map(executor, fn, items, lookahead: int):
+    """
+    executor.map which keeps at most lookahead results in flight, so the
+    memory does not depend on the number of items
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, *item))
+        if len(pending) >= lookahead:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def gif_image_block(frame: np.ndarray) -> bytes:
+    """
+    Image descriptor, color table and LZW data of frame, taken from the
+    single image GIF that Pillow saves. The global color table of that file
+    becomes the local color table of the block.
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format="GIF")
+    data = buffer.getvalue()
+
+    # Logical screen descriptor: 6 bytes of header, then width, height, flags
+    flags = data[10]
+    pos = 13
+    palette = b""
+    if flags & 0x80:
+        size = 3 << ((flags & 0x07) + 1)
+        palette, pos = data[pos : pos + size], pos + size
+
+    # Skip the extensions up to the image descriptor
+    while data[pos] == 0x21:
+        pos += 2
+        while data[pos]:
+            pos += data[pos] + 1
+        pos += 1
+    if data[pos] != 0x2C or data[-1] != 0x3B:
+        raise RuntimeError("Unexpected GIF from Pillow")
+
+    descriptor = bytearray(data[pos : pos + 10])
+    if descriptor[9] & 0x80:
+        palette = b""  # the block has its own color table
+    elif palette:
+        descriptor[9] |= 0x80 | (flags & 0x07)
+
+    return bytes(descriptor) + palette + data[pos + 10 : -1]
+
+
+class GifStream:
+    """Write a looping grayscale GIF frame by frame"""
+
+    def __init__(self, path: str, interval: int):
+        self.path = path
+        self.interval = interval  # milliseconds
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, frame: np.ndarray):
+        if self._file is None:
+            h, w = frame.shape
+            self._file = open(self.path, "wb")
+            # Header and logical screen without a global color table
+            self._file.write(b"GIF89a" + struct.pack("<HHBBB", w, h, 0, 0, 0))
+            # NETSCAPE2.0 application extension, loop forever
+            self._file.write(b"!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+        # Graphic control extension with the delay in 1/100 s
+        delay = round(self.interval / 10)
+        self._file.write(b"!\xf9\x04\x00" + struct.pack("<H", delay) + b"\x00\x00")
+        self._file.write(gif_image_block(frame))
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(b";")  # trailer
+            self._file.close()
+            self._file = None
+
+
+class Mp4Stream:
+    """Pipe grayscale frames to ffmpeg"""
+
+    def __init__(self, path: str, interval: int):
+        self.path = path
+        self.interval = interval  # milliseconds
+        self._process: subprocess.Popen = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, frame: np.ndarray):
+        if self._process is None:
+            h, w = frame.shape
+            # yuv420p needs even sizes
+            command = (
+                f"ffmpeg -y -loglevel error -f rawvideo -pix_fmt gray -s {w}x{h} "
+                f"-r {1000 / self.interval} -i - "
+                "-vf pad=ceil(iw/2)*2:ceil(ih/2)*2 -pix_fmt yuv420p"
+            ).split() + [self.path]
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+        self._process.stdin.write(np.ascontiguousarray(frame).tobytes())
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            if self._process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to write {self.path}")
+            self._process = None
+
+
+def make_movie(
+    paths: list[str],
+    output: str,
+    interval: int = 500,  # milliseconds per frame
+    max_size: int = 1000,  # pixels of the longer side
+    workers: int = None,
+) -> None:
+    """Write the images in paths as the frames of a GIF or MP4 (by extension)"""
+    if not paths:
+        raise ValueError("No images to make a movie")
+
+    stream_class = Mp4Stream if output.lower().endswith(".mp4") else GifStream
+    lookahead = 2 * (workers or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(workers) as executor:
+        # The same intensity range for every frame, so that they are comparable
+        ranges = bounded_map(
+            executor, intensity_range, ((p, max_size) for p in paths), lookahead
+        )
+        lows, highs = zip(*ranges)
+        low, high = min(lows), max(highs)
+
+        frames = bounded_map(
+            executor,
+            render_frame,
+            ((p, max_size, low, high) for p in paths),
+            lookahead,
+        )
+        with stream_class(output, interval) as stream:
+            for frame in frames:
+                stream.write(frame)
+
 
 if __name__ == "__main__":
-    fig = plt.figure(figsize=(14, 14))
-    plt.tick_params(labelleft=False, labelbottom=False, left=False, bottom=False)
-    plt.gca().spines["right"].set_visible(False)
-    plt.gca().spines["top"].set_visible(False)
-    plt.gca().spines["left"].set_visible(False)
-    plt.gca().spines["bottom"].set_visible(False)
-    images = []
-
-    img_list = glob("./images/*.png")
-    # img_list.sort(key=lambda x: -float(x.rsplit("/", 1)[1].rsplit(".", 1)[0]))
-
-    for img in img_list:
-        im = Image.open(img)
-        images.append([plt.imshow(im)])
-
-    plt.tight_layout()
-    ani = animation.ArtistAnimation(fig, images, interval=500)
-    ani.save("simulation.gif")
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--input", default="./images")
+    parser.add_argument("--output", default="simulation.gif", help=".gif or .mp4")
+    parser.add_argument("--interval", type=int, default=500, help="ms per frame")
+    parser.add_argument("--max-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--ascending", action="store_true", help="start from the smallest number"
+    )
+    args = parser.parse_args()
+
+    make_movie(
+        list_images(args.input, descending=not args.ascending),
+        args.output,
+        interval=args.interval,
+        max_size=args.max_size,
+        workers=args.workers,
+    )
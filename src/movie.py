@@ -1,47 +1,33 @@
+"""
+Record a movie of the sample while the temperature changes.
+
+Frames are captured back-to-back and appended to a single file together with
+their timestamps and the temperature of the Lakeshore. Stop with Ctrl+C.
+"""
 from instr.CS505MU import CS505MU
+from instr.temperature_sampler import TemperatureSampler, lakeshore_reader
+from processing.recorder import Recorder
 import pyvisa as visa
-import tifffile as tiff
-
-import threading
-import time
-
-
-def capture(camera, image):
-    image.append(camera.capture())
-
-
-def read_temperature(lakeshore, exposure_time, temp):
-    time.sleep(exposure_time / 2)
-
-    temperature = lakeshore.query("KRDG?A").replace("\r\n", "")
-    temp.append(temperature)
 
 
 if __name__ == "__main__":
-    path = "./image_test/"
+    path = "./image_test/movie.tif"
     exposure_time = 500  # ms
+    duration = None  # seconds, None to record until Ctrl+C
 
     rm = visa.ResourceManager("@py")
 
-    with rm.open_resources("GPIB0::13::instr") as lakeshore, CS505MU(
+    with rm.open_resource("GPIB0::13::instr") as lakeshore, CS505MU(
         exposure_time=exposure_time
-    ) as camera:
-
-        print("Start captureing")
-
-        while True:
-            image_list = []
-            temp_list = []
-            t1 = threading.Thread(target=capture, args=(camera, image_list))
-            t2 = threading.Thread(
-                target=read_temperature, args=(lakeshore, exposure_time, temp_list)
-            )
-
-            t1.start()
-            t2.start()
-
-            t1.join()
-            t2.join()
-
-            tiff.imsave(f"{path}/{temp_list[0].tif}", image_list[0])
-            break
+    ) as camera, TemperatureSampler(lakeshore_reader(lakeshore)) as sampler, Recorder(
+        camera, path, sampler=sampler
+    ) as recorder:
+        sampler.wait_for_reading()
+
+        print("Start capturing")
+        try:
+            recorder.record(duration=duration)
+        except KeyboardInterrupt:
+            pass
+
+        print(f"{recorder.recorded} frames, {recorder.fps:.2f} fps")
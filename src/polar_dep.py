@@ -1,12 +1,23 @@
 """
 polarizerの角度依存性を測定するプログラム
 """
+from contextlib import ExitStack, contextmanager, nullcontext
+
 from instr.Mark102 import Mark102  # stage controller
 from instr.CS505MU import CS505MU  # CCD camera
 
+# Simulated optical bench for development
+# from instr_mock.mock_camera import MockCamera as CS505MU
+# from instr_mock.mock_stage import MockStage as Mark102
+from processing.accumulator import FrameAccumulator
+from processing.crossed_nicols import AdaptiveSearch, ScanStack, fit_parabola_map
+from processing.pipeline import CapturePipeline
+from storage.calibration import CalibrationStore
+from storage.run_container import RunContainer
+from storage.tiff_writer import TiffWriter
+
 import numpy as np
 from scipy.optimize import minimize
-import tifffile as tiff
 from tqdm import tqdm
 import yaml
 
@@ -37,11 +48,54 @@ class Config:
         self.angle_end: float = self.config["polarizer"]["angle_end"]
         self.step: float = self.config["polarizer"]["step"]
 
+        # Crossed nicols scan (optional)
+        # mode "grid": 20 analyzer angles in 0.2 deg steps
+        # mode "adaptive": refine until the error of cn_angle is below tolerance
+        cn_scan = self.config.get("crossed_nicols", {})
+        self.cn_scan_mode: str = cn_scan.get("mode", "grid")
+        self.cn_tolerance: float = cn_scan.get("tolerance", 0.02)
+        self.cn_max_points: int = cn_scan.get("max_points", 12)
+        if self.cn_max_points < 3:
+            raise ValueError("crossed_nicols.max_points must be 3 or more")
+        # Fit every (binned) pixel and save cn_angle/curvature/residual maps
+        self.cn_pixel_map: bool = cn_scan.get("pixel_map", False)
+        self.cn_binning: int = cn_scan.get("binning", 4)
+
+        # Crossed nicols calibration database (optional)
+        # The scan window is centered on the interpolated crossed nicols angle
+        # and narrowed to `window` degrees. With skip_scan, the scan is skipped
+        # if the polarizer angle is already in the database.
+        calibration = self.config.get("calibration", {})
+        self.calibration_path: str = calibration.get("path")
+        self.calibration_window: float = calibration.get("window", 2)
+        self.calibration_skip_scan: bool = calibration.get("skip_scan", False)
+
         # Directory settings
+        # cn_info: folder of {angle}_scan_info.yaml or a calibration database
         self.cn_info: str = self.config["cn_info"]
         self.output_folder: str = self.config["output_folder"]
         self.log_folder: str = self.config["log_folder"]
 
+        # Output format (optional)
+        # format "tiff": {kind}_{angle}.tif files in output_folder
+        # format "container": every image and its metadata are appended to
+        # a single file at path
+        output = self.config.get("output", {})
+        self.output_format: str = output.get("format", "tiff")
+        self.container_path: str = output.get("path", f"{self.output_folder}/run.tif")
+        self.container_compression: str = output.get("compression", "zlib")
+
+        # Temperature sweep (optional, used by temperature_sweep.py)
+        # The sequence is repeated at every setpoint once the temperature
+        # stays within `tolerance` K of it and drifts slower than `max_rate`
+        # K/min for `window` seconds
+        sweep = self.config.get("temperature_sweep", {})
+        self.setpoints: list[float] = sweep.get("setpoints", [])
+        self.settle_tolerance: float = sweep.get("tolerance", 0.1)
+        self.settle_max_rate: float = sweep.get("max_rate", 0.05)
+        self.settle_window: float = sweep.get("window", 60)
+        self.settle_timeout: float = sweep.get("timeout", 3600)
+
 
 class Sequence:
     """
@@ -55,41 +109,175 @@ class Sequence:
 
         self.current_angle: float = self.config.angle_start
         self.cn_params: tuple[float] = None
-
-    def multi_scan(self, n: int, adjust=False) -> np.ndarray:
-        image_avg = np.array(self.camera.capture(dispose=True)).astype("float64")
-
+        # Sample temperature used as a key of the calibration database
+        self.temperature: float = None
+
+        self.calibration: CalibrationStore = None
+        if self.config.calibration_path is not None:
+            self.calibration = CalibrationStore(self.config.calibration_path)
+
+        # Reused by every multi_scan call to avoid per-frame allocation
+        self.accumulator = FrameAccumulator()
+        # ROI relative to the frames read out during the crossed nicols scan
+        self._frame_roi: list[int] = None
+
+        # Domain images are averaged and saved in the background
+        self.writer = TiffWriter()
+        self.container: RunContainer = None
+        if self.config.output_format == "container":
+            self.container = RunContainer(
+                self.config.container_path,
+                compression=self.config.container_compression,
+            )
+        self.pipeline = CapturePipeline(self.camera, save=self._save)
+        # Log of the last crossed nicols scan, stored with the cn image
+        self._scan_log: dict = None
+
+    def _capture_num(self, n: int, adjust=False) -> int:
         if adjust and self.camera.exposure_time < 2000:
             n *= 4
         elif adjust and self.camera.exposure_time < 4000:
             n *= 2
 
-        for i in tqdm(range(1, n)):
-            image = np.array(self.camera.capture(dispose=False))
-            image_avg = (image_avg * i + image) / (i + 1)
+        return n
 
-        return image_avg.astype("int16")
+    def _accumulate(self, n: int) -> None:
+        self.accumulator.reset()
+        # The first two frames may be exposed with the previous settings
+        for image in tqdm(self.camera.stream(n, discard=2), total=n):
+            self.accumulator.add(image)
 
-    def crossed_nicols_scan(self) -> tuple[float]:
-        start = -self.current_angle + 173 - 2
+    def multi_scan(self, n: int, adjust=False) -> np.ndarray:
+        self._accumulate(self._capture_num(n, adjust))
+
+        return self.accumulator.mean(dtype="int16")
+
+    def scan_window(self) -> tuple[float]:
+        """Analyzer angle range of the crossed nicols scan"""
+        warm_start = None
+        if self.calibration is not None:
+            warm_start = self.calibration.interpolate(
+                self.current_angle, temperature=self.temperature
+            )
+
+        if warm_start is None:
+            width = 4
+            start = -self.current_angle + 173 - width / 2
+        else:
+            width = self.config.calibration_window
+            start = warm_start[1] - width / 2
         start = start if start > 0 else 360 + start
-        end = start + 4
 
-        angles = np.arange(start, end, 0.2)
+        return start, start + width
+
+    def scan_angles(self) -> np.ndarray:
+        """Analyzer angles of the crossed nicols scan"""
+        start, end = self.scan_window()
+
+        return np.arange(start, end, 0.2)
+
+    def _roi_intensity(self) -> float:
+        """Average intensity in the ROI of the accumulated frames"""
+        roi = self._frame_roi or self.config.roi
+        roi_sum = self.accumulator.sum()[roi[0] : roi[1], roi[2] : roi[3]]
+
+        return np.mean(roi_sum) / self.accumulator.count
+
+    def _save_scan_info(self, angles, intensities, fit_params, error=None) -> None:
+        if self.calibration is not None:
+            self.calibration.add(
+                self.current_angle,
+                fit_params,
+                temperature=self.temperature,
+                error=error,
+            )
+
+        log = {
+            "angles": list(angles),
+            "intensities": list(intensities),
+            "fit_params": [float(p) for p in fit_params],
+        }
+        self._scan_log = log
+        with open(
+            f"{self.config.log_folder}/{self.current_angle}_scan_info.yaml", "w"
+        ) as f:
+            yaml.dump(log, f)
+
+    def _scan_stack(self, capacity: int) -> ScanStack:
+        if not self.config.cn_pixel_map:
+            return None
+
+        return ScanStack(capacity, binning=self.config.cn_binning)
+
+    def _save_cn_maps(self, stack: ScanStack) -> None:
+        """
+        Fit the crossed nicols parabola for every pixel of the scan stack and
+        save the maps next to the scan info
+        """
+        maps = fit_parabola_map(stack.angles, stack.stack())
+
+        for name, image in zip(("cn_angle", "curvature", "residual"), maps):
+            if self.container is not None:
+                self.container.append(
+                    image,
+                    name,
+                    polarizer=self.current_angle,
+                    binning=self.config.cn_binning,
+                )
+                continue
+
+            self.writer.write(
+                f"{self.config.log_folder}/{self.current_angle}_{name}.tif", image
+            )
+
+    @contextmanager
+    def _roi_readout(self):
+        """
+        Read out only the ROI during the crossed nicols scan if the camera
+        supports it. The pixel maps need the full frame.
+        """
+        if self.config.cn_pixel_map or not hasattr(self.camera, "readout"):
+            yield
+            return
+
+        roi = self.config.roi
+        with self.camera.readout(roi=roi):
+            top, left = self.camera.roi[0], self.camera.roi[2]
+            self._frame_roi = [roi[0] - top, roi[1] - top, roi[2] - left, roi[3] - left]
+            try:
+                yield
+            finally:
+                self._frame_roi = None
+
+    def crossed_nicols_scan(self) -> tuple[float]:
+        with self._roi_readout():
+            if self.config.cn_scan_mode == "adaptive":
+                return self.adaptive_crossed_nicols_scan()
+
+            return self.grid_crossed_nicols_scan()
+
+    def grid_crossed_nicols_scan(self) -> tuple[float]:
+        angles = self.scan_angles()
+        center = sum(self.scan_window()) / 2
         average_intensities = []
+        stack = self._scan_stack(len(angles))
 
+        move = self.stage.move_async(angles[0], axis=2)
         self.camera.change_exposure_time(self.config.scan_time)
 
-        for angle in angles:
-            self.stage.move(angle, axis=2)
-            self.stage.wait_while_busy()
+        for i, angle in enumerate(angles):
+            move.wait()
 
             print(f"analyzer angle: {angle:.2f}")
-            image_avg = self.multi_scan(self.config.scan_num)
-            roi = self.config.roi
-            image_roi = image_avg[roi[0] : roi[1], roi[2] : roi[3]]
+            self._accumulate(self.config.scan_num)
+
+            # Reduce the ROI while the analyzer travels to the next angle
+            if i + 1 < len(angles):
+                move = self.stage.move_async(angles[i + 1], axis=2)
 
-            average_intensities.append(np.mean(image_roi))
+            average_intensities.append(self._roi_intensity())
+            if stack is not None:
+                stack.add(angle, self.accumulator.sum(), self.accumulator.count)
 
         average_intensities = np.array(average_intensities)
 
@@ -100,21 +288,59 @@ class Sequence:
             return np.sum((average_intensities - fitting_func(x)) ** 2)
 
         slope, cn_angle, cn_intensity = minimize(
-            error, [1, start + 2, min(average_intensities)]
+            error, [1, center, min(average_intensities)]
         ).x
 
-        log = {
-            "angles": angles.tolist(),
-            "intensities": average_intensities.tolist(),
-            "fit_params": [float(slope), float(cn_angle), float(cn_intensity)],
-        }
-        with open(
-            f"{self.config.log_folder}/{self.current_angle}_scan_info.yaml", "w"
-        ) as f:
-            yaml.dump(log, f)
+        self._save_scan_info(
+            angles.tolist(),
+            average_intensities.tolist(),
+            [slope, cn_angle, cn_intensity],
+        )
+        if stack is not None:
+            self._save_cn_maps(stack)
 
         return slope, cn_angle, cn_intensity
 
+    def adaptive_crossed_nicols_scan(self) -> tuple[float]:
+        """
+        Crossed nicols scan which stops as soon as the fitted crossed nicols
+        angle is known within config.cn_tolerance degrees
+        """
+        start, end = self.scan_window()
+        search = AdaptiveSearch(
+            start,
+            end,
+            tolerance=self.config.cn_tolerance,
+            max_points=self.config.cn_max_points,
+        )
+        stack = self._scan_stack(self.config.cn_max_points)
+
+        self.camera.change_exposure_time(self.config.scan_time)
+
+        angle = search.next_angle()
+        while angle is not None:
+            self.stage.move(angle, axis=2)
+
+            print(f"analyzer angle: {angle:.2f}")
+            self._accumulate(self.config.scan_num)
+            search.add(angle, self._roi_intensity())
+            if stack is not None:
+                stack.add(angle, self.accumulator.sum(), self.accumulator.count)
+
+            angle = search.next_angle()
+
+        if search.params is None:
+            # Too few points were measured to fit the parabola
+            print("Adaptive scan failed. Fall back to the grid scan")
+            return self.grid_crossed_nicols_scan()
+
+        print(f"cn_angle: {search.params[1]:.3f} +/- {search.error:.3f}")
+        self._save_scan_info(*search.result(), search.params, error=search.error)
+        if stack is not None:
+            self._save_cn_maps(stack)
+
+        return search.params
+
     def adjust_exposure_time(self):
         """
         Adjust the exposure time of the camera so that the average intensity
@@ -131,28 +357,72 @@ class Sequence:
         exposure_time = min(15000, exposure_time)
         self.camera.change_exposure_time(exposure_time)
 
-    def capture_domain(self) -> None:
-        self.adjust_exposure_time()
+    def _output(self, kind: str, analyzer_angle: float, n: int):
+        """
+        Where the image of kind (cn, pos or neg) is saved: a file path, or
+        the metadata of the image in the run container
+        """
+        if self.container is None:
+            return f"{self.config.output_folder}/{kind}_{self.current_angle}.tif"
+
+        metadata = {
+            "kind": kind,
+            "polarizer": self.current_angle,
+            "analyzer": analyzer_angle,
+            "exposure_time": self.camera.exposure_time,
+            "frame_count": n,
+            "temperature": self.temperature,
+            "cn_params": [float(p) for p in self.cn_params],
+        }
+        if kind == "cn" and self._scan_log is not None:
+            metadata["scan"] = self._scan_log
 
-        self.stage.move(self.cn_params[1] + self.config.angle, axis=2)
-        self.stage.wait_while_busy()
+        return metadata
 
-        save_folder = self.config.output_folder
+    def _save(self, target, image: np.ndarray) -> None:
+        """Save callback of the pipeline"""
+        if isinstance(target, dict):
+            self.container.append(image, **target)
+        else:
+            self.writer.write(target, image)
 
-        image_pos = self.multi_scan(self.config.domain_capture_num, adjust=True)
+    def pipelined_scan(self, kind: str, analyzer_angle: float) -> None:
+        """
+        Capture and average domain_capture_num images in the background
+        pipeline and save the result as kind. This returns as soon as the
+        camera has finished, so the stages can be moved while the image is
+        averaged and saved.
+        """
+        n = self._capture_num(self.config.domain_capture_num, adjust=True)
+        target = self._output(kind, analyzer_angle, n)
+        self.pipeline.submit(n, target).wait_acquired()
 
-        tiff.imsave(f"{save_folder}/pos_{self.current_angle}.tif", image_pos)
+    def capture_domain(self) -> None:
+        positive_angle = self.cn_params[1] + self.config.angle
+        move = self.stage.move_async(positive_angle, axis=2)
+        self.adjust_exposure_time()
 
         negative_angle = self.cn_params[1] - self.config.angle
         negative_angle = negative_angle if negative_angle > 0 else 360 + negative_angle
-        self.stage.move(negative_angle, axis=2)
-        self.stage.wait_while_busy()
 
-        image_neg = self.multi_scan(self.config.domain_capture_num, adjust=True)
+        move.wait()
+        self.pipelined_scan("pos", positive_angle)
 
-        tiff.imsave(f"{save_folder}/neg_{self.current_angle}.tif", image_neg)
+        # The positive image is averaged and saved during this move
+        self.stage.move_async(negative_angle, axis=2).wait()
+        self.pipelined_scan("neg", negative_angle)
 
     def read_from_file(self) -> list[float]:
+        if self.config.cn_info.endswith(".db"):
+            with CalibrationStore(self.config.cn_info) as calibration:
+                params = calibration.interpolate(
+                    self.current_angle, temperature=self.temperature
+                )
+            if params is None:
+                raise ValueError(f"{self.config.cn_info} has no crossed nicols data")
+
+            return params
+
         with open(
             f"{self.config.cn_info}/{self.current_angle}_scan_info.yaml", "rb"
         ) as f:
@@ -160,33 +430,75 @@ class Sequence:
 
         return data["fit_params"]
 
+    def known_cn_params(self) -> list[float]:
+        """
+        Crossed nicols parameters which do not need a scan, or None
+        """
+        if self.config.cn_info is not None:
+            return self.read_from_file()
+
+        if self.calibration is not None and self.config.calibration_skip_scan:
+            entry = self.calibration.lookup(
+                self.current_angle, temperature=self.temperature
+            )
+            if entry is not None:
+                return [entry["slope"], entry["cn_angle"], entry["cn_intensity"]]
+
+        return None
+
     def cn_capture(self) -> None:
+        move = self.stage.move_async(self.cn_params[1], axis=2)
         self.adjust_exposure_time()
+        move.wait()
 
-        self.stage.move(self.cn_params[1], axis=2)
-        self.stage.wait_while_busy()
+        self.pipelined_scan("cn", self.cn_params[1])
 
-        cn_image = self.multi_scan(self.config.domain_capture_num, adjust=True)
+    def _outputs(self):
+        """
+        Leaving the returned context waits until every image is saved,
+        re-raises any error from the background pipeline or the writer and
+        closes the calibration database
+        """
+        stack = ExitStack()
+        stack.enter_context(self.calibration or nullcontext())
+        stack.enter_context(self.container or nullcontext())
+        stack.enter_context(self.writer)
+        stack.enter_context(self.pipeline)
 
-        tiff.imsave(
-            f"{self.config.output_folder}/cn_{self.current_angle}.tif", cn_image
-        )
+        return stack
+
+    def finish(self) -> None:
+        """Wait until every image of measure() is saved and close the outputs"""
+        with self._outputs():
+            pass
 
     def run(self) -> None:
-        scan_exposure_time = self.config.scan_time
+        with self._outputs():
+            self.measure()
 
+    def measure(self) -> None:
+        """
+        Measure every polarizer angle. This returns when the camera has
+        finished, while the last images may still be averaged and saved in
+        the background until finish() is called.
+        """
         while self.current_angle <= self.config.angle_end:
             print(f"Measuring {self.current_angle} deg.")
-            self.stage.move(self.current_angle, axis=1)
-            self.stage.wait_while_busy()
+
+            # Move the polarizer and the analyzer together
+            self.cn_params = self.known_cn_params()
+            self._scan_log = None
+            if self.cn_params is None:
+                analyzer_angle = self.scan_angles()[0]
+            else:
+                analyzer_angle = self.cn_params[1]
+            self.stage.move_many({1: self.current_angle, 2: analyzer_angle})
 
             # Crossed Nicols scan
-            if self.config.cn_info is None:
+            if self.cn_params is None:
                 print("Start crossed nicols scan")
                 self.cn_params = self.crossed_nicols_scan()
                 print("Done.\n")
-            else:
-                self.cn_params = self.read_from_file()
 
             self.cn_capture()
 
@@ -207,3 +519,5 @@ if __name__ == "__main__":
     with Mark102(init_position=True) as stage, CS505MU(exposure_time=100) as camera:
         sequence = Sequence(config, stage=stage, camera=camera)
         sequence.run()
+
+    print("TIFF write metrics:", sequence.writer.metrics.as_dict())
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class FrameAccumulator:
+    """
+    Accumulate camera frames into a preallocated integer buffer.
+
+    Frames are summed in place, so adding a frame does not allocate any
+    full-size temporary array. The buffers are allocated on the first frame
+    and reused until the frame shape changes.
+    """
+
+    def __init__(self, variance: bool = False):
+        self.track_variance = variance
+        self.count: int = 0
+
+        self._sum: np.ndarray = None
+        self._sum_sq: np.ndarray = None
+        self._square: np.ndarray = None  # work buffer for frame ** 2
+
+    @property
+    def shape(self) -> tuple[int]:
+        return None if self._sum is None else self._sum.shape
+
+    def _allocate(self, shape: tuple[int]):
+        self._sum = np.zeros(shape, dtype=np.int64)
+        if self.track_variance:
+            self._sum_sq = np.zeros(shape, dtype=np.int64)
+            self._square = np.empty(shape, dtype=np.int64)
+        else:
+            self._sum_sq = None
+            self._square = None
+
+    def reset(self):
+        """Clear the accumulated frames while keeping the buffers"""
+        self.count = 0
+
+    def add(self, frame) -> None:
+        """
+        Add a frame. frame can be a numpy array or a PIL image.
+        """
+        frame = np.asarray(frame)
+
+        if self._sum is None or self._sum.shape != frame.shape:
+            self._allocate(frame.shape)
+            self.count = 0
+
+        # The first frame overwrites the buffers, so reset() needs no fill
+        if self.count == 0:
+            np.copyto(self._sum, frame, casting="unsafe")
+        else:
+            np.add(self._sum, frame, out=self._sum, casting="unsafe")
+
+        if self.track_variance:
+            square = self._sum_sq if self.count == 0 else self._square
+            np.multiply(frame, frame, out=square, dtype=np.int64, casting="unsafe")
+            if self.count > 0:
+                np.add(self._sum_sq, self._square, out=self._sum_sq)
+
+        self.count += 1
+
+    def sum(self) -> np.ndarray:
+        """Read-only view of the accumulated sum"""
+        self._check_count()
+        view = self._sum.view()
+        view.flags.writeable = False
+
+        return view
+
+    def mean(self, dtype: str = "float64", out: np.ndarray = None) -> np.ndarray:
+        """
+        Average of the accumulated frames.
+
+        If dtype is an integer type, the result is computed with an integer
+        division and truncated like ndarray.astype. Pass out to reuse an
+        existing buffer.
+        """
+        self._check_count()
+        if out is None:
+            out = np.empty(self._sum.shape, dtype=dtype)
+
+        if np.issubdtype(out.dtype, np.integer):
+            np.floor_divide(self._sum, self.count, out=out, casting="unsafe")
+        else:
+            np.divide(self._sum, self.count, out=out)
+
+        return out
+
+    def variance(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        Per-pixel population variance of the accumulated frames
+        """
+        self._check_count()
+        if not self.track_variance:
+            raise RuntimeError("Variance is not tracked. Use variance=True")
+
+        if out is None:
+            out = np.empty(self._sum.shape, dtype="float64")
+
+        # var = (N * sum(x^2) - sum(x)^2) / N^2, evaluated in integers
+        np.multiply(self._sum, self._sum, out=self._square)
+        np.multiply(self._sum_sq, self.count, out=out, casting="unsafe")
+        np.subtract(out, self._square, out=out, casting="unsafe")
+        out /= self.count ** 2
+
+        return out
+
+    def _check_count(self):
+        if self.count == 0:
+            raise RuntimeError("No frame has been accumulated")
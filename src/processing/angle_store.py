@@ -0,0 +1,44 @@
+from bisect import bisect_left
+
+
+class AngleStore:
+    """
+    Running mean of the intensity per angle bin, kept sorted by angle. The
+    angle of a bin is the first angle added to it.
+
+    Angles closer than resolution share a bin, so float noise of the stage
+    position does not add points. A new point is found by bisection and the
+    mean is updated in place, so nothing is re-sorted or searched linearly.
+    """
+
+    def __init__(self, resolution: float = 0.01):
+        self.resolution = resolution
+        self._keys: list[int] = []
+        self.angles: list[float] = []
+        self.means: list[float] = []
+        self.counts: list[int] = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, angle: float, intensity: float) -> int:
+        """Add a point and return the index of its bin"""
+        key = round(angle / self.resolution)
+        i = bisect_left(self._keys, key)
+
+        if i < len(self._keys) and self._keys[i] == key:
+            self.counts[i] += 1
+            self.means[i] += (intensity - self.means[i]) / self.counts[i]
+        else:
+            self._keys.insert(i, key)
+            self.angles.insert(i, float(angle))
+            self.means.insert(i, float(intensity))
+            self.counts.insert(i, 1)
+
+        return i
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self.angles.clear()
+        self.means.clear()
+        self.counts.clear()
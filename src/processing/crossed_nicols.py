@@ -0,0 +1,204 @@
+import numpy as np
+
+
+def fit_parabola(angles, intensities) -> tuple:
+    """
+    Least squares fit of intensity = slope * (angle - cn_angle) ** 2 + cn_intensity
+
+    Returns ((slope, cn_angle, cn_intensity), standard error of cn_angle).
+    The error is inf if it cannot be estimated.
+    """
+    x = np.asarray(angles, dtype="float64")
+    y = np.asarray(intensities, dtype="float64")
+
+    # Center the angles for a well-conditioned design matrix
+    x0 = x.mean()
+    design = np.stack([(x - x0) ** 2, x - x0, np.ones_like(x)], axis=1)
+    coef, _, rank, _ = np.linalg.lstsq(design, y, rcond=None)
+    a, b, c = coef
+
+    if rank < 3 or a == 0:
+        return (float(a), float(x[np.argmin(y)]), float(y.min())), np.inf
+
+    vertex = -b / (2 * a)
+    params = (float(a), float(x0 + vertex), float(c - b ** 2 / (4 * a)))
+
+    dof = len(x) - 3
+    if dof <= 0 or a < 0:
+        return params, np.inf
+
+    # Propagate the covariance of (a, b) to the vertex position
+    sigma2 = np.sum((y - design @ coef) ** 2) / dof
+    cov = sigma2 * np.linalg.inv(design.T @ design)
+    grad = np.array([b / (2 * a ** 2), -1 / (2 * a)])
+    error = float(np.sqrt(grad @ cov[:2, :2] @ grad))
+
+    return params, error
+
+
+class AdaptiveSearch:
+    """
+    Sequential parabola refits around the crossed nicols angle.
+
+    The window [start, end] is first sampled at `initial_points` angles.
+    After that, every new point is put at the fitted minimum or half a grid
+    step on either side of it, at most half a window outside [start, end].
+    The search stops when the standard error of the fitted cn_angle is below
+    `tolerance` or `max_points` points have been measured.
+    """
+
+    def __init__(
+        self,
+        start: float,
+        end: float,
+        tolerance: float = 0.02,  # deg
+        max_points: int = 12,
+        initial_points: int = 5,
+    ):
+        self.start = start
+        self.end = end
+        self.tolerance = tolerance
+        self.max_points = max_points
+
+        self.angles: list[float] = []
+        self.intensities: list[float] = []
+        self.params: tuple[float] = None
+        self.error: float = np.inf
+
+        self._queue = list(np.linspace(start, end, initial_points))
+        self._half_step = (end - start) / (initial_points - 1) / 2
+        self._offsets = [0, -self._half_step, self._half_step]
+
+    @property
+    def done(self) -> bool:
+        if len(self.angles) >= self.max_points:
+            return True
+
+        return not self._queue and self.error < self.tolerance
+
+    def add(self, angle: float, intensity: float):
+        self.angles.append(float(angle))
+        self.intensities.append(float(intensity))
+
+        if len(self.angles) >= 3:
+            self.params, self.error = fit_parabola(self.angles, self.intensities)
+
+    def next_angle(self) -> float:
+        """The next analyzer angle to measure, or None when finished"""
+        if self.done:
+            return None
+        if self._queue:
+            return float(self._queue.pop(0))
+
+        slope, cn_angle, _ = self.params
+        if slope <= 0:
+            # No minimum yet. Look around the darkest point
+            cn_angle = self.angles[int(np.argmin(self.intensities))]
+
+        offset = self._offsets[len(self.angles) % len(self._offsets)]
+        margin = (self.end - self.start) / 2
+        angle = min(max(cn_angle + offset, self.start - margin), self.end + margin)
+
+        return float(angle)
+
+    def result(self) -> tuple[list[float], list[float]]:
+        """Measured (angles, intensities) sorted by angle"""
+        order = np.argsort(self.angles, kind="stable")
+
+        return (
+            [self.angles[i] for i in order],
+            [self.intensities[i] for i in order],
+        )
+
+
+def bin_image(image: np.ndarray, binning: int) -> np.ndarray:
+    """
+    Sum binning x binning pixel blocks. The edges which do not fill a whole
+    block are cropped.
+    """
+    if binning == 1:
+        return image
+
+    h, w = image.shape[0] // binning, image.shape[1] // binning
+    blocks = image[: h * binning, : w * binning].reshape(h, binning, w, binning)
+
+    return blocks.sum(axis=(1, 3))
+
+
+class ScanStack:
+    """
+    (angles x H x W) stack of the averaged scan images, binned to reduce the
+    memory. The buffer is allocated once for `capacity` angles.
+    """
+
+    def __init__(self, capacity: int, binning: int = 4):
+        self.capacity = capacity
+        self.binning = binning
+        self.angles: list[float] = []
+        self.images: np.ndarray = None
+
+    def add(self, angle: float, image_sum: np.ndarray, count: int = 1):
+        """Add the average image_sum / count taken at angle"""
+        if len(self.angles) >= self.capacity:
+            raise ValueError(f"The stack is full ({self.capacity} angles)")
+
+        binned = bin_image(image_sum, self.binning)
+        if self.images is None:
+            self.images = np.empty((self.capacity, *binned.shape), dtype="float32")
+
+        # Average over the frames and over the binned pixels
+        np.divide(
+            binned,
+            count * self.binning ** 2,
+            out=self.images[len(self.angles)],
+            casting="unsafe",
+        )
+        self.angles.append(float(angle))
+
+    def stack(self) -> np.ndarray:
+        return self.images[: len(self.angles)]
+
+
+def fit_parabola_map(angles, stack: np.ndarray, chunk_size: int = 1 << 18) -> tuple:
+    """
+    Fit intensity = curvature * (angle - cn_angle) ** 2 + offset for every
+    pixel of stack (angles x H x W) at once.
+
+    All pixels share the design matrix, so the least squares solution is a
+    single matrix product with its pseudo-inverse. Pixels are processed in
+    chunks of chunk_size to bound the temporary memory.
+
+    Returns (cn_angle, curvature, residual) maps. residual is the RMS of the
+    fit residuals, and cn_angle is nan where the curvature is not positive.
+    """
+    x = np.asarray(angles, dtype="float64")
+    if len(x) < 3:
+        raise ValueError("At least three angles are necessary")
+
+    x0 = x.mean()
+    design = np.stack([(x - x0) ** 2, x - x0, np.ones_like(x)], axis=1)
+    pinv = np.linalg.pinv(design)
+
+    n, h, w = stack.shape
+    pixels = stack.reshape(n, h * w)
+    cn_angle = np.empty(h * w, dtype="float32")
+    curvature = np.empty(h * w, dtype="float32")
+    residual = np.empty(h * w, dtype="float32")
+    dof = max(n - 3, 1)
+
+    for start in range(0, h * w, chunk_size):
+        y = pixels[:, start : start + chunk_size].astype("float64")
+        a, b, c = pinv @ y
+
+        fitted = design @ np.stack([a, b, c])
+        rss = np.sum((y - fitted) ** 2, axis=0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vertex = np.where(a > 0, x0 - b / (2 * a), np.nan)
+
+        end = start + y.shape[1]
+        cn_angle[start:end] = vertex
+        curvature[start:end] = a
+        residual[start:end] = np.sqrt(rss / dof)
+
+    return cn_angle.reshape(h, w), curvature.reshape(h, w), residual.reshape(h, w)
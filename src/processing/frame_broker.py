@@ -0,0 +1,235 @@
+from contextlib import contextmanager, nullcontext
+import queue
+import threading
+import time
+from typing import Iterator
+
+import numpy as np
+
+from instr.frame import Frame
+
+# Drop policies of a subscription when its queue is full
+LATEST = "latest"  # drop the oldest queued frame (live views)
+SKIP = "skip"  # drop the incoming frame (statistics at their own pace)
+BLOCK = "block"  # never drop, the broker waits (recorders)
+POLICIES = (LATEST, SKIP, BLOCK)
+
+
+class Subscription:
+    """
+    Bounded queue of the frames published by a FrameBroker. Frames are
+    shared by every subscriber, so their images are read-only.
+    """
+
+    def __init__(self, broker, name: str, maxsize: int, policy: str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy {policy}, use one of {POLICIES}")
+
+        self.name = name
+        self.policy = policy
+        self.delivered = 0
+        self.dropped = 0
+
+        self._broker = broker
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        self._broker.unsubscribe(self)
+
+    def _offer(self, frame: Frame, stop: threading.Event) -> None:
+        """Called by the broker thread"""
+        if self.policy == BLOCK:
+            while not stop.is_set():
+                try:
+                    self._queue.put(frame, timeout=0.1)
+                    self.delivered += 1
+                    return
+                except queue.Full:
+                    continue
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(frame)
+                self.delivered += 1
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.policy == SKIP:
+                    return
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None) -> Frame:
+        """Next frame. Raises queue.Empty after timeout seconds."""
+        self._broker.check()
+        return self._queue.get(timeout=timeout)
+
+    def get_nowait(self) -> Frame:
+        self._broker.check()
+        return self._queue.get_nowait()
+
+    def take(self, n: int, discard: int = 0, timeout: float = None) -> Iterator[Frame]:
+        """Yield the next n frames after dropping discard frames"""
+        for i in range(n + discard):
+            frame = self.get(timeout=timeout)
+            if i >= discard:
+                yield frame
+
+
+class FrameBroker:
+    """
+    Owns the acquisition loop of a camera and publishes every frame once to
+    all the subscribers.
+
+    Each subscriber has its own bounded queue and drop policy, so a slow
+    consumer does not delay the others (unless its policy is BLOCK). The
+    readout (ROI, binning) can be switched while running, e.g. to record a
+    full frame image during a binned live view.
+    """
+
+    def __init__(self, camera, roi: list[int] = None, binning: int = 1):
+        self.camera = camera
+        self.published = 0
+
+        self._readout = (roi, binning)
+        self._running_readout: tuple = None
+        self._readout_changed = threading.Condition()
+
+        self._subscriptions: list[Subscription] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._error: Exception = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def binning(self) -> int:
+        return self._readout[1]
+
+    def subscribe(
+        self, name: str, maxsize: int = 2, policy: str = LATEST
+    ) -> Subscription:
+        subscription = Subscription(self, name, maxsize, policy)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions = [
+                s for s in self._subscriptions if s is not subscription
+            ]
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.check()
+
+    def check(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("Frame broker failed") from self._error
+
+    def stale_frames(self) -> int:
+        """
+        frame_count up to which frames may have been exposed before now: the
+        published ones, those in the camera buffer and the one being exposed
+        """
+        return self.published + getattr(self.camera, "frames_to_buffer", 0) + 1
+
+    def set_readout(self, roi: list[int] = None, binning: int = 1, timeout=10):
+        """
+        Change the readout and wait until frames with it are published, so
+        that a subscription made afterwards only gets the new frames
+        """
+        readout = (roi, binning)
+        with self._readout_changed:
+            self._readout = readout
+            if self._thread is None:
+                return
+            ok = self._readout_changed.wait_for(
+                lambda: self._running_readout == readout or self._error is not None,
+                timeout,
+            )
+        self.check()
+        if not ok:
+            raise TimeoutError("The camera did not switch the readout")
+
+    @contextmanager
+    def readout(self, roi: list[int] = None, binning: int = 1):
+        """Use the readout in the block and restore the previous one"""
+        previous = self._readout
+        self.set_readout(roi, binning)
+        try:
+            yield self
+        finally:
+            self.set_readout(*previous)
+
+    def _camera_readout(self, readout: tuple):
+        if not hasattr(self.camera, "readout"):
+            return nullcontext()
+
+        return self.camera.readout(*readout)
+
+    def _publish(self, image: np.ndarray, binning: int) -> None:
+        # One copy per frame, shared by every subscriber
+        image = np.array(image)
+        image.flags.writeable = False
+        self.published += 1
+        frame = Frame(
+            image,
+            frame_count=self.published,
+            timestamp=time.time(),
+            exposure_time=self.camera.exposure_time,
+            binning=binning,
+        )
+
+        for subscription in self._subscriptions:
+            subscription._offer(frame, self._stop)
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                readout = self._readout
+                with self._camera_readout(readout):
+                    frames = self.camera.stream()
+                    try:
+                        for image in frames:
+                            if self._running_readout != readout:
+                                with self._readout_changed:
+                                    self._running_readout = readout
+                                    self._readout_changed.notify_all()
+                            if self._stop.is_set() or self._readout != readout:
+                                break
+                            self._publish(image, readout[1])
+                    finally:
+                        frames.close()
+        except Exception as error:
+            self._error = error
+            with self._readout_changed:
+                self._readout_changed.notify_all()
@@ -0,0 +1,165 @@
+import threading
+
+import numpy as np
+
+# Frames averaged into the crossed nicols reference
+REFERENCE_FRAMES = 8
+# Colored frames in flight: two in the display queue, one on the screen and
+# one being made
+DISPLAY_BUFFERS = 4
+
+
+def diverging_colormap() -> np.ndarray:
+    """
+    (256, 3) uint8 lookup table of the difference image. 128 (no difference)
+    is black, brighter is red and darker is blue.
+    """
+    t = (np.arange(256) - 128) / 127
+    colormap = np.zeros((256, 3))
+    colormap[:, 0] = np.clip(t, 0, 1)  # red
+    colormap[:, 2] = np.clip(-t, 0, 1)  # blue
+
+    return np.round(colormap * 255).astype("uint8")
+
+
+class DisplayFrame:
+    """A display-ready 8-bit frame and the statistics of the camera frame"""
+
+    __slots__ = ("image", "mean", "minimum", "maximum")
+
+    def __init__(self, image: np.ndarray, mean: float, minimum: float, maximum: float):
+        self.image = image
+        self.mean = mean
+        self.minimum = minimum
+        self.maximum = maximum
+
+
+class LiveViewProcessor:
+    """
+    Turn camera frames into display-ready 8-bit frames.
+
+    Frames larger than max_shape are decimated by taking every n-th pixel,
+    and the pixel values are mapped to 8 bits with a lookup table, so no
+    float image is ever made. Statistics are in the 8-bit scale of the display.
+
+    After memorize(), the average of the next frames is the crossed nicols
+    reference and the signed difference from it is shown through a colormap,
+    gain display levels per intensity level. memorize() and reset() may be
+    called from another thread, they take effect at the next frame.
+    """
+
+    def __init__(
+        self,
+        bit_depth: int = 12,
+        binning: int = 1,  # pixels summed by the camera, binning x binning
+        max_shape: tuple[int] = (512, 612),  # (height, width) of the display
+        gain: float = 4.0,  # contrast of the difference image
+    ):
+        self.max_shape = max_shape
+        self.gain = gain
+        # Summing binning x binning pixels adds 2 * log2(binning) bits
+        self.shift = bit_depth - 8 + 2 * (binning.bit_length() - 1)
+        self.lut = np.clip(np.arange(1 << 16) >> self.shift, 0, 255).astype("uint8")
+        self.colormap = diverging_colormap()
+
+        # Running average of the reference at display resolution
+        self._reference: np.ndarray = None
+        self._reference_count = 0
+        self._reference_frames = 0
+        # 128 - gain * reference, added to the scaled frame
+        self._offset: np.ndarray = None
+        self._difference: np.ndarray = None
+        self._index: np.ndarray = None
+        self._colored: list[np.ndarray] = []
+        self._colored_count = 0
+
+        # Frames of a requested reference, 0 to reset, applied by process()
+        self._request: int = None
+        self._lock = threading.Lock()
+
+    @property
+    def scale(self) -> float:
+        """Camera level to display level"""
+        return 1 / (1 << self.shift)
+
+    @property
+    def difference_mode(self) -> bool:
+        return self._offset is not None
+
+    def stride(self, shape: tuple[int]) -> int:
+        """Decimation which fits a frame of shape into max_shape"""
+        return max(
+            -(-shape[0] // self.max_shape[0]), -(-shape[1] // self.max_shape[1]), 1
+        )
+
+    def memorize(self, n: int = REFERENCE_FRAMES) -> None:
+        """Average the next n frames into the reference to subtract"""
+        with self._lock:
+            self._request = n
+
+    def reset(self) -> None:
+        with self._lock:
+            self._request = 0
+
+    def _apply_request(self) -> None:
+        with self._lock:
+            request, self._request = self._request, None
+        if request is None:
+            return
+
+        self._reference = None
+        self._reference_count = 0
+        self._reference_frames = request
+        self._offset = None
+
+    def _add_reference(self, decimated: np.ndarray) -> None:
+        if self._reference_count == 0:
+            self._reference = decimated.astype("float32") * self.scale
+        else:
+            # Running mean: ref += (frame - ref) / k
+            k = self._reference_count + 1
+            delta = decimated * self.scale - self._reference
+            self._reference += delta / k
+        self._reference_count += 1
+
+        if self._reference_count == self._reference_frames:
+            self._offset = (128 - self.gain * self._reference).astype("float32")
+            self._difference = np.empty(self._offset.shape, dtype="float32")
+            self._index = np.empty(self._offset.shape, dtype="uint8")
+            self._colored = [
+                np.empty(self._offset.shape + (3,), dtype="uint8")
+                for _ in range(DISPLAY_BUFFERS)
+            ]
+
+    def _colored_difference(self, decimated: np.ndarray, offset: np.ndarray):
+        difference, index = self._difference, self._index
+        np.multiply(decimated, self.gain * self.scale, out=difference, casting="unsafe")
+        np.add(difference, offset, out=difference)
+        np.clip(difference, 0, 255, out=difference)
+        np.copyto(index, difference, casting="unsafe")
+
+        # Frames still in the display queue are not overwritten
+        colored = self._colored[self._colored_count % len(self._colored)]
+        self._colored_count += 1
+
+        return np.take(self.colormap, index, axis=0, out=colored)
+
+    def process(self, image: np.ndarray) -> DisplayFrame:
+        self._apply_request()
+        n = self.stride(image.shape)
+        decimated = image[::n, ::n]
+
+        scale = self.scale
+        mean = float(decimated.mean()) * scale
+        low, high = float(decimated.min()) * scale, float(decimated.max()) * scale
+
+        if self._reference_count < self._reference_frames:
+            self._add_reference(decimated)
+
+        offset = self._offset
+        if offset is not None and offset.shape == decimated.shape:
+            display = self._colored_difference(decimated, offset)
+        else:
+            display = np.take(self.lut, decimated.astype("uint16", copy=False))
+
+        return DisplayFrame(display, mean, low, high)
@@ -0,0 +1,208 @@
+import queue
+import threading
+
+import numpy as np
+from tqdm import tqdm
+
+from processing.accumulator import FrameAccumulator
+
+# Marks the end of the job stream
+_STOP = object()
+
+
+class CaptureJob:
+    """
+    Handle of a multi-frame capture submitted to CapturePipeline
+    """
+
+    def __init__(self, pipeline, n: int, path: str):
+        self.n = n
+        self.path = path
+
+        self.acquired = threading.Event()
+        self.saved = threading.Event()
+        self._pipeline = pipeline
+
+    def wait_acquired(self):
+        """
+        Block until every frame of this job has been read from the camera.
+        After this returns, the stages can be moved safely.
+        """
+        self._wait(self.acquired)
+
+    def wait_saved(self):
+        self._wait(self.saved)
+
+    def _wait(self, event: threading.Event):
+        while not event.wait(0.1):
+            self._pipeline.check()
+        self._pipeline.check()
+
+
+class CapturePipeline:
+    """
+    Bounded acquire -> accumulate -> save pipeline.
+
+    One thread pulls frames from the camera, a second one averages them and
+    a third one saves the averaged images, so the camera does not wait for
+    the arithmetic or the filesystem. The bounded queues between the stages
+    apply backpressure, and the first error raised in any stage is re-raised
+    by submit, check and join on the caller's thread.
+    """
+
+    def __init__(
+        self,
+        camera,
+        save,  # save(path, image)
+        frame_queue_size: int = 8,
+        save_queue_size: int = 2,
+        discard: int = 2,  # frames dropped at the start of each job
+    ):
+        self.camera = camera
+        self.save = save
+        self.discard = discard
+
+        self.frame_queue_size = frame_queue_size
+        self.save_queue_size = save_queue_size
+
+        self._error: Exception = None
+        self._abort = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.join()
+        else:
+            self.abort()
+
+    def start(self):
+        self._jobs = queue.Queue()
+        self._frames = queue.Queue(maxsize=self.frame_queue_size)
+        self._images = queue.Queue(maxsize=self.save_queue_size)
+
+        self._abort.clear()
+        self._threads = [
+            threading.Thread(target=target, daemon=True)
+            for target in (self._acquire_loop, self._accumulate_loop, self._save_loop)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, n: int, path: str) -> CaptureJob:
+        """Queue a capture of n averaged frames which is saved to path"""
+        self.check()
+        if not self._threads:
+            self.start()
+
+        job = CaptureJob(self, n, path)
+        self._jobs.put(job)
+
+        return job
+
+    def check(self):
+        if self._error is not None:
+            raise RuntimeError("Capture pipeline failed") from self._error
+
+    def join(self):
+        """Wait until all submitted jobs are saved and stop the threads"""
+        if self._threads:
+            self._jobs.put(_STOP)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+
+        self.check()
+
+    def abort(self):
+        """Stop the threads without waiting for the pending jobs"""
+        self._abort.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _fail(self, error: Exception):
+        if self._error is None:
+            self._error = error
+        self._abort.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        return _STOP
+
+    def _acquire_loop(self):
+        while True:
+            job = self._get(self._jobs)
+            if job is _STOP:
+                self._put(self._frames, _STOP)
+                return
+
+            try:
+                frames = self.camera.stream(job.n, discard=self.discard)
+                for image in tqdm(frames, total=job.n):
+                    # The camera reuses its buffer, so the frame is copied here
+                    if not self._put(self._frames, (job, np.array(image))):
+                        return
+            except Exception as error:
+                self._fail(error)
+                return
+            finally:
+                job.acquired.set()
+
+            self._put(self._frames, (job, None))
+
+    def _accumulate_loop(self):
+        accumulator = FrameAccumulator()
+
+        while True:
+            item = self._get(self._frames)
+            if item is _STOP:
+                self._put(self._images, _STOP)
+                return
+
+            job, image = item
+            try:
+                if image is not None:
+                    accumulator.add(image)
+                    continue
+
+                # End of the job
+                average = accumulator.mean(dtype="int16")
+                accumulator.reset()
+            except Exception as error:
+                self._fail(error)
+                return
+
+            if not self._put(self._images, (job, average)):
+                return
+
+    def _save_loop(self):
+        while True:
+            item = self._get(self._images)
+            if item is _STOP:
+                return
+
+            job, image = item
+            try:
+                self.save(job.path, image)
+            except Exception as error:
+                self._fail(error)
+                return
+            job.saved.set()
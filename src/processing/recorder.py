@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+
+from instr.frame import Frame, FramePool
+from storage.run_container import RunContainer
+
+# Marks the end of the frame queue
+_STOP = object()
+
+
+class Recorder:
+    """
+    Record camera frames back-to-back into a single run container.
+
+    The camera streams at the sensor frame rate on the calling thread and a
+    writer thread appends the frames to one file, so no thread or file is
+    created per frame. The frames are copied into a fixed pool of buffers and
+    handed over through a bounded queue: when the disk is slower than the
+    camera, the acquisition waits (and the camera buffers the frames).
+
+    Each frame is tagged with its timestamp, frame number, exposure time
+    and, if a TemperatureSampler is given, the temperature in the middle of
+    the exposure.
+    """
+
+    def __init__(
+        self,
+        camera,
+        path: str,
+        sampler=None,  # TemperatureSampler
+        queue_size: int = 16,
+        compression: str = None,  # None keeps up with the camera best
+    ):
+        self.camera = camera
+        self.sampler = sampler
+        self.container = RunContainer(path, compression=compression, tile=None)
+
+        self.recorded = 0
+        self.elapsed = 0.0
+        self.max_queued = 0
+
+        # One buffer is being filled and one is being written
+        self._pool = FramePool(queue_size + 2)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error: Exception = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def fps(self) -> float:
+        return self.recorded / max(self.elapsed, 1e-9)
+
+    def stop(self) -> None:
+        """Stop a running record() from another thread"""
+        self._stop.set()
+
+    def check(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("Failed to record a frame") from self._error
+
+    def close(self) -> None:
+        self.container.close()
+
+    def _temperature(self, frame: Frame) -> float:
+        if self.sampler is None:
+            return None
+
+        middle = frame.timestamp - frame.exposure_time * 1e-3 / 2
+        return self.sampler.at(middle)
+
+    def _write_loop(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _STOP:
+                return
+
+            try:
+                if self._error is None:
+                    self.container.append(
+                        frame.image,
+                        "frame",
+                        timestamp=frame.timestamp,
+                        frame_count=frame.frame_count,
+                        exposure_time=frame.exposure_time,
+                        temperature=self._temperature(frame),
+                    )
+                    self.recorded += 1
+            except Exception as error:
+                # Stop the acquisition and report the error
+                self._error = error
+                self._stop.set()
+            finally:
+                frame.release()
+
+    def _put(self, frame: Frame):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(frame, timeout=0.1)
+                self.max_queued = max(self.max_queued, self._queue.qsize())
+                return
+            except queue.Full:
+                continue
+        frame.release()
+
+    def record(self, n: int = None, duration: float = None) -> int:
+        """
+        Record n frames, or for duration seconds, or until stop() is called.
+        Returns the number of frames written.
+        """
+        self._stop.clear()
+        writer = threading.Thread(target=self._write_loop, daemon=True)
+        writer.start()
+
+        recorded = self.recorded
+        start = time.time()
+        frames = self.camera.stream(n)
+        try:
+            for count, image in enumerate(frames, 1):
+                if duration is not None and time.time() - start > duration:
+                    break
+
+                frame = self._pool.frame(
+                    image,
+                    frame_count=count,
+                    exposure_time=self.camera.exposure_time,
+                )
+                self._put(frame)
+                if self._stop.is_set():
+                    break
+        finally:
+            frames.close()
+            self._queue.put(_STOP)
+            writer.join()
+            self.elapsed += time.time() - start
+
+        self.check()
+
+        return self.recorded - recorded
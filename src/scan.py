@@ -1,11 +1,13 @@
 from instr.CS505MU import CS505MU
 from instr.Mark102 import Mark102
+from storage.tiff_writer import TiffWriter
 
 import numpy as np
-import tifffile as tiff
 
 if __name__ == "__main__":
-    with Mark102(init_position=True) as stage, CS505MU(exposure_time=15000) as camera:
+    with Mark102(init_position=True) as stage, CS505MU(
+        exposure_time=15000
+    ) as camera, TiffWriter() as writer:
         pol = 51
         cn = 121
         stage.move(pol, axis=1)
@@ -15,6 +17,6 @@ if __name__ == "__main__":
             stage.wait_while_busy()
 
             image = camera.multi_scan(4)
-            tiff.imsave(
+            writer.write(
                 f"./outputs/conbs_210629/test-scan/51deg/{angle:.2f}.tif", image
             )
@@ -62,7 +62,8 @@ if __name__ == "__main__":
         qwp.move(suggest_qwp)
         qwp.wait_while_busy()
 
-        average_intensity = np.mean(np.array(camera.capture()))
+        with camera.capture() as frame:
+            average_intensity = np.mean(frame.image)
         print("Average intensity", average_intensity)
         time.sleep(3)
 
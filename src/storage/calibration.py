@@ -0,0 +1,214 @@
+"""
+Crossed nicols calibration database
+"""
+from datetime import datetime
+from glob import glob
+import os
+import sqlite3
+import threading
+
+import yaml
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crossed_nicols (
+    id INTEGER PRIMARY KEY,
+    polarizer REAL NOT NULL,
+    qwp REAL,
+    temperature REAL,
+    date TEXT NOT NULL,
+    slope REAL,
+    cn_angle REAL NOT NULL,
+    cn_intensity REAL,
+    error REAL
+);
+CREATE INDEX IF NOT EXISTS crossed_nicols_key
+    ON crossed_nicols (polarizer, temperature, qwp, date);
+"""
+
+
+def _wrap(angle: float) -> float:
+    """Wrap an angle difference into [-180, 180)"""
+    return (angle + 180) % 360 - 180
+
+
+def _lerp(v0: float, v1: float, t: float) -> float:
+    if v0 is None or v1 is None:
+        return None
+
+    return v0 + t * (v1 - v0)
+
+
+class CalibrationStore:
+    """
+    Crossed nicols positions keyed by polarizer angle, QWP angle, temperature
+    and date, in a single SQLite file.
+
+    interpolate() estimates the fit parameters at a polarizer angle from the
+    neighbouring entries, so that a scan can start from a good guess or be
+    skipped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def add(
+        self,
+        polarizer: float,
+        fit_params,  # [slope, cn_angle, cn_intensity]
+        qwp: float = None,
+        temperature: float = None,
+        date: str = None,  # ISO format, now if None
+        error: float = None,  # standard error of cn_angle
+    ):
+        slope, cn_angle, cn_intensity = (
+            None if p is None else float(p) for p in fit_params
+        )
+        date = date if date is not None else datetime.now().isoformat()
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO crossed_nicols (polarizer, qwp, temperature, date, "
+                "slope, cn_angle, cn_intensity, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    polarizer,
+                    qwp,
+                    temperature,
+                    date,
+                    slope,
+                    cn_angle,
+                    cn_intensity,
+                    error,
+                ),
+            )
+
+    def entries(
+        self, qwp: float = None, temperature: float = None, fitted: bool = True
+    ) -> list[dict]:
+        """
+        Entries sorted by polarizer angle, the latest one per polarizer angle.
+
+        If temperature is given, only the entries at the nearest measured
+        temperature are used, otherwise only the entries without a
+        temperature. If qwp is given, only the entries at that QWP angle are
+        used. With fitted, entries without slope or cn_intensity (analyzer
+        and QWP angles from the optimizer) are skipped.
+        """
+        conditions = []
+        args = []
+        if qwp is not None:
+            conditions.append("abs(qwp - ?) < 1e-6")
+            args.append(qwp)
+        if temperature is None:
+            conditions.append("temperature IS NULL")
+        if fitted:
+            conditions.append("slope IS NOT NULL AND cn_intensity IS NOT NULL")
+
+        query = "SELECT * FROM crossed_nicols"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        with self._lock:
+            rows = [dict(row) for row in self._connection.execute(query, args)]
+
+        if temperature is not None:
+            measured = [r["temperature"] for r in rows if r["temperature"] is not None]
+            if measured:
+                nearest = min(measured, key=lambda t: abs(t - temperature))
+                rows = [r for r in rows if r["temperature"] == nearest]
+
+        latest = {}
+        for row in sorted(rows, key=lambda r: r["date"]):
+            latest[row["polarizer"]] = row
+
+        return [latest[p] for p in sorted(latest)]
+
+    def lookup(
+        self,
+        polarizer: float,
+        qwp: float = None,
+        temperature: float = None,
+        temperature_tolerance: float = 0.5,
+        fitted: bool = True,
+    ) -> dict:
+        """The latest entry measured at polarizer (and temperature), or None"""
+        for row in self.entries(qwp, temperature, fitted):
+            if abs(row["polarizer"] - polarizer) > 1e-6:
+                continue
+            if temperature is not None and (
+                row["temperature"] is None
+                or abs(row["temperature"] - temperature) > temperature_tolerance
+            ):
+                continue
+            return row
+
+        return None
+
+    def interpolate(
+        self,
+        polarizer: float,
+        qwp: float = None,
+        temperature: float = None,
+        fitted: bool = True,
+    ) -> list[float]:
+        """
+        Fit parameters [slope, cn_angle, cn_intensity] at polarizer,
+        interpolated linearly between the neighbouring polarizer angles.
+        With a single neighbour the crossed nicols angle is shifted by the
+        polarizer rotation. None if there is no entry. Without fitted, the
+        slope and cn_intensity may be None.
+        """
+        rows = self.entries(qwp, temperature, fitted)
+        if not rows:
+            return None
+
+        below = [r for r in rows if r["polarizer"] <= polarizer]
+        above = [r for r in rows if r["polarizer"] >= polarizer]
+
+        if below and above:
+            r0, r1 = below[-1], above[0]
+            if r0 is r1:
+                return [r0["slope"], r0["cn_angle"], r0["cn_intensity"]]
+
+            t = (polarizer - r0["polarizer"]) / (r1["polarizer"] - r0["polarizer"])
+            cn_angle = r0["cn_angle"] + t * _wrap(r1["cn_angle"] - r0["cn_angle"])
+
+            return [
+                _lerp(r0["slope"], r1["slope"], t),
+                cn_angle % 360,
+                _lerp(r0["cn_intensity"], r1["cn_intensity"], t),
+            ]
+
+        # The analyzer follows the polarizer in the opposite direction
+        nearest = below[-1] if below else above[0]
+        cn_angle = nearest["cn_angle"] - (polarizer - nearest["polarizer"])
+
+        return [nearest["slope"], cn_angle % 360, nearest["cn_intensity"]]
+
+    def import_scan_info(self, folder: str, temperature: float = None) -> int:
+        """
+        Add the {polarizer}_scan_info.yaml files in folder. The file
+        modification time is used as the date. Returns the number of files.
+        """
+        paths = glob(f"{folder}/*_scan_info.yaml")
+        for path in paths:
+            polarizer = float(os.path.basename(path).rsplit("_scan_info", 1)[0])
+            with open(path, "rb") as f:
+                data = yaml.safe_load(f)
+
+            date = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            self.add(polarizer, data["fit_params"], temperature=temperature, date=date)
+
+        return len(paths)
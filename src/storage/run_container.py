@@ -0,0 +1,114 @@
+"""
+Single-file container of the images of a measurement run
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import tifffile as tiff
+
+
+def _to_builtin(value):
+    """json.dumps fallback for numpy scalars and arrays"""
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def read_records(path: str) -> list[dict]:
+    """Metadata of every page in a run container, in page order"""
+    records = []
+    with tiff.TiffFile(path) as f:
+        for page in f.pages:
+            records.append(json.loads(page.description))
+
+    return records
+
+
+def build_index(records: list[dict]) -> dict[tuple, int]:
+    """
+    Map (kind, polarizer angle) to the page number. The last page wins if
+    an image was captured twice.
+    """
+    return {
+        (record["kind"], record.get("polarizer")): page
+        for page, record in enumerate(records)
+    }
+
+
+class RunContainer:
+    """
+    Append the images of a run to one BigTIFF file.
+
+    Every image is a tiled, compressed page whose description holds its
+    metadata as JSON (kind, polarizer and analyzer angles, exposure time,
+    number of frames, temperature, crossed nicols parameters, ...). Pages are
+    appended as the run progresses, so the file is readable at any time.
+    An existing file is appended to.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compression: str = "zlib",  # None for uncompressed pages
+        tile: tuple[int] = (256, 256),  # None for contiguous pages
+    ):
+        self.path = path
+        self.compression = compression
+        self.tile = tile
+
+        self.records: list[dict] = []
+        if os.path.exists(path):
+            self.records = read_records(path)
+
+        self._writer: tiff.TiffWriter = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, image: np.ndarray, kind: str, **metadata) -> int:
+        """
+        Append an image of kind (e.g. cn, pos, neg) and return its page
+        number. metadata must be JSON serializable (numpy values are
+        converted).
+        """
+        record = {"kind": kind, **metadata}
+        description = json.dumps(record, default=_to_builtin)
+
+        with self._lock:
+            if self._writer is None:
+                self._writer = tiff.TiffWriter(self.path, bigtiff=True, append=True)
+
+            self._writer.write(
+                np.asarray(image),
+                compression=self.compression,
+                tile=self.tile,
+                description=description,
+                metadata=None,
+            )
+            self.records.append(json.loads(description))
+
+            return len(self.records) - 1
+
+    def index(self) -> dict[tuple, int]:
+        """(kind, polarizer angle) -> page number"""
+        return build_index(self.records)
+
+    def find(self, kind: str, polarizer: float) -> int:
+        """Page number of the image, or None"""
+        return self.index().get((kind, polarizer))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,341 @@
+"""
+Reader of the outputs of polar_dep
+"""
+from collections import OrderedDict
+from glob import glob
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import tifffile as tiff
+import yaml
+
+from storage.run_container import read_records
+
+# cn_10.tif, pos_10.0.tif, neg_-5.tif in output_folder
+_IMAGE_NAME = re.compile(r"^(cn|pos|neg)_(-?[\d.]+)\.tiff?$")
+# 10_scan_info.yaml, 10_cn_angle.tif, ... in log_folder
+_LOG_NAME = re.compile(r"^(-?[\d.]+)_(scan_info\.yaml|cn_angle|curvature|residual)")
+
+
+class _Page:
+    """
+    Lazy access to one TIFF page which reads only what is sliced. The pages
+    of a file share its handle and the lock which guards it.
+    """
+
+    def __init__(self, file: tiff.TiffFile, page: int, lock: threading.Lock):
+        self._file = file
+        self._page = file.pages[page]
+        self._lock = lock
+
+    @property
+    def shape(self) -> tuple[int]:
+        return self._page.shape
+
+    def memmap(self) -> np.ndarray:
+        """Read-only memory map of an uncompressed contiguous page, or None"""
+        page = self._page
+        if not page.is_memmappable:
+            return None
+
+        return np.memmap(
+            self._file.filehandle.path,
+            dtype=page.dtype,
+            mode="r",
+            offset=page.dataoffsets[0],
+            shape=page.shape,
+            order="C",
+        )
+
+    def asarray(self) -> np.ndarray:
+        with self._lock:
+            return self._page.asarray()
+
+    def read(self, rows: slice, cols: slice) -> np.ndarray:
+        """
+        Read image[rows, cols]. Tiled pages only decode the tiles overlapping
+        the region.
+        """
+        mapped = self.memmap()
+        if mapped is not None:
+            return np.array(mapped[rows, cols])
+
+        page = self._page
+        if not page.is_tiled:
+            return self.asarray()[rows, cols]
+
+        height, width = page.shape[:2]
+        row_range = range(*rows.indices(height))
+        col_range = range(*cols.indices(width))
+        if not row_range or not col_range:
+            return np.zeros((len(row_range), len(col_range)), dtype=page.dtype)
+
+        # Read the ascending block which covers the slices, then step in it
+        r0, r1 = min(row_range), max(row_range) + 1
+        c0, c1 = min(col_range), max(col_range) + 1
+        th, tw = page.tilelength, page.tilewidth
+        across = -(-width // tw)
+
+        region = np.zeros((r1 - r0, c1 - c0), dtype=page.dtype)
+        fh = self._file.filehandle
+        with self._lock:
+            for ty in range(r0 // th, (r1 - 1) // th + 1):
+                for tx in range(c0 // tw, (c1 - 1) // tw + 1):
+                    i = ty * across + tx
+                    fh.seek(page.dataoffsets[i])
+                    tile = page.decode(fh.read(page.databytecounts[i]), i)[0]
+                    tile = tile.reshape(th, tw)
+
+                    y0, x0 = ty * th, tx * tw
+                    ys, ye = max(r0, y0), min(r1, y0 + th)
+                    xs, xe = max(c0, x0), min(c1, x0 + tw)
+                    region[ys - r0 : ye - r0, xs - c0 : xe - c0] = tile[
+                        ys - y0 : ye - y0, xs - x0 : xe - x0
+                    ]
+
+        return region[
+            row_range[0] - r0 :: row_range.step, col_range[0] - c0 :: col_range.step
+        ]
+
+
+class _OpenFile:
+    """An open TIFF file and the pages read from it"""
+
+    def __init__(self, path: str):
+        self.file = tiff.TiffFile(path)
+        self.lock = threading.Lock()
+        self.pages: dict[int, _Page] = {}
+
+    def page(self, index: int) -> _Page:
+        if index not in self.pages:
+            self.pages[index] = _Page(self.file, index, self.lock)
+
+        return self.pages[index]
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RunDataset:
+    """
+    Random access to the images of a polar_dep run.
+
+    output is the output_folder of the run, or its run container file.
+    The index (polarizer angle -> cn, pos, neg, scan_info, pixel maps) is
+    built once and cached next to the output, and rebuilt only when the
+    files change. Uncompressed images are memory mapped, compressed ones are
+    decoded on demand and kept in an LRU cache of cache_size images, so a
+    whole run can be analysed with less memory than the dataset. At most
+    max_open_files files are kept open, and a run container is opened once
+    for all of its pages.
+    """
+
+    def __init__(
+        self,
+        output: str,
+        log_folder: str = None,
+        cache_size: int = 8,  # number of decoded images kept in memory
+        index_path: str = None,  # where the index is cached
+        max_open_files: int = 16,
+    ):
+        self.output = str(output)
+        self.log_folder = None if log_folder is None else str(log_folder)
+        self.cache_size = cache_size
+        self.max_open_files = max_open_files
+        self.is_container = os.path.isfile(self.output)
+
+        if index_path is None:
+            if self.is_container:
+                index_path = self.output + ".index.json"
+            else:
+                index_path = os.path.join(self.output, ".run_index.json")
+        self.index_path = index_path
+
+        self._files: OrderedDict = OrderedDict()  # path -> _OpenFile
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for file in self._files.values():
+                file.close()
+            self._files.clear()
+            self._cache.clear()
+
+    # Index
+
+    def _signature(self) -> list:
+        """Modification times which invalidate the cached index"""
+        paths = [self.output]
+        if self.log_folder is not None:
+            paths.append(self.log_folder)
+
+        return [[p, os.stat(p).st_mtime_ns, os.stat(p).st_size] for p in paths]
+
+    def _scan_folder(self) -> list[dict]:
+        entries = []
+        for path in sorted(glob(os.path.join(self.output, "*.tif*"))):
+            match = _IMAGE_NAME.match(os.path.basename(path))
+            if match is not None:
+                kind, angle = match.groups()
+                entries.append({"angle": float(angle), "kind": kind, "path": path})
+
+        if self.log_folder is not None:
+            for path in sorted(glob(os.path.join(self.log_folder, "*"))):
+                match = _LOG_NAME.match(os.path.basename(path))
+                if match is not None:
+                    angle, kind = match.groups()
+                    kind = kind.replace(".yaml", "")
+                    entries.append({"angle": float(angle), "kind": kind, "path": path})
+
+        return entries
+
+    def _scan_container(self) -> list[dict]:
+        entries = []
+        for page, record in enumerate(read_records(self.output)):
+            if record.get("polarizer") is None:
+                continue  # e.g. frames of a movie
+            entry = {
+                "angle": float(record["polarizer"]),
+                "kind": record["kind"],
+                "path": self.output,
+                "page": page,
+                "metadata": record,
+            }
+            entries.append(entry)
+            if record.get("scan") is not None:
+                entries.append(
+                    {
+                        "angle": entry["angle"],
+                        "kind": "scan_info",
+                        "data": record["scan"],
+                    }
+                )
+
+        return entries
+
+    def _load_index(self) -> dict[float, dict[str, dict]]:
+        signature = self._signature()
+        entries = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                cached = json.load(f)
+            if cached["signature"] == signature:
+                entries = cached["entries"]
+
+        if entries is None:
+            entries = (
+                self._scan_container() if self.is_container else self._scan_folder()
+            )
+            try:
+                with open(self.index_path, "w") as f:
+                    # Creating the file changes the mtime of the folder, so
+                    # the signature is taken after it
+                    json.dump({"signature": self._signature(), "entries": entries}, f)
+            except OSError:
+                pass  # read-only dataset, the index is rebuilt next time
+
+        index = {}
+        for entry in entries:
+            # The last entry wins if an image was captured twice
+            index.setdefault(entry["angle"], {})[entry["kind"]] = entry
+
+        return index
+
+    @property
+    def angles(self) -> list[float]:
+        return sorted(self._index)
+
+    def kinds(self, angle: float) -> list[str]:
+        return sorted(self._index.get(float(angle), {}))
+
+    def _entry(self, angle: float, kind: str) -> dict:
+        try:
+            return self._index[float(angle)][kind]
+        except KeyError:
+            raise KeyError(f"No {kind} image at {angle} deg") from None
+
+    def metadata(self, angle: float, kind: str) -> dict:
+        """Metadata stored with the image (run containers only)"""
+        return self._entry(angle, kind).get("metadata", {})
+
+    def scan_info(self, angle: float) -> dict:
+        """Angles, intensities and fit parameters of the crossed nicols scan"""
+        entry = self._entry(angle, "scan_info")
+        if "data" in entry:
+            return entry["data"]
+
+        with open(entry["path"], "rb") as f:
+            return yaml.safe_load(f)
+
+    # Images
+
+    def _page(self, angle: float, kind: str) -> _Page:
+        entry = self._entry(angle, kind)
+        if kind == "scan_info":
+            raise KeyError("scan_info is not an image")
+
+        path = entry["path"]
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+            else:
+                self._files[path] = _OpenFile(path)
+                while len(self._files) > self.max_open_files:
+                    self._files.popitem(last=False)[1].close()
+
+            return self._files[path].page(entry.get("page", 0))
+
+    def image(self, angle: float, kind: str) -> np.ndarray:
+        """
+        The image of kind (cn, pos, neg, cn_angle, ...) at a polarizer angle.
+        Uncompressed images are returned as read-only memory maps.
+        """
+        page = self._page(angle, kind)
+        mapped = page.memmap()
+        if mapped is not None:
+            return mapped
+
+        key = (float(angle), kind)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        image = page.asarray()
+        image.flags.writeable = False
+        with self._lock:
+            self._cache[key] = image
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return image
+
+    def region(self, angle: float, kind: str, rows: slice, cols: slice) -> np.ndarray:
+        """
+        image(angle, kind)[rows, cols], reading only the part of the file
+        which covers the region
+        """
+        key = (float(angle), kind)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key][rows, cols]
+
+        return self._page(angle, kind).read(rows, cols)
+
+    def __iter__(self):
+        """Iterate over (angle, {kind: image}) in the order of the angle"""
+        for angle in self.angles:
+            kinds = [k for k in self.kinds(angle) if k != "scan_info"]
+            yield angle, {kind: self.image(angle, kind) for kind in kinds}
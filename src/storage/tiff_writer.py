@@ -0,0 +1,140 @@
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import tifffile as tiff
+
+# Marks the end of the write queue
+_STOP = object()
+
+
+class WriteMetrics:
+    """
+    Latency statistics of TiffWriter.
+
+    write time: time spent encoding and writing a file
+    latency: time from TiffWriter.write until the file is on disk
+    """
+
+    def __init__(self):
+        self.count: int = 0
+        self.bytes: int = 0
+        self.total_write_time: float = 0
+        self.max_write_time: float = 0
+        self.total_latency: float = 0
+        self.max_latency: float = 0
+
+    def add(self, nbytes: int, write_time: float, latency: float):
+        self.count += 1
+        self.bytes += nbytes
+        self.total_write_time += write_time
+        self.max_write_time = max(self.max_write_time, write_time)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self) -> dict:
+        count = max(self.count, 1)
+        return {
+            "count": self.count,
+            "bytes": self.bytes,
+            "mean_write_time": self.total_write_time / count,
+            "max_write_time": self.max_write_time,
+            "mean_latency": self.total_latency / count,
+            "max_latency": self.max_latency,
+            "throughput": self.bytes / max(self.total_write_time, 1e-9),  # B/s
+        }
+
+
+class TiffWriter:
+    """
+    Write TIFF files on a background thread.
+
+    write() only puts the image into a bounded queue and returns, so the
+    measurement can continue while the file goes to disk. It blocks when the
+    queue is full. The image must not be modified after it is handed over.
+    The returned future is done when the file is written, e.g. to confirm a
+    save without waiting. flush() is a barrier which waits until every
+    queued image is written and re-raises the first write error.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4,  # number of images waiting to be written
+        compression: str = None,  # e.g. "zlib", None for uncompressed
+        fsync: bool = False,  # force every file to the disk before the next one
+    ):
+        self.maxsize = maxsize
+        self.compression = compression
+        self.fsync = fsync
+        self.metrics = WriteMetrics()
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread: threading.Thread = None
+        self._error: Exception = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, path: str, image: np.ndarray) -> Future:
+        self.check()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+
+        saved = Future()
+        self._queue.put((str(path), image, time.perf_counter(), saved))
+
+        return saved
+
+    def check(self):
+        if self._error is not None:
+            raise RuntimeError("Failed to write an image") from self._error
+
+    def flush(self):
+        """Wait until all queued images are written"""
+        self._queue.join()
+        self.check()
+
+    def close(self):
+        """Flush the queue and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+        self.check()
+
+    def _save(self, path: str, image: np.ndarray):
+        with open(path, "wb") as f:
+            tiff.imsave(f, image, compression=self.compression)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            path, image, queued_at, saved = item
+            try:
+                start = time.perf_counter()
+                self._save(path, image)
+                end = time.perf_counter()
+                self.metrics.add(image.nbytes, end - start, end - queued_at)
+                saved.set_result(path)
+            except Exception as error:
+                # Keep writing the other images and report the first error
+                if self._error is None:
+                    self._error = error
+                saved.set_exception(error)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,139 @@
+"""
+polarizerの角度依存性を複数の温度で測定するプログラム
+
+The temperature controller is ramped to every setpoint of the
+temperature_sweep section of the configuration, and the polar_dep sequence
+starts as soon as the sampled temperature has settled. Images of a setpoint
+are saved in {output_folder}/{setpoint}K while the next ramp is running.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import copy
+import os
+
+from instr.CS505MU import CS505MU
+from instr.ITC503 import ITC503
+from instr.Mark102 import Mark102
+from instr.temperature_sampler import (
+    SettlingCriteria,
+    TemperatureSampler,
+    itc503_reader,
+)
+from polar_dep import Config, Sequence
+
+# Simulated optical bench for development
+# from instr_mock.mock_camera import MockCamera as CS505MU
+# from instr_mock.mock_itc503 import MockITC503 as ITC503
+# from instr_mock.mock_stage import MockStage as Mark102
+
+import yaml
+
+
+class TemperatureSweep:
+    """
+    Run a Sequence at every setpoint of config.setpoints
+
+    make_sequence(config) builds the Sequence of a setpoint, and the optional
+    post_process(sequence, setpoint) is called after its images are saved.
+    Both the saving and post_process run on a background thread, and their
+    errors are re-raised before the next setpoint is measured.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        controller,  # set_temperature(setpoint)
+        sampler: TemperatureSampler,
+        make_sequence,
+        post_process=None,
+    ):
+        self.config = config
+        self.controller = controller
+        self.sampler = sampler
+        self.make_sequence = make_sequence
+        self.post_process = post_process
+
+        self.criteria = SettlingCriteria(
+            tolerance=config.settle_tolerance,
+            max_rate=config.settle_max_rate,
+            window=config.settle_window,
+        )
+        # Seconds waited until the temperature settled at each setpoint
+        self.settle_times: dict[float, float] = {}
+
+    def setpoint_config(self, setpoint: float) -> Config:
+        """Copy of the configuration which saves into {folder}/{setpoint}K"""
+        config = copy.deepcopy(self.config.config)
+        config["output_folder"] = f"{self.config.output_folder}/{setpoint}K"
+        config["log_folder"] = f"{self.config.log_folder}/{setpoint}K"
+        config.setdefault("output", {})["path"] = f"{config['output_folder']}/run.tif"
+
+        os.makedirs(config["output_folder"], exist_ok=True)
+        os.makedirs(config["log_folder"], exist_ok=True)
+
+        return Config(config)
+
+    def _finish(self, sequence: Sequence, setpoint: float) -> None:
+        sequence.finish()
+        if self.post_process is not None:
+            self.post_process(sequence, setpoint)
+
+    def measure(self, setpoint: float) -> Sequence:
+        """
+        Measure at setpoint once the temperature has settled. The images may
+        still be saved in the background when this returns.
+        """
+        self.controller.set_temperature(setpoint)
+        print(f"Waiting for {setpoint} K")
+        self.settle_times[setpoint] = self.sampler.wait_until_settled(
+            setpoint, self.criteria, timeout=self.config.settle_timeout
+        )
+        print(f"Settled in {self.settle_times[setpoint]:.0f} s")
+
+        sequence = self.make_sequence(self.setpoint_config(setpoint))
+        sequence.temperature = self.sampler.latest()
+        try:
+            sequence.measure()
+        except BaseException:
+            sequence.finish()
+            raise
+
+        return sequence
+
+    def run(self) -> None:
+        pending: Future = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            try:
+                for setpoint in self.config.setpoints:
+                    sequence = self.measure(setpoint)
+
+                    # Only one setpoint is saved at a time
+                    if pending is not None:
+                        pending.result()
+                    pending = executor.submit(self._finish, sequence, setpoint)
+            finally:
+                if pending is not None:
+                    pending.result()
+
+
+if __name__ == "__main__":
+    config_file = "./outputs/conbs_210702/sequence_sweep.yaml"
+
+    with open(config_file, "rb") as f:
+        config = Config(yaml.safe_load(f))
+
+    with ITC503() as controller, TemperatureSampler(
+        itc503_reader(controller)
+    ) as sampler, Mark102(init_position=True) as stage, CS505MU(
+        exposure_time=100
+    ) as camera:
+        sampler.wait_for_reading()
+
+        sweep = TemperatureSweep(
+            config,
+            controller,
+            sampler,
+            make_sequence=lambda c: Sequence(c, stage=stage, camera=camera),
+        )
+        sweep.run()
+
+    print("Settling times:", sweep.settle_times)
@@ -0,0 +1,67 @@
+from src.processing.accumulator import FrameAccumulator
+
+import numpy as np
+from PIL import Image
+import pytest
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 4096, (16, 24)).astype("uint16") for _ in range(8)]
+
+
+def test_mean_and_sum(frames):
+    acc = FrameAccumulator()
+    for frame in frames:
+        acc.add(frame)
+
+    stack = np.stack(frames).astype("float64")
+    assert acc.count == 8
+    assert np.all(acc.sum() == stack.sum(axis=0))
+    assert np.allclose(acc.mean(), stack.mean(axis=0))
+    assert np.all(acc.mean(dtype="int16") == stack.mean(axis=0).astype("int16"))
+
+
+def test_sum_is_read_only(frames):
+    acc = FrameAccumulator()
+    acc.add(frames[0])
+
+    with pytest.raises(ValueError):
+        acc.sum()[0, 0] = 1
+
+
+def test_variance(frames):
+    acc = FrameAccumulator(variance=True)
+    for frame in frames:
+        acc.add(frame)
+
+    assert np.allclose(acc.variance(), np.stack(frames).astype("float64").var(axis=0))
+
+
+def test_variance_not_tracked(frames):
+    acc = FrameAccumulator()
+    acc.add(frames[0])
+
+    with pytest.raises(RuntimeError):
+        acc.variance()
+
+
+def test_reset_reuses_buffer(frames):
+    acc = FrameAccumulator()
+    acc.add(frames[0])
+    buffer = acc._sum
+
+    acc.reset()
+    acc.add(Image.fromarray(frames[1]))
+
+    assert acc._sum is buffer
+    assert np.all(acc.mean() == frames[1])
+
+
+def test_mean_into_out(frames):
+    acc = FrameAccumulator()
+    out = np.empty(frames[0].shape, dtype="float64")
+    acc.add(frames[0])
+
+    assert acc.mean(out=out) is out
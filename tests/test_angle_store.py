@@ -0,0 +1,23 @@
+from src.processing.angle_store import AngleStore
+
+
+def test_sorted_running_mean():
+    store = AngleStore(resolution=0.01)
+
+    for angle, intensity in [(10, 1), (5, 2), (10.001, 3), (7.5, 4), (5, 4), (5, 6)]:
+        store.add(angle, intensity)
+
+    assert len(store) == 3
+    assert store.angles == [5, 7.5, 10]
+    assert store.means == [4, 4, 2]
+    assert store.counts == [3, 1, 2]
+
+
+def test_clear():
+    store = AngleStore()
+    store.add(1, 1)
+    store.clear()
+
+    assert len(store) == 0
+    assert store.add(2, 5) == 0
+    assert store.means == [5]
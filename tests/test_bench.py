@@ -0,0 +1,135 @@
+from src.instr_mock.bench import SENSOR_SHAPE, OpticalBench
+from src.instr_mock.mock_camera import MockCamera
+from src.instr_mock.mock_itc503 import MockITC503
+from src.instr_mock.mock_qwp import MockQWP
+from src.instr_mock.mock_stage import MockStage
+from src.polar_dep import Config, Sequence
+
+import time
+
+import numpy as np
+import pytest
+import yaml
+
+
+@pytest.fixture
+def bench():
+    return OpticalBench(time_scale=0, temperature=10, seed=0)
+
+
+def test_crossed_nicols(bench):
+    stage = MockStage(init_position=True, bench=bench)
+
+    def transmission(analyzer):
+        stage.move(analyzer, axis=2)
+        return bench.transmission()
+
+    stage.move(10, axis=1)
+    up, down = transmission(163)
+    assert up == pytest.approx(down)
+    assert up < transmission(162)[0] and up < transmission(164)[0]
+
+    # The domains appear bright and dark on opposite sides
+    assert transmission(161)[0] < transmission(161)[1]
+    assert transmission(165)[0] > transmission(165)[1]
+
+    # No contrast above the transition temperature
+    bench.set_temperature(bench.tc + 1)
+    assert transmission(161)[0] == pytest.approx(transmission(161)[1])
+
+
+def test_intensity_follows_exposure(bench):
+    MockStage(bench=bench).move(168, axis=2)
+    camera = MockCamera(exposure_time=100, bench=bench)
+    roi = [1000, 1064, 1000, 1064]
+
+    with camera.readout(roi=roi):
+        short = camera.capture().image
+        camera.change_exposure_time(200)
+        long = camera.capture().image
+
+    assert short.shape == (64, 64)
+    assert short.dtype == np.uint16
+    signal = [image.mean() - bench.dark_level for image in (short, long)]
+    assert signal[1] / signal[0] == pytest.approx(2, rel=0.05)
+
+    # Shot noise grows with the signal
+    assert long.std() > short.std() > 0
+
+
+def test_stream_keeps_the_frame_period():
+    bench = OpticalBench(time_scale=1, temperature=10, seed=0)
+    camera = MockCamera(exposure_time=10, bench=bench)
+    period = max(10, bench.readout_latency()) * 1e-3
+    # The noise field and the expected image are made by the first frame
+    bench.expose(10)
+
+    arrivals = []
+    for image in camera.stream(25):
+        arrivals.append(time.perf_counter())
+
+    assert image.shape == SENSOR_SHAPE
+    # Median, so that a single hiccup of a busy machine does not fail it
+    intervals = np.diff(arrivals)
+    assert np.median(intervals) == pytest.approx(period, rel=0.15)
+
+
+def test_qwp_converts_ellipticity(bench):
+    stage = MockStage(bench=bench)
+    qwp = MockQWP(bench=bench)
+    stage.move(171, axis=2)
+
+    qwp.move(0)
+    up, down = bench.transmission()
+    qwp.move(45)
+    assert bench.transmission() != pytest.approx((up, down))
+
+
+def test_move_latency():
+    bench = OpticalBench(time_scale=1, move_overhead=0)
+    stage = MockStage(speed=100, bench=bench)
+
+    start = time.time()
+    handle = stage.move_async(5, axis=1)
+    assert not handle.done()
+    assert 0 < bench.angle("polarizer") < 5
+
+    handle.wait()
+    assert time.time() - start == pytest.approx(0.05, abs=0.03)
+    assert bench.angle("polarizer") == 5
+
+
+def test_temperature_controller():
+    bench = OpticalBench(time_scale=0.001, temperature=10, thermal_time_constant=50)
+    with MockITC503(bench=bench) as controller:
+        controller.set_temperature(50)
+        time.sleep(0.01)
+        halfway = float(controller.read_temperature(1))
+        time.sleep(0.5)
+
+        assert 10 < halfway < 50
+        assert float(controller.read_temperature(1)) == pytest.approx(50, abs=0.01)
+
+
+def test_temperature_steps_without_latency(bench):
+    MockITC503(bench=bench).set_temperature(50)
+
+    assert bench.temperature == 50
+
+
+def test_sequence_finds_crossed_nicols(bench, tmp_path):
+    with open("./tests/sequence_example.yaml", "rb") as f:
+        config = Config(yaml.safe_load(f))
+    config.log_folder = tmp_path
+    config.angle_start = 10
+
+    seq = Sequence(
+        config,
+        stage=MockStage(bench=bench),
+        camera=MockCamera(bench=bench),
+    )
+    seq.stage.move(10, axis=1)
+    slope, cn_angle, _ = seq.crossed_nicols_scan()
+
+    assert slope > 0
+    assert cn_angle == pytest.approx(173 - 10, abs=0.1)
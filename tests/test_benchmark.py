@@ -0,0 +1,98 @@
+from src.benchmark import (
+    Stopwatch,
+    bench_crossed_nicols_scan,
+    bench_multi_scan,
+    main,
+    read_history,
+    regressions,
+)
+from src.instr_mock.bench import OpticalBench
+
+import json
+import time
+
+import pytest
+
+
+def record(frames_per_s, seconds_per_step, machine="lab", time_scale=0):
+    return {
+        "machine": machine,
+        "settings": {"time_scale": time_scale},
+        "results": {
+            "multi_scan": {"frames_per_s": frames_per_s},
+            "crossed_nicols_scan": {"seconds_per_step": seconds_per_step},
+        },
+    }
+
+
+def test_stopwatch():
+    watch = Stopwatch()
+
+    def frames():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    assert list(watch.wrap_iterator("capture", frames)()) == [0, 1, 2]
+    assert watch.wrap("add", lambda x: x + 1)(1) == 2
+    assert watch.seconds["capture"] == pytest.approx(0.03, abs=0.02)
+    assert watch.seconds["add"] < watch.seconds["capture"]
+
+
+def test_simulation_is_not_counted():
+    bench = OpticalBench(time_scale=0, temperature=10, seed=0)
+    result = bench_multi_scan(bench, n=8)
+
+    # Without latencies a frame costs the averaging, not making the frame
+    ms_per_frame = 1e3 / result["frames_per_s"]
+    assert ms_per_frame == pytest.approx(result["ms_per_frame_compute"], rel=0.2)
+
+
+def test_crossed_nicols_scan_split(tmp_path):
+    bench = OpticalBench(time_scale=0, temperature=10, seed=0)
+    result = bench_crossed_nicols_scan(bench, str(tmp_path))
+
+    parts = ("move", "capture", "compute", "fit")
+    assert sum(result[p] for p in parts) == pytest.approx(result["seconds_per_step"])
+    assert all(result[p] >= 0 for p in parts)
+    assert (tmp_path / "10_scan_info.yaml").exists()
+
+
+def test_regressions():
+    history = [record(10, 1.0), record(12, 1.1), record(11, 1.0)]
+
+    assert regressions(record(10.5, 1.05), history) == []
+
+    found = regressions(record(5, 2.0), history)
+    assert len(found) == 2
+    assert found[0].startswith("multi_scan.frames_per_s")
+
+    # Runs on other machines or with other latencies are not compared
+    assert regressions(record(5, 2.0, machine="laptop"), history) == []
+    assert regressions(record(5, 2.0, time_scale=1), history) == []
+
+
+def test_small_times_are_noise():
+    history = [record(10, 0.001)]
+
+    assert regressions(record(10, 0.003), history) == []
+    assert regressions(record(10, 0.05), history) != []
+
+
+def test_main_appends_history(tmp_path):
+    history = tmp_path / "history.jsonl"
+    args = ["--history", str(history), "--time-scale", "0"]
+
+    assert main(args + ["--only", "live_view", "graph"]) == 0
+    assert main(args + ["--only", "live_view", "graph"]) == 0
+
+    records = read_history(history)
+    assert len(records) == 2
+    assert set(records[0]["results"]) == {"live_view", "graph"}
+    assert records[0]["results"]["graph"]["ms_per_update"] > 0
+
+    # A much slower result fails the run
+    records[1]["results"]["graph"]["ms_per_update"] *= 1e-6
+    history.write_text(json.dumps(records[1]) + "\n")
+    assert main(args + ["--only", "graph", "--no-save"]) == 1
+    assert len(read_history(history)) == 1
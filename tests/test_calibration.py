@@ -0,0 +1,65 @@
+from src.storage.calibration import CalibrationStore
+
+import pytest
+
+
+@pytest.fixture
+def store(tmp_path):
+    with CalibrationStore(str(tmp_path / "calibration.db")) as store:
+        yield store
+
+
+def test_lookup_latest(store):
+    store.add(0, [4, 173, 523], temperature=10, date="2021-07-01")
+    store.add(0, [4, 173.5, 520], temperature=10, date="2021-07-02")
+    store.add(0, [4, 172, 530], temperature=30, date="2021-07-03")
+
+    assert store.lookup(0, temperature=10)["cn_angle"] == 173.5
+    assert store.lookup(0, temperature=29.8)["cn_angle"] == 172
+    assert store.lookup(0, temperature=20) is None
+    assert store.lookup(10, temperature=10) is None
+
+
+def test_interpolate(store):
+    store.add(0, [4, 173, 520])
+    store.add(10, [6, 163, 540])
+
+    assert store.interpolate(5) == pytest.approx([5, 168, 530])
+    assert store.interpolate(10) == pytest.approx([6, 163, 540])
+    # A single neighbour: the analyzer follows the polarizer
+    assert store.interpolate(12) == pytest.approx([6, 161, 540])
+
+
+def test_interpolate_across_zero(store):
+    store.add(170, [4, 3, 520])
+    store.add(180, [4, 353, 520])
+
+    assert store.interpolate(175)[1] == pytest.approx(358)
+
+
+def test_empty_store(store):
+    assert store.interpolate(0) is None
+
+
+def test_import_scan_info(store):
+    assert store.import_scan_info("tests", temperature=10) == 1
+    assert store.lookup(0, temperature=10)["cn_angle"] == 173
+
+
+def test_optimizer_entries(store):
+    # The optimizer stores only the analyzer and QWP angles
+    store.add(6, [None, 165.1, None], qwp=310)
+    store.add(10, [6, 163, 540])
+
+    assert store.lookup(6) is None
+    assert store.interpolate(8) == pytest.approx([6, 165, 540])
+    assert store.lookup(6, fitted=False)["qwp"] == 310
+    assert store.interpolate(6, qwp=310, fitted=False) == [None, 165.1, None]
+
+
+def test_entries_without_temperature(store):
+    store.add(0, [4, 173, 520], temperature=10)
+    store.add(10, [6, 163, 540])
+
+    assert [e["polarizer"] for e in store.entries()] == [10]
+    assert [e["polarizer"] for e in store.entries(temperature=12)] == [0]
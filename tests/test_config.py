@@ -1,5 +1,6 @@
 from src.polar_dep import Config
 
+import pytest
 import yaml
 
 
@@ -26,3 +27,30 @@ def test_config_attrs():
     assert cfg.cn_info == None
     assert cfg.output_folder == "./outputs/output"
     assert cfg.log_folder == "./outputs/log"
+
+
+def test_config_defaults():
+    with open("./tests/sequence_example.yaml", "rb") as f:
+        cfg = Config(yaml.safe_load(f))
+
+    assert cfg.cn_scan_mode == "grid"
+    assert cfg.cn_tolerance == 0.02
+    assert cfg.cn_max_points == 12
+    assert cfg.calibration_path is None
+    assert cfg.calibration_window == 2
+    assert cfg.calibration_skip_scan is False
+    assert cfg.output_format == "tiff"
+    assert cfg.container_path == "./outputs/output/run.tif"
+    assert cfg.setpoints == []
+    assert cfg.settle_tolerance == 0.1
+    assert cfg.settle_max_rate == 0.05
+    assert cfg.settle_window == 60
+
+
+def test_config_validation():
+    with open("./tests/sequence_example.yaml", "rb") as f:
+        config = yaml.safe_load(f)
+    config["crossed_nicols"] = {"mode": "adaptive", "max_points": 2}
+
+    with pytest.raises(ValueError):
+        Config(config)
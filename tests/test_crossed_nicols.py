@@ -0,0 +1,80 @@
+from src.processing.crossed_nicols import (
+    AdaptiveSearch,
+    ScanStack,
+    bin_image,
+    fit_parabola,
+    fit_parabola_map,
+)
+
+import numpy as np
+import pytest
+
+
+def parabola(angles, cn_angle=172.7):
+    return 4 * (np.asarray(angles) - cn_angle) ** 2 + 523
+
+
+def test_fit_parabola():
+    angles = np.arange(171, 175, 0.2)
+    rng = np.random.default_rng(0)
+    intensities = parabola(angles) + rng.normal(0, 0.5, len(angles))
+
+    (slope, cn_angle, cn_intensity), error = fit_parabola(angles, intensities)
+
+    assert slope == pytest.approx(4, rel=0.05)
+    assert cn_angle == pytest.approx(172.7, abs=0.02)
+    assert cn_intensity == pytest.approx(523, abs=1)
+    assert 0 < error < 0.02
+
+
+def test_fit_parabola_without_noise_estimate():
+    _, error = fit_parabola([171, 172, 173], parabola([171, 172, 173]))
+
+    assert error == np.inf
+
+
+@pytest.mark.parametrize("cn_angle", [170.6, 172.7, 175.3])
+def test_adaptive_search(cn_angle):
+    rng = np.random.default_rng(1)
+    search = AdaptiveSearch(171, 175, tolerance=0.05, max_points=12)
+
+    angle = search.next_angle()
+    while angle is not None:
+        search.add(angle, parabola(angle, cn_angle) + rng.normal(0, 0.5))
+        angle = search.next_angle()
+
+    angles, _ = search.result()
+    assert len(angles) < 20
+    assert angles == sorted(angles)
+    assert search.params[1] == pytest.approx(cn_angle, abs=0.1)
+
+
+def test_bin_image():
+    image = np.arange(30).reshape(5, 6)
+
+    binned = bin_image(image, 2)
+
+    assert binned.shape == (2, 3)
+    assert binned[0, 0] == 0 + 1 + 6 + 7
+
+
+def test_fit_parabola_map():
+    angles = np.arange(171, 175, 0.2)
+    cn_angles = np.linspace(172, 174, 12).reshape(3, 4)
+    stack = 4 * (angles[:, None, None] - cn_angles) ** 2 + 523
+
+    cn_angle, curvature, residual = fit_parabola_map(angles, stack, chunk_size=5)
+
+    assert np.allclose(cn_angle, cn_angles, atol=1e-4)
+    assert np.allclose(curvature, 4, atol=1e-4)
+    assert np.all(residual < 1e-2)
+
+
+def test_scan_stack_averages():
+    stack = ScanStack(capacity=2, binning=2)
+    image_sum = np.full((4, 6), 40, dtype="int64")
+
+    stack.add(171, image_sum, count=4)
+
+    assert stack.stack().shape == (1, 2, 3)
+    assert np.all(stack.stack() == 10)
@@ -0,0 +1,56 @@
+from src.instr.frame import Frame, FramePool
+
+import numpy as np
+import pytest
+
+
+def test_pool_reuses_buffers():
+    pool = FramePool(size=2)
+    image = np.arange(12, dtype="uint16").reshape(3, 4)
+
+    frame = pool.frame(image, frame_count=1, exposure_time=100)
+    buffer = frame.image
+
+    assert np.all(frame.image == image)
+    assert frame.image is not image
+    assert frame.frame_count == 1
+    assert frame.exposure_time == 100
+
+    frame.release()
+    with pool.frame(image * 2) as frame:
+        assert frame.image is buffer
+        assert np.all(np.asarray(frame) == image * 2)
+
+    assert pool.available == 2
+
+
+def test_pool_exhausted():
+    pool = FramePool(size=2)
+    image = np.zeros((3, 4), dtype="uint16")
+
+    frames = [pool.frame(image), pool.frame(image)]
+
+    with pytest.raises(RuntimeError):
+        pool.frame(image)
+
+    # Garbage collected frames return their buffers
+    del frames
+    assert pool.available == 2
+
+
+def test_pool_shape_change():
+    pool = FramePool(size=1)
+
+    old = pool.frame(np.zeros((3, 4), dtype="uint16"))
+    new = pool.frame(np.zeros((2, 2), dtype="uint16"))
+    old.release()
+
+    assert new.shape == (2, 2)
+    assert pool.available == 0
+
+
+def test_frame_to_pil():
+    frame = Frame(np.ones((3, 4), dtype="uint16"))
+
+    assert frame.to_pil().size == (4, 3)
+    assert not hasattr(frame, "__dict__")
@@ -0,0 +1,114 @@
+from src.adjust_stages import SubscriberThread
+from src.processing.frame_broker import BLOCK, LATEST, SKIP, FrameBroker
+
+from contextlib import contextmanager
+import time
+
+import numpy as np
+import pytest
+
+
+class StreamingCamera:
+    def __init__(self, fail_after=None):
+        self.exposure_time = 1
+        self.binning = 1
+        self.streams = 0
+        self.fail_after = fail_after
+
+    @contextmanager
+    def readout(self, roi=None, binning=1):
+        previous = self.binning
+        self.binning = binning
+        try:
+            yield self
+        finally:
+            self.binning = previous
+
+    def stream(self, n=None, discard=0):
+        self.streams += 1
+        count = 0
+        while True:
+            time.sleep(1e-3)
+            count += 1
+            if self.fail_after is not None and count > self.fail_after:
+                raise OSError("camera disconnected")
+            yield np.full((4, 4), self.binning, dtype="uint16")
+
+
+def test_fan_out():
+    camera = StreamingCamera()
+    broker = FrameBroker(camera)
+    live = broker.subscribe("live", maxsize=1, policy=LATEST)
+    stats = broker.subscribe("stats", maxsize=1, policy=SKIP)
+    recorder = broker.subscribe("recorder", maxsize=1, policy=BLOCK)
+
+    with broker:
+        frames = list(recorder.take(5, timeout=1))
+        time.sleep(0.02)
+
+    assert [f.frame_count for f in frames] == [1, 2, 3, 4, 5]
+    assert not frames[0].image.flags.writeable
+    assert camera.streams == 1
+
+    # The slow subscribers dropped frames, the recorder did not
+    assert live.dropped > 0 and stats.dropped > 0
+    assert recorder.dropped == 0
+    # LATEST keeps the newest frame, SKIP the oldest one
+    assert live.get_nowait().frame_count > stats.get_nowait().frame_count
+    # Every subscriber got the same frame objects
+    assert stats.delivered + stats.dropped == broker.published
+
+
+def test_readout_switch():
+    camera = StreamingCamera()
+
+    with FrameBroker(camera, binning=4) as broker:
+        with broker.readout(binning=1), broker.subscribe(
+            "recorder", maxsize=2, policy=BLOCK
+        ) as recorder:
+            frames = list(recorder.take(3, timeout=1))
+
+        assert all(np.all(f.image == 1) and f.binning == 1 for f in frames)
+        assert broker.binning == 4
+
+        with broker.subscribe("after", policy=BLOCK) as after:
+            assert after.get(timeout=1).binning == 4
+
+    assert camera.streams == 3
+
+
+def test_error():
+    broker = FrameBroker(StreamingCamera(fail_after=3))
+    subscription = broker.subscribe("live")
+    broker.start()
+    time.sleep(0.05)
+
+    with pytest.raises(RuntimeError):
+        subscription.get(timeout=0.1)
+    with pytest.raises(RuntimeError):
+        broker.stop()
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        FrameBroker(StreamingCamera()).subscribe("live", policy="oldest")
+
+
+def test_frames_queued_before_settle_are_skipped():
+    camera = StreamingCamera()
+    camera.frames_to_buffer = 4
+    broker = FrameBroker(camera)
+    assert broker.stale_frames() == 5
+
+    thread = SubscriberThread(broker, "stats", BLOCK)
+    with broker:
+        # The backlog of the blocked subscription is full
+        time.sleep(0.05)
+        thread.settle()
+        stale = thread.stale_frames
+        frames = [thread._next_frame() for _ in range(stale + 2)]
+        thread.subscription.close()
+
+    assert stale >= 2 + 4 + 1
+    assert all(frame is None for frame in frames[:stale])
+    assert [f.frame_count for f in frames[stale:]] == [stale + 1, stale + 2]
@@ -0,0 +1,92 @@
+from src.processing.live_view import LiveViewProcessor
+
+import threading
+
+import numpy as np
+
+
+def test_lut_and_stats():
+    processor = LiveViewProcessor(bit_depth=12)
+    image = np.full((512, 612), 1600, dtype="uint16")
+    image[0, 0] = 4095
+
+    frame = processor.process(image)
+
+    assert frame.image.dtype == "uint8"
+    assert frame.image.shape == (512, 612)
+    assert frame.image[1, 1] == 1600 >> 4
+    assert frame.image[0, 0] == 255
+    assert np.isclose(frame.mean, image.mean() / 16)
+    assert frame.maximum == 4095 / 16
+
+
+def test_binned_and_decimated():
+    processor = LiveViewProcessor(bit_depth=12, binning=4)
+    image = np.full((2048, 2448), 16 * 4000, dtype="uint16")
+
+    frame = processor.process(image)
+
+    assert frame.image.shape == (512, 612)
+    assert frame.image[0, 0] == 4000 >> 4
+
+
+def test_averaged_reference():
+    processor = LiveViewProcessor(bit_depth=12, gain=2)
+    reference = np.full((10, 10), 800, dtype="uint16")
+
+    processor.memorize(n=4)
+    for level in (768, 832, 784):
+        frame = processor.process(np.full((10, 10), level, dtype="uint16"))
+        assert frame.image.ndim == 2
+    processor.process(np.full((10, 10), 816, dtype="uint16"))
+    assert processor.difference_mode
+
+    # No difference is black, brighter is red and darker is blue
+    assert np.all(processor.process(reference).image == 0)
+    brighter = processor.process(reference + 160).image
+    assert brighter.shape == (10, 10, 3)
+    assert np.all(brighter[..., 0] == processor.colormap[128 + 20, 0])
+    assert np.all(brighter[..., 2] == 0)
+    darker = processor.process(reference // 4).image
+    assert np.all(darker[..., 2] > 0)
+    assert np.all(darker[..., 0] == 0)
+
+    processor.reset()
+    assert np.all(processor.process(reference).image == 50)
+
+
+def test_reset_from_another_thread():
+    processor = LiveViewProcessor(bit_depth=12)
+    image = np.full((64, 64), 800, dtype="uint16")
+    processor.memorize(n=1)
+    processor.process(image)
+    assert processor.difference_mode
+
+    done = threading.Event()
+
+    def click():
+        while not done.is_set():
+            processor.reset()
+            processor.memorize(n=1)
+
+    thread = threading.Thread(target=click)
+    thread.start()
+    try:
+        for _ in range(2000):
+            frame = processor.process(image)
+            assert frame.image.shape[:2] == (64, 64)
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_colored_buffers_are_reused():
+    processor = LiveViewProcessor(bit_depth=12)
+    image = np.full((10, 10), 800, dtype="uint16")
+    processor.memorize(n=1)
+    processor.process(image)
+
+    frames = [processor.process(image).image for _ in range(8)]
+
+    assert len({id(frame) for frame in frames}) == 4
+    assert frames[0] is frames[4]
@@ -0,0 +1,101 @@
+from src.mkgif.make_gif import (
+    GifStream,
+    downsample,
+    list_images,
+    make_movie,
+    temperature,
+)
+
+import subprocess
+import sys
+
+import numpy as np
+from PIL import Image, ImageSequence
+import tifffile as tiff
+import pytest
+
+
+def test_temperature():
+    assert temperature("./images/29k.png") == 29
+    assert temperature("12.5.tif") == 12.5
+
+    with pytest.raises(ValueError):
+        temperature("image.png")
+
+
+def test_list_images(tmp_path):
+    for name in ("5k.png", "30k.png", "12.5.tif", "notes.txt"):
+        (tmp_path / name).touch()
+
+    names = [p.rsplit("/", 1)[1] for p in list_images(str(tmp_path))]
+    assert names == ["30k.png", "12.5.tif", "5k.png"]
+
+    names = [p.rsplit("/", 1)[1] for p in list_images(str(tmp_path), False)]
+    assert names == ["5k.png", "12.5.tif", "30k.png"]
+
+
+def test_downsample():
+    image = np.arange(30 * 40, dtype="float32").reshape(30, 40)
+
+    assert downsample(image, 40) is image
+    assert downsample(image, 20).shape == (15, 20)
+    assert downsample(image, 13).shape == (7, 10)
+
+
+def test_make_gif(tmp_path):
+    for i, temp in enumerate((10, 20, 30)):
+        image = np.full((64, 80), 1000 * (i + 1), dtype="uint16")
+        image[:32] = 0
+        tiff.imsave(tmp_path / f"{temp}.tif", image)
+    Image.fromarray(np.zeros((64, 80), dtype="uint8")).save(tmp_path / "40k.png")
+
+    output = str(tmp_path / "out.gif")
+    make_movie(list_images(str(tmp_path)), output, interval=200, max_size=40, workers=2)
+
+    with Image.open(output) as gif:
+        assert gif.n_frames == 4
+        assert gif.info["loop"] == 0
+        frames, durations = [], []
+        for frame in ImageSequence.Iterator(gif):
+            frames.append(np.array(frame.convert("L")))
+            durations.append(frame.info["duration"])
+
+    assert durations == [200] * 4
+    assert frames[0].shape == (32, 40)
+    # 40k (all black) first, then 30k (brightest)
+    assert frames[0].max() == 0
+    assert frames[1][20, 0] == 255
+    assert frames[1][20, 0] > frames[2][20, 0] > frames[3][20, 0]
+
+
+# Writes n 500 x 500 frames and prints the peak memory of the process in kB
+MEMORY_SCRIPT = """
+import resource, sys
+import numpy as np
+from src.mkgif.make_gif import GifStream
+
+ramp = np.arange(500 * 500).reshape(500, 500)
+with GifStream(sys.argv[2], 100) as stream:
+    for i in range(int(sys.argv[1])):
+        stream.write(((ramp * (i + 1)) >> 8).astype("uint8"))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def test_gif_memory_does_not_grow(tmp_path):
+    pytest.importorskip("resource")
+
+    def peak_kb(n):
+        output = str(tmp_path / f"{n}.gif")
+        result = subprocess.run(
+            [sys.executable, "-c", MEMORY_SCRIPT, str(n), output],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        with Image.open(output) as gif:
+            assert gif.n_frames == n
+        return int(result.stdout)
+
+    # 200 frames are 50 MB when they are kept until the end
+    assert peak_kb(200) - peak_kb(10) < 10_000
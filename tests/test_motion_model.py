@@ -0,0 +1,53 @@
+from src.instr.motion_model import MotionModel, MotionTracker, wait_until_idle
+
+import time
+
+import pytest
+
+
+def test_prior_from_speed():
+    model = MotionModel(speed=5.0, overhead=0.1)
+
+    assert model.predict(1, 10) == pytest.approx(2.1)
+    assert model.predict(2, -5) == pytest.approx(1.1)
+
+
+def test_model_learns_from_moves():
+    model = MotionModel(speed=5.0, overhead=0.1)
+    for distance in (0.2, 1, 4, 20, 40) * 5:
+        model.update(2, distance, 0.05 + distance / 20)
+
+    overhead, slope = model.params(2)
+    assert overhead == pytest.approx(0.05)
+    assert slope == pytest.approx(1 / 20)
+    # The other axis keeps the prior
+    assert model.params(1) == pytest.approx((0.1, 0.2))
+
+
+def test_tracker_finish():
+    tracker = MotionTracker()
+    tracker.reset({1: 0, 2: 0})
+    tracker.finish()
+    assert not tracker.moving
+
+    tracker.start({2: 10})
+    assert tracker.moving
+    assert tracker.predicted_end() > time.perf_counter() + 1
+
+    tracker.finish()
+    assert not tracker.moving
+    assert tracker.positions == {1: 0, 2: 10}
+
+
+def test_wait_until_idle_backs_off():
+    polls = []
+
+    def is_busy():
+        polls.append(time.perf_counter())
+        return len(polls) < 5
+
+    wait_until_idle(is_busy, time.perf_counter(), min_interval=0.01, backoff=2)
+
+    intervals = [b - a for a, b in zip(polls, polls[1:])]
+    assert len(polls) == 5
+    assert intervals[-1] > intervals[0]
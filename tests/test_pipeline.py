@@ -0,0 +1,53 @@
+from src.processing.pipeline import CapturePipeline
+
+import numpy as np
+import pytest
+
+
+class MockCamera:
+    def __init__(self, fail_after: int = None):
+        self.counter = 0
+        self.fail_after = fail_after
+
+    def stream(self, n, discard=0):
+        for i in range(n + discard):
+            if self.fail_after is not None and self.counter >= self.fail_after:
+                raise IOError("Camera disconnected")
+            self.counter += 1
+            if i >= discard:
+                yield np.full((8, 8), self.counter, dtype="uint16")
+
+
+def test_pipeline_saves_averaged_images():
+    saved = {}
+    camera = MockCamera()
+
+    with CapturePipeline(camera, save=saved.__setitem__, discard=1) as pipeline:
+        first = pipeline.submit(3, "first.tif")
+        first.wait_acquired()
+        second = pipeline.submit(4, "second.tif")
+
+    assert first.saved.is_set() and second.saved.is_set()
+    # frames 2, 3, 4 and 6, 7, 8, 9 after discarding one frame per job
+    assert np.all(saved["first.tif"] == 3)
+    assert np.all(saved["second.tif"] == 7)
+    assert saved["first.tif"].dtype == "int16"
+
+
+def test_camera_error_is_propagated():
+    pipeline = CapturePipeline(MockCamera(fail_after=2), save=lambda *_: None)
+    job = pipeline.submit(4, "image.tif")
+
+    with pytest.raises(RuntimeError):
+        job.wait_acquired()
+    with pytest.raises(RuntimeError):
+        pipeline.join()
+
+
+def test_save_error_is_propagated():
+    def save(path, image):
+        raise OSError("Disk full")
+
+    with pytest.raises(RuntimeError):
+        with CapturePipeline(MockCamera(), save=save, discard=0) as pipeline:
+            pipeline.submit(2, "image.tif").wait_saved()
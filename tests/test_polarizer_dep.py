@@ -1,7 +1,13 @@
 from src.polar_dep import Config, Sequence
+from src.instr.interfaces.stage import MoveHandle
+from src.storage.calibration import CalibrationStore
+from src.storage.run_container import read_records
 
+from contextlib import contextmanager
+import sqlite3
 import numpy as np
 from PIL import Image
+import tifffile as tiff
 import yaml
 import pytest
 
@@ -17,20 +23,60 @@ class MockCamera:
 
         return Image.fromarray(image)
 
+    def stream(self, n, *args, **kwargs):
+        for _ in range(n):
+            yield self.capture()
+
     def change_exposure_time(self, exposure_time):
         self.exposure_time = exposure_time
 
 
+class MockRoiCamera(MockCamera):
+    """Camera which reads out only the requested ROI"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.roi = [0, 2448, 0, 2048]
+        self.readouts = []
+
+    @contextmanager
+    def readout(self, roi=None, binning=1):
+        previous = self.roi
+        # Emulate the alignment of the camera by enlarging the ROI
+        self.roi = [roi[0] - 2, roi[1], roi[2] - 4, roi[3]]
+        self.readouts.append(self.roi)
+        try:
+            yield self
+        finally:
+            self.roi = previous
+
+    def capture(self, *args, **kwargs):
+        shape = (self.roi[1] - self.roi[0], self.roi[3] - self.roi[2])
+        image = np.ones(shape) * self.counter
+        self.counter += 1
+
+        return Image.fromarray(image)
+
+
 class MockStage:
     def __init__(self, *args, **kwargs):
         return None
 
+    def is_busy(self):
+        return False
+
     def wait_while_busy(self, *args, **kwargs):
         return None
 
     def move(self, *args, **kwargs):
         return None
 
+    def move_async(self, *args, **kwargs):
+        return MoveHandle(self)
+
+    def move_many(self, *args, **kwargs):
+        return None
+
 
 @pytest.fixture(scope="module")
 def seq():
@@ -62,6 +108,71 @@ def test_cn_scan(seq, tmp_path):
     assert seq.camera.exposure_time == seq.config.scan_time
 
 
+def test_adaptive_cn_scan(seq, tmp_path):
+    seq.config.log_folder = tmp_path
+    seq.config.cn_scan_mode = "adaptive"
+
+    output = seq.adaptive_crossed_nicols_scan()
+
+    with open(tmp_path / f"{seq.current_angle}_scan_info.yaml", "rb") as f:
+        log = yaml.safe_load(f)
+
+    seq.config.cn_scan_mode = "grid"
+
+    assert len(output) == 3
+    assert log["fit_params"] == list(output)
+    assert len(log["angles"]) <= seq.config.cn_max_points
+
+
+def test_adaptive_cn_scan_fallback(seq, tmp_path, monkeypatch):
+    seq.config.log_folder = tmp_path
+    # Not enough points for the parabola fit
+    monkeypatch.setattr(seq.config, "cn_max_points", 2)
+
+    output = seq.adaptive_crossed_nicols_scan()
+
+    with open(tmp_path / f"{seq.current_angle}_scan_info.yaml", "rb") as f:
+        log = yaml.safe_load(f)
+
+    assert len(output) == 3
+    assert len(log["angles"]) == len(seq.scan_angles())
+
+
+def test_cn_pixel_map(seq, tmp_path):
+    seq.config.log_folder = tmp_path
+    seq.config.cn_pixel_map = True
+    seq.config.cn_binning = 256
+
+    seq.crossed_nicols_scan()
+    seq.writer.flush()
+
+    seq.config.cn_pixel_map = False
+
+    for name in ("cn_angle", "curvature", "residual"):
+        image = tiff.imread(tmp_path / f"{seq.current_angle}_{name}.tif")
+        assert image.shape == (2448 // 256, 2048 // 256)
+
+
+def test_calibration_warm_start(seq, tmp_path):
+    seq.calibration = CalibrationStore(str(tmp_path / "calibration.db"))
+    seq.calibration.add(seq.current_angle, [4, 100, 523])
+    seq.config.log_folder = tmp_path
+
+    assert seq.scan_window() == (99, 101)
+    assert seq.known_cn_params() is None
+
+    seq.config.calibration_skip_scan = True
+    assert seq.known_cn_params() == [4, 100, 523]
+
+    seq.crossed_nicols_scan()
+    assert len(seq.calibration.entries()) == 1
+    assert seq.calibration.lookup(seq.current_angle)["cn_angle"] != 100
+
+    seq.config.calibration_skip_scan = False
+    seq.calibration.close()
+    seq.calibration = None
+
+
 def test_domain_capture(seq, tmp_path):
     log_dir = tmp_path / "log"
     output_dir = tmp_path / "output"
@@ -115,3 +226,57 @@ def test_sequence_run(seq, tmp_path):
 
     assert seq.camera.exposure_time != seq.config.scan_time
     assert seq.current_angle == seq.config.angle_end + seq.config.step
+
+
+def test_cn_scan_roi_readout(tmp_path):
+    with open("./tests/sequence_example.yaml", "rb") as f:
+        cfg = Config(yaml.safe_load(f))
+    cfg.log_folder = tmp_path
+    camera = MockRoiCamera()
+    seq = Sequence(cfg, stage=MockStage(), camera=camera)
+
+    seq.crossed_nicols_scan()
+
+    roi = cfg.roi
+    assert camera.readouts == [[roi[0] - 2, roi[1], roi[2] - 4, roi[3]]]
+    assert seq.accumulator.sum().shape == (roi[1] - roi[0] + 2, roi[3] - roi[2] + 4)
+    assert camera.roi == [0, 2448, 0, 2048]
+    assert seq._frame_roi is None
+
+
+def test_container_output(tmp_path):
+    with open("./tests/sequence_example.yaml", "rb") as f:
+        config = yaml.safe_load(f)
+    config["output"] = {"format": "container", "path": str(tmp_path / "run.tif")}
+    seq = Sequence(Config(config), stage=MockStage(), camera=MockCamera())
+    seq.cn_params = (0, 10, 100)
+    seq.temperature = 5.0
+
+    with seq.container, seq.pipeline:
+        seq.cn_capture()
+        seq.capture_domain()
+
+    records = read_records(tmp_path / "run.tif")
+
+    assert [r["kind"] for r in records] == ["cn", "pos", "neg"]
+    assert [r["analyzer"] for r in records] == [10, 13.15, 10 - 3.15]
+    assert records[0]["polarizer"] == seq.current_angle
+    assert records[0]["temperature"] == 5.0
+    assert records[0]["cn_params"] == [0, 10, 100]
+    assert records[1]["frame_count"] == seq._capture_num(
+        seq.config.domain_capture_num, adjust=True
+    )
+    assert tiff.imread(tmp_path / "run.tif", key=2).shape == (2448, 2048)
+
+
+def test_finish_closes_calibration(tmp_path):
+    with open("./tests/sequence_example.yaml", "rb") as f:
+        config = yaml.safe_load(f)
+    config["calibration"] = {"path": str(tmp_path / "calibration.db")}
+    seq = Sequence(Config(config), stage=MockStage(), camera=MockCamera())
+    seq.calibration.add(0, [4, 100, 523])
+
+    seq.finish()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        seq.calibration.entries()
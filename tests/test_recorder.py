@@ -0,0 +1,77 @@
+from src.processing.recorder import Recorder
+from src.storage.run_container import read_records
+
+import threading
+import time
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+
+class StreamingCamera:
+    exposure_time = 2  # ms
+
+    def stream(self, n=None, discard=0):
+        count = 0
+        while n is None or count < n:
+            time.sleep(self.exposure_time * 1e-3)
+            count += 1
+            yield np.full((8, 8), count, dtype="uint16")
+
+
+class LinearSampler:
+    def at(self, timestamp):
+        return timestamp * 2
+
+
+def test_record_n_frames(tmp_path):
+    path = tmp_path / "movie.tif"
+    with Recorder(StreamingCamera(), path, sampler=LinearSampler()) as recorder:
+        assert recorder.record(n=20) == 20
+
+    records = read_records(path)
+    images = tiff.imread(path)
+
+    assert [r["frame_count"] for r in records] == list(range(1, 21))
+    assert np.all(images[:, 0, 0] == np.arange(1, 21))
+    # Temperature in the middle of the exposure
+    record = records[0]
+    assert record["temperature"] == pytest.approx(2 * (record["timestamp"] - 1e-3))
+    assert all(r["kind"] == "frame" for r in records)
+
+
+def test_backpressure(tmp_path):
+    recorder = Recorder(StreamingCamera(), tmp_path / "movie.tif", queue_size=2)
+    append = recorder.container.append
+
+    def slow_append(*args, **kwargs):
+        time.sleep(0.01)
+        return append(*args, **kwargs)
+
+    recorder.container.append = slow_append
+    with recorder:
+        assert recorder.record(n=10) == 10
+
+    assert recorder.max_queued <= 2
+    assert len(read_records(tmp_path / "movie.tif")) == 10
+
+
+def test_stop_and_duration(tmp_path):
+    with Recorder(StreamingCamera(), tmp_path / "movie.tif") as recorder:
+        threading.Timer(0.05, recorder.stop).start()
+        recorded = recorder.record()
+        assert 0 < recorded < 100
+
+        assert recorder.record(duration=0.05) > 0
+
+
+def test_write_error(tmp_path):
+    recorder = Recorder(StreamingCamera(), tmp_path / "movie.tif")
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    recorder.container.append = fail
+    with pytest.raises(RuntimeError):
+        recorder.record()
@@ -0,0 +1,42 @@
+from src.storage.run_container import RunContainer, build_index, read_records
+
+import numpy as np
+import tifffile as tiff
+
+
+def test_append_and_index(tmp_path):
+    path = tmp_path / "run.tif"
+    images = [np.full((300, 400), i, dtype="int16") for i in range(3)]
+
+    with RunContainer(path) as container:
+        container.append(images[0], "cn", polarizer=0, exposure_time=np.int64(100))
+        container.append(images[1], "pos", polarizer=0, analyzer=np.float32(3.5))
+        page = container.append(images[2], "cn", polarizer=10)
+
+        assert page == 2
+        assert container.find("pos", 0) == 1
+        assert container.find("neg", 0) is None
+
+    records = read_records(path)
+    assert records[0] == {"kind": "cn", "polarizer": 0, "exposure_time": 100}
+    assert records[1]["analyzer"] == 3.5
+    assert build_index(records) == {("cn", 0): 0, ("pos", 0): 1, ("cn", 10): 2}
+
+    with tiff.TiffFile(path) as f:
+        assert f.pages[0].is_tiled
+        for page, image in zip(f.pages, images):
+            assert np.all(page.asarray() == image)
+
+
+def test_append_to_existing_file(tmp_path):
+    path = tmp_path / "run.tif"
+    with RunContainer(path) as container:
+        container.append(np.zeros((16, 16), dtype="uint16"), "cn", polarizer=0)
+
+    with RunContainer(path, compression=None, tile=None) as container:
+        assert len(container) == 1
+        container.append(np.ones((16, 16), dtype="uint16"), "cn", polarizer=0)
+
+        assert container.find("cn", 0) == 1
+
+    assert len(read_records(path)) == 2
@@ -0,0 +1,128 @@
+from src.storage.run_container import RunContainer
+from src.storage.run_dataset import RunDataset
+
+import numpy as np
+import tifffile as tiff
+import yaml
+import pytest
+
+
+@pytest.fixture
+def folder_run(tmp_path):
+    output = tmp_path / "output"
+    log = tmp_path / "log"
+    output.mkdir()
+    log.mkdir()
+
+    for angle in (0, 10):
+        for i, kind in enumerate(("cn", "pos", "neg")):
+            image = np.full((64, 48), angle + i, dtype="int16")
+            tiff.imsave(output / f"{kind}_{angle}.tif", image)
+        with open(log / f"{angle}_scan_info.yaml", "w") as f:
+            yaml.dump({"fit_params": [4, 173 - angle, 523]}, f)
+    tiff.imsave(output / "pos_20.tif", np.zeros((64, 48)), compression="zlib")
+
+    return output, log
+
+
+def test_folder_index(folder_run):
+    output, log = folder_run
+
+    with RunDataset(output, log) as ds:
+        assert ds.angles == [0, 10, 20]
+        assert ds.kinds(10) == ["cn", "neg", "pos", "scan_info"]
+        assert ds.scan_info(10)["fit_params"] == [4, 163, 523]
+
+        image = ds.image(10, "pos")
+        assert isinstance(image, np.memmap)
+        assert np.all(image == 11)
+        assert np.all(ds.image(20, "pos") == 0)
+
+        with pytest.raises(KeyError):
+            ds.image(5, "cn")
+
+    assert (output / ".run_index.json").exists()
+
+
+def test_cached_index(folder_run, monkeypatch):
+    output, log = folder_run
+    RunDataset(output, log).close()
+
+    def no_scan(self):
+        raise AssertionError("the cached index is not used")
+
+    with monkeypatch.context() as m:
+        m.setattr(RunDataset, "_scan_folder", no_scan)
+        with RunDataset(output, log) as ds:
+            assert ds.angles == [0, 10, 20]
+
+    tiff.imsave(output / "cn_30.tif", np.zeros((64, 48), dtype="int16"))
+    with RunDataset(output, log) as ds:
+        assert ds.angles == [0, 10, 20, 30]
+
+
+def test_lru_cache(folder_run):
+    output, _ = folder_run
+    for angle in (30, 40, 50):
+        tiff.imsave(output / f"cn_{angle}.tif", np.ones((8, 8)), compression="zlib")
+
+    with RunDataset(output, cache_size=2) as ds:
+        first = ds.image(30, "cn")
+        assert ds.image(30, "cn") is first
+        ds.image(40, "cn")
+        ds.image(50, "cn")
+
+        assert list(ds._cache) == [(40, "cn"), (50, "cn")]
+        assert not first.flags.writeable
+
+
+def test_container_region(tmp_path):
+    path = tmp_path / "run.tif"
+    image = np.arange(600 * 520, dtype="int32").reshape(600, 520)
+    with RunContainer(path) as container:
+        container.append(image, "pos", polarizer=0)
+        container.append(image * 2, "cn", polarizer=0, scan={"fit_params": [1]})
+
+    with RunDataset(path) as ds:
+        assert ds.kinds(0) == ["cn", "pos", "scan_info"]
+        assert ds.scan_info(0) == {"fit_params": [1]}
+        assert ds.metadata(0, "pos")["polarizer"] == 0
+
+        rows, cols = slice(250, 530, 3), slice(10, 300)
+        assert np.all(ds.region(0, "pos", rows, cols) == image[rows, cols])
+        assert np.all(ds.region(0, "cn", rows, cols) == image[rows, cols] * 2)
+        assert np.all(ds.image(0, "cn") == image * 2)
+
+        # Every page is read through a single handle
+        assert len(ds._files) == 1
+
+
+def test_container_region_steps(tmp_path):
+    path = tmp_path / "run.tif"
+    image = np.arange(600 * 520, dtype="int32").reshape(600, 520)
+    with RunContainer(path) as container:
+        container.append(image, "pos", polarizer=0)
+
+    with RunDataset(path) as ds:
+        for rows, cols in (
+            (slice(None, None, -1), slice(0, 8)),
+            (slice(530, 250, -3), slice(300, 10, -7)),
+            (slice(-5, None), slice(None, None, 100)),
+            (slice(100, 100), slice(0, 8)),
+            (slice(10, 0), slice(None, None, -1)),
+        ):
+            region = ds.region(0, "pos", rows, cols)
+            assert region.shape == image[rows, cols].shape
+            assert np.all(region == image[rows, cols])
+
+
+def test_open_files_are_bounded(folder_run):
+    output, _ = folder_run
+
+    with RunDataset(output, max_open_files=2) as ds:
+        for angle, images in ds:
+            assert images["pos"].mean() == (0 if angle == 20 else angle + 1)
+
+        assert len(ds._files) == 2
+        closed = [f for f in ds._files.values() if f.file.filehandle.closed]
+        assert closed == []
@@ -0,0 +1,62 @@
+from src.instr.serial_transport import SerialTransport
+
+import pytest
+
+
+class FakeSerial:
+    """Answers each command with the scripted responses"""
+
+    def __init__(self, responses: dict, stale: bytes = b""):
+        self.responses = responses
+        self.timeout = None
+        self.buffer = stale
+        self.written = []
+
+    def reset_input_buffer(self):
+        self.buffer = b""
+
+    def write(self, data: bytes):
+        self.written.append(data)
+        self.buffer += self.responses.get(data, b"")
+
+    def read_until(self, terminator: bytes) -> bytes:
+        idx = self.buffer.find(terminator)
+        end = len(self.buffer) if idx < 0 else idx + len(terminator)
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+
+        return data
+
+    def close(self):
+        pass
+
+
+def test_query():
+    serial = FakeSerial({b"R1\r\n": b"R+00020.0\r"})
+    transport = SerialTransport(serial, terminator=b"\r")
+
+    assert transport.query("R1", timeout=0.5) == "R+00020.0"
+    assert 0 < serial.timeout <= 0.5
+
+
+def test_query_many_in_order():
+    serial = FakeSerial({b"A:1+P400\r\n": b"OK\r\n", b"G:\r\n": b"OK\r\n"})
+    transport = SerialTransport(serial)
+
+    assert transport.query_many(["A:1+P400", "G:"]) == ["OK", "OK"]
+    assert serial.written == [b"A:1+P400\r\n", b"G:\r\n"]
+
+
+def test_unmatched_lines_are_skipped():
+    serial = FakeSerial({b"R1\r\n": b"C\rR+00020.0\r"})
+    transport = SerialTransport(
+        serial, terminator=b"\r", match=lambda command, response: response[0] == "R"
+    )
+
+    assert transport.query("R1") == "R+00020.0"
+
+
+def test_timeout():
+    transport = SerialTransport(FakeSerial({b"R1\r\n": b"R+000"}), timeout=0.1)
+
+    with pytest.raises(TimeoutError):
+        transport.query("R1")
@@ -0,0 +1,17 @@
+from src.instr.sigma_koki import absolute_move_command
+
+import pytest
+
+
+def test_single_axis_command():
+    assert absolute_move_command({2: 173.0}) == "A:2+P69200"
+    assert absolute_move_command({1: -1.5}) == "A:1-P600"
+
+
+def test_two_axes_command():
+    assert absolute_move_command({2: 10, 1: 0.25}) == "A:W+P100+P4000"
+
+
+def test_invalid_axes():
+    with pytest.raises(ValueError):
+        absolute_move_command({1: 0, 3: 0})
@@ -0,0 +1,40 @@
+from src.instr.interfaces.stage import MoveHandle
+
+
+class CountingStage:
+    def __init__(self, busy_polls: int):
+        self.busy_polls = busy_polls
+        self.queries = 0
+        self.waits = 0
+
+    def is_busy(self):
+        self.queries += 1
+        return self.queries <= self.busy_polls
+
+    def wait_while_busy(self):
+        self.waits += 1
+        while self.is_busy():
+            pass
+
+
+def test_done_polls_until_stopped():
+    stage = CountingStage(busy_polls=2)
+    handle = MoveHandle(stage)
+
+    assert not handle.done()
+    assert not handle.done()
+    assert handle.done()
+    assert handle.done()
+    assert stage.queries == 3
+
+
+def test_wait_only_once():
+    stage = CountingStage(busy_polls=3)
+    handle = MoveHandle(stage)
+
+    handle.wait()
+    handle.wait()
+
+    assert stage.waits == 1
+    assert handle.done()
+    assert stage.queries == 4
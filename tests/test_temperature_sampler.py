@@ -0,0 +1,85 @@
+from src.instr.temperature_sampler import (
+    SettlingCriteria,
+    TemperatureLog,
+    TemperatureSampler,
+)
+
+import itertools
+
+import numpy as np
+import pytest
+
+
+def test_latest_and_interpolation():
+    log = TemperatureLog(capacity=8)
+    for t in range(5):
+        log.append(t, 10 + 2 * t)
+
+    assert log.latest() == (4, 18)
+    assert log.at(1.5) == pytest.approx(13)
+    assert log.at(-1) == 10
+    assert log.at(10) == 18
+
+
+def test_ring_buffer_wraps():
+    log = TemperatureLog(capacity=4)
+    for t in range(10):
+        log.append(t, t)
+
+    times, values = log.snapshot()
+    assert len(log) == 4
+    assert np.all(times == [6, 7, 8, 9])
+    assert log.at(7.25) == pytest.approx(7.25)
+    assert log.at(0) == 6
+
+
+def test_empty_log():
+    with pytest.raises(ValueError):
+        TemperatureLog().latest()
+
+
+def test_sampler_keeps_running_after_errors():
+    counter = itertools.count()
+
+    def read():
+        i = next(counter)
+        if i == 0:
+            raise IOError("Timeout")
+        return 20 + i
+
+    with TemperatureSampler(read, interval=0.001) as sampler:
+        sampler.wait_for_reading()
+
+    assert sampler.errors == 1
+    assert sampler.latest() > 20
+
+
+def test_settling_criteria():
+    criteria = SettlingCriteria(tolerance=0.1, max_rate=0.05, window=60)
+    times = np.arange(0, 121, 1.0)
+
+    # Still approaching the setpoint at 0.5 K/min
+    ramp = 10 - 0.5 * (120 - times) / 60
+    assert not criteria.settled(times, ramp, 10, now=120)
+    assert criteria.rate(times, ramp) == pytest.approx(0.5)
+
+    # Stable but off the setpoint
+    assert not criteria.settled(times, np.full(len(times), 10.2), 10, now=120)
+
+    # Drifting slowly inside the tolerance
+    drift = 10 + 0.02 * (times - 120) / 60
+    assert criteria.settled(times, drift, 10, now=120)
+
+    # The readings do not cover the window yet
+    assert not criteria.settled(times[-30:], drift[-30:], 10, now=120)
+
+
+def test_wait_until_settled():
+    temperatures = itertools.chain([5, 8, 9.5], itertools.repeat(10))
+
+    with TemperatureSampler(lambda: next(temperatures), interval=0.001) as sampler:
+        criteria = SettlingCriteria(window=0.05)
+        assert sampler.wait_until_settled(10, criteria, timeout=5) > 0.05
+
+        with pytest.raises(TimeoutError):
+            sampler.wait_until_settled(20, criteria, timeout=0.05)
@@ -0,0 +1,108 @@
+from src.polar_dep import Config
+from src.temperature_sweep import TemperatureSweep
+
+import threading
+
+import pytest
+import yaml
+
+
+class MockController:
+    def __init__(self):
+        self.setpoint: float = None
+
+    def set_temperature(self, setpoint):
+        self.setpoint = setpoint
+
+
+class MockSampler:
+    def __init__(self, controller):
+        self.controller = controller
+        self.waited = []
+
+    def wait_until_settled(self, setpoint, criteria, timeout=None):
+        self.waited.append((setpoint, criteria.tolerance))
+        return 1.0
+
+    def latest(self):
+        return self.controller.setpoint + 0.01
+
+
+class MockSequence:
+    def __init__(self, config, events, fail=False):
+        self.config = config
+        self.events = events
+        self.fail = fail
+        self.temperature: float = None
+        self.finished = threading.Event()
+
+    def measure(self):
+        self.events.append(("measure", self.temperature))
+
+    def finish(self):
+        if self.fail:
+            raise RuntimeError("Disk full")
+        self.events.append(("finish", self.temperature))
+        self.finished.set()
+
+
+@pytest.fixture
+def config(tmp_path):
+    with open("./tests/sequence_example.yaml", "rb") as f:
+        config = yaml.safe_load(f)
+
+    config["output_folder"] = str(tmp_path / "output")
+    config["log_folder"] = str(tmp_path / "log")
+    config["temperature_sweep"] = {"setpoints": [10, 20, 30], "tolerance": 0.2}
+
+    return Config(config)
+
+
+def test_sweep(config, tmp_path):
+    controller = MockController()
+    sampler = MockSampler(controller)
+    events, sequences, processed = [], [], []
+
+    def make_sequence(c):
+        sequences.append(MockSequence(c, events))
+        return sequences[-1]
+
+    sweep = TemperatureSweep(
+        config,
+        controller,
+        sampler,
+        make_sequence,
+        post_process=lambda sequence, setpoint: processed.append(setpoint),
+    )
+    sweep.run()
+
+    assert sampler.waited == [(10, 0.2), (20, 0.2), (30, 0.2)]
+    assert sweep.settle_times == {10: 1.0, 20: 1.0, 30: 1.0}
+    assert processed == [10, 20, 30]
+
+    measured = [t for event, t in events if event == "measure"]
+    assert measured == pytest.approx([10.01, 20.01, 30.01])
+    assert all(sequence.finished.is_set() for sequence in sequences)
+
+    # Every setpoint is saved in its own folder
+    assert sequences[1].config.output_folder == str(tmp_path / "output" / "20K")
+    assert sequences[1].config.log_folder == str(tmp_path / "log" / "20K")
+    assert sequences[1].config.container_path.endswith("20K/run.tif")
+    assert (tmp_path / "log" / "30K").is_dir()
+    # The configuration of the sweep is not modified
+    assert config.output_folder == str(tmp_path / "output")
+
+
+def test_sweep_reraises_save_error(config):
+    controller = MockController()
+    events = []
+
+    def make_sequence(c):
+        return MockSequence(c, events, fail=controller.setpoint == 10)
+
+    sweep = TemperatureSweep(config, controller, MockSampler(controller), make_sequence)
+    with pytest.raises(RuntimeError, match="Disk full"):
+        sweep.run()
+
+    # The error of the first setpoint stops the sweep at the second one
+    assert controller.setpoint == 20
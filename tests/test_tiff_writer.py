@@ -0,0 +1,51 @@
+from src.storage.tiff_writer import TiffWriter
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+
+def test_write_and_flush(tmp_path):
+    image = np.arange(64, dtype="int16").reshape(8, 8)
+
+    with TiffWriter(compression="zlib", fsync=True) as writer:
+        for i in range(5):
+            writer.write(tmp_path / f"{i}.tif", image + i)
+        writer.flush()
+
+        assert writer.metrics.count == 5
+
+    for i in range(5):
+        assert np.all(tiff.imread(tmp_path / f"{i}.tif") == image + i)
+
+
+def test_metrics(tmp_path):
+    with TiffWriter() as writer:
+        writer.write(tmp_path / "image.tif", np.zeros((8, 8), dtype="int16"))
+
+    metrics = writer.metrics.as_dict()
+    assert metrics["count"] == 1
+    assert metrics["bytes"] == 128
+    assert metrics["max_latency"] >= metrics["max_write_time"] > 0
+
+
+def test_write_error_is_raised_on_flush(tmp_path):
+    writer = TiffWriter()
+    writer.write(tmp_path / "missing" / "image.tif", np.zeros((8, 8)))
+
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def test_write_returns_future(tmp_path):
+    writer = TiffWriter()
+    saved = writer.write(tmp_path / "image.tif", np.zeros((8, 8), dtype="int16"))
+    failed = writer.write(tmp_path / "missing" / "image.tif", np.zeros((8, 8)))
+
+    assert saved.result(timeout=5) == str(tmp_path / "image.tif")
+    assert isinstance(failed.exception(timeout=5), OSError)
+    assert (tmp_path / "image.tif").exists()
+    with pytest.raises(RuntimeError):
+        writer.close()